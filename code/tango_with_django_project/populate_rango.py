@@ -4,6 +4,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango_with_django_project.setti
 import django
 django.setup()
 
+from rango.catalog_import import CatalogImporter
 from rango.models import Category, Page
 
 def populate():
@@ -45,12 +46,19 @@ def populate():
 	# for more information about using items() and how to iterate over a dictionary properly
     
     # Using the .items returns the key and the value. In this case the key is "Python", "Django" or "Other Frameworks" and the value (cat_data) is the corresponding dictionary in cats.
-    for cat, cat_data in cats.items():
-        # c = add_cat(cat)
-        # Updated the population script to pass through the specific values for views and likes
-        c = add_cat(cat, cat_data["views"], cat_data["likes"])
-        for p in cat_data["pages"]:
-            add_page(c, p["title"], p["url"], p["views"])
+    # The records are written in batches by the catalog importer (the same
+    # one behind manage.py load_catalog) rather than with a get_or_create()
+    # and save() per row; add_cat() and add_page() are still below for
+    # adding the odd row by hand.
+    def records():
+        for cat, cat_data in cats.items():
+            yield {"type": "category", "category": cat,
+                   "views": cat_data["views"], "likes": cat_data["likes"]}
+            for p in cat_data["pages"]:
+                yield {"type": "page", "category": cat,
+                       "title": p["title"], "url": p["url"], "views": p["views"]}
+
+    CatalogImporter().run(records())
     
     # Print out what we have added to the user.
     for c in Category.objects.all():
@@ -0,0 +1,102 @@
+"""
+Version 1 of the JSON API used by rango-ajax.js, under /rango/api/v1/.
+
+The original AJAX views (rango.views_ajax) answer with rendered HTML
+fragments, or a bare number for likes, so every keystroke in the suggestion
+box costs a template render and ships the markup again. These views return
+only the data, as JSON without whitespace, and the script builds the
+markup:
+
+    GET  categories/suggest/?q=py        {"categories":[{"id":1,"name":"Python",
+                                          "slug":"python","likes":64},...]}
+    GET  categories/<id>/pages/?cursor=  {"pages":[{"id":1,"title":"...","views":32},...],
+                                          "next":"32.1"}
+    POST categories/<id>/pages/          title=...&url=...&title=...&url=...
+                                         {"added":[{"id":2,"title":"...","views":0}],
+                                          "skipped":0}
+    POST categories/<id>/like/           {"likes":65}
+
+The GET answers are the same for every user, so they are marked publicly
+cacheable for RANGO_API_SUGGEST_MAX_AGE and RANGO_API_PAGES_MAX_AGE
+seconds. Errors come back as {"error": "..."} with a 4xx status, including
+403 rather than a login redirect for the POSTs when nobody is logged in.
+Incompatible changes to these payloads belong in a v2.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from rango import like_counter
+from rango.models import Category
+from rango.pagination import category_pages as page_slice
+from rango.query_budget import query_budget
+from rango.suggest_index import category_index
+from rango.views_ajax import MAX_ADD_PAGES, clean_page_pairs, insert_new_pages
+
+DEFAULT_SUGGEST_MAX_AGE = 60
+DEFAULT_PAGES_MAX_AGE = 30
+MAX_SUGGESTIONS = 8
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+def _error(message, status):
+    return _json({'error': message}, status=status)
+
+
+def _cacheable(response, setting, default):
+    patch_cache_control(response, public=True, max_age=getattr(settings, setting, default))
+    return response
+
+
+def _page(page):
+    return {'id': page.id, 'title': page.title, 'views': page.views}
+
+
+@query_budget(2)
+@require_GET
+def suggest_categories(request):
+    prefix = request.GET.get('q', '')
+    categories = category_index.top(prefix, MAX_SUGGESTIONS) if prefix else []
+    response = _json({'categories': [
+        {'id': c.id, 'name': c.name, 'slug': c.slug, 'likes': c.likes} for c in categories]})
+    return _cacheable(response, 'RANGO_API_SUGGEST_MAX_AGE', DEFAULT_SUGGEST_MAX_AGE)
+
+
+@query_budget(12)
+@require_http_methods(['GET', 'POST'])
+def category_pages(request, category_id):
+    try:
+        category = Category.objects.get(id=int(category_id))
+    except Category.DoesNotExist:
+        return _error('No such category.', 404)
+
+    if request.method == 'GET':
+        pages, next_cursor = page_slice(category, request.GET.get('cursor'))
+        response = _json({'pages': [_page(page) for page in pages], 'next': next_cursor})
+        return _cacheable(response, 'RANGO_API_PAGES_MAX_AGE', DEFAULT_PAGES_MAX_AGE)
+
+    if not request.user.is_authenticated():
+        return _error('Log in to add pages.', 403)
+    titles = request.POST.getlist('title')
+    urls = request.POST.getlist('url')
+    if len(titles) != len(urls) or len(titles) > MAX_ADD_PAGES:
+        return _error('Expected up to {0} title and url pairs.'.format(MAX_ADD_PAGES), 400)
+    pages = insert_new_pages(category, clean_page_pairs(titles, urls))
+    return _json({'added': [_page(page) for page in pages],
+                  'skipped': len(titles) - len(pages)})
+
+
+@query_budget(6)
+@require_POST
+def like_category(request, category_id):
+    if not request.user.is_authenticated():
+        return _error('Log in to like categories.', 403)
+    try:
+        likes = like_counter.like_category(int(category_id))
+    except Category.DoesNotExist:
+        return _error('No such category.', 404)
+    return _json({'likes': likes})
@@ -1,7 +1,14 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        from rango import search_transport, signals
+        # Read the search API keys once, rather than on every query.
+        search_transport.load_keys()
+        post_migrate.connect(signals.create_search_index, sender=self)
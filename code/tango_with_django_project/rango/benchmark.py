@@ -0,0 +1,314 @@
+"""
+Load benchmark of rango's URLs (see manage.py benchmark).
+
+The command seeds a throwaway database with a generated catalog, serves the
+project from a threaded WSGI server on a local port and drives each
+endpoint in ENDPOINTS with several concurrent keep-alive HTTP clients. For
+every endpoint it reports throughput and p50/p95/p99 latency, and the
+result can be written as JSON and compared with an earlier run's to flag
+regressions.
+"""
+import http.client
+import math
+import random
+import socketserver
+import threading
+import time
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+# (endpoint name, function(dataset, client number, request number) returning
+# the path to GET, or (method, path, form data), whether the endpoint needs
+# a logged-in user). The others are requested anonymously, as most readers
+# would.
+ENDPOINTS = [
+    ('index', lambda d, c, n: '/rango/', False),
+    ('about', lambda d, c, n: '/rango/about/', False),
+    ('show_category', lambda d, c, n: '/rango/category/{0}/'.format(d.random_slug()), False),
+    ('more_pages', lambda d, c, n: '/rango/more/?category_id={0}&cursor={1}'.format(
+        d.random_category_id(), d.cursor), False),
+    ('goto', lambda d, c, n: '/rango/goto/?page_id={0}'.format(d.random_page_id()), False),
+    ('like_category', lambda d, c, n: '/rango/like/?category_id={0}'.format(
+        d.random_category_id()), True),
+    ('suggest_category', lambda d, c, n: '/rango/suggest/?suggestion={0}'.format(
+        d.random_prefix()), False),
+    # search only runs a query when the form is POSTed.
+    ('search', lambda d, c, n: ('POST', '/rango/search/', {'query': d.random_word()}), False),
+    ('auto_add_page', lambda d, c, n: '/rango/add/?category_id={0}&title=Bench+{1}+{2}'
+                                      '&url=http%3A%2F%2Fexample.com%2F{1}%2F{2}'.format(
+                                          d.random_category_id(), c, n), True),
+    ('list_profiles', lambda d, c, n: '/rango/profiles/', True),
+    ('profile', lambda d, c, n: '/rango/profile/{0}/'.format(d.random_username()), True),
+]
+
+# The AJAX operations both as the original HTML fragment (or bare number)
+# and as the JSON API, for manage.py benchmark_api: (name, function(dataset,
+# request number) returning (method, path, data), whether it needs a
+# logged-in user). Pages added on either side get different titles, so
+# neither finds the other's pages already there.
+FORMAT_PAIRS = [
+    ('suggest.fragment', lambda d, n: ('GET', '/rango/suggest/',
+                                       {'suggestion': d.random_prefix()}), False),
+    ('suggest.json', lambda d, n: ('GET', '/rango/api/v1/categories/suggest/',
+                                   {'q': d.random_prefix()}), False),
+    ('more_pages.fragment', lambda d, n: ('GET', '/rango/more/', {
+        'category_id': d.random_category_id(), 'cursor': d.cursor}), False),
+    ('more_pages.json', lambda d, n: ('GET', '/rango/api/v1/categories/{0}/pages/'.format(
+        d.random_category_id()), {'cursor': d.cursor}), False),
+    ('like.fragment', lambda d, n: ('GET', '/rango/like/',
+                                    {'category_id': d.random_category_id()}), True),
+    ('like.json', lambda d, n: ('POST', '/rango/api/v1/categories/{0}/like/'.format(
+        d.random_category_id()), {}), True),
+    ('add_page.fragment', lambda d, n: ('GET', '/rango/add/', {
+        'category_id': d.random_category_id(), 'title': 'Fragment {0}'.format(n),
+        'url': 'http://example.com/fragment/{0}/'.format(n)}), True),
+    ('add_page.json', lambda d, n: ('POST', '/rango/api/v1/categories/{0}/pages/'.format(
+        d.random_category_id()), {'title': 'JSON {0}'.format(n),
+                                  'url': 'http://example.com/json/{0}/'.format(n)}), True),
+]
+
+WORDS = ('python', 'django', 'tango', 'rango', 'search', 'template', 'model', 'view',
+         'cache', 'query', 'index', 'page', 'form', 'admin', 'static', 'media')
+
+
+def generate_records(categories, pages_per_category, seed=0):
+    """
+    Yields load_catalog records for a made-up catalog.
+    """
+    rng = random.Random(seed)
+    for i in range(categories):
+        name = '{0} {1} {2:05d}'.format(rng.choice(WORDS).title(), rng.choice(WORDS), i)
+        yield {'type': 'category', 'category': name,
+               'views': rng.randint(0, 10000), 'likes': rng.randint(0, 1000)}
+        for j in range(pages_per_category):
+            yield {'type': 'page', 'category': name,
+                   'title': '{0} {1} {2}'.format(rng.choice(WORDS).title(), rng.choice(WORDS), j),
+                   'url': 'http://example.com/{0}/{1}/'.format(i, j),
+                   'views': rng.randint(0, 10000)}
+
+
+class Dataset(object):
+    """
+    What the endpoints need to know about the seeded data.
+    """
+
+    def __init__(self, category_ids, slugs, page_ids, usernames, seed=0):
+        self.category_ids = category_ids
+        self.slugs = slugs
+        self.page_ids = page_ids
+        self.usernames = usernames
+        # Any position past the first slice will do for "load more".
+        self.cursor = '5000.1000000000'
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _choice(self, items):
+        with self._lock:
+            return self._rng.choice(items)
+
+    def random_category_id(self):
+        return self._choice(self.category_ids)
+
+    def random_slug(self):
+        return self._choice(self.slugs)
+
+    def random_page_id(self):
+        return self._choice(self.page_ids)
+
+    def random_username(self):
+        return self._choice(self.usernames)
+
+    def random_word(self):
+        return self._choice(WORDS)
+
+    def random_prefix(self):
+        word = self._choice(WORDS)
+        return word[:self._choice((1, 2, 3))]
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_server(application, host='127.0.0.1', port=0):
+    """
+    Serves application on a background thread; returns the server.
+    """
+    server = make_server(host, port, application, server_class=ThreadedWSGIServer,
+                         handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, name='rango-benchmark-server')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(math.ceil(fraction * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed, sizes=()):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'mean_bytes': round(sum(sizes) / len(sizes), 1) if sizes else 0.0,
+        'errors': errors,
+        'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(1000 * sum(latencies) / count, 3) if count else 0.0,
+        'p50_ms': round(1000 * percentile(latencies, 0.50), 3),
+        'p95_ms': round(1000 * percentile(latencies, 0.95), 3),
+        'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+        'max_ms': round(1000 * latencies[-1], 3) if count else 0.0,
+    }
+
+
+def build_request(request, headers=None, csrf_token=None):
+    """
+    Turns what an ENDPOINTS function returned into (method, path, body,
+    headers). A POST's form carries csrf_token, which the client must also
+    send as the CSRF cookie for Django to accept it.
+    """
+    headers = dict(headers or {})
+    if isinstance(request, str):
+        return 'GET', request, None, headers
+    method, path, data = request
+    data = dict(data)
+    if csrf_token:
+        data['csrfmiddlewaretoken'] = csrf_token
+    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    return method, path, urlencode(data), headers
+
+
+def run_endpoint(address, make_path, dataset, requests, concurrency, headers=None, warmup=0,
+                 csrf_token=None):
+    """
+    Sends requests requests spread over concurrency clients, each on its own
+    keep-alive connection, and returns summarize()'s figures. Responses
+    with a status of 400 or more, and connection failures, count as errors.
+    """
+    host, port = address
+    latencies = []
+    sizes = []
+    errors = [0]
+    lock = threading.Lock()
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def client(number, count):
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        mine = []
+        my_sizes = []
+        failed = 0
+        try:
+            for n in range(-warmup, count):
+                method, path, body, request_headers = build_request(
+                    make_path(dataset, number, n), headers, csrf_token)
+                start = time.perf_counter()
+                try:
+                    conn.request(method, path, body=body, headers=request_headers)
+                    response = conn.getresponse()
+                    size = len(response.read())
+                    ok = response.status < 400
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    ok = False
+                elapsed = time.perf_counter() - start
+                if n < 0:
+                    continue
+                if ok:
+                    mine.append(elapsed)
+                    my_sizes.append(size)
+                else:
+                    failed += 1
+        finally:
+            conn.close()
+        with lock:
+            latencies.extend(mine)
+            sizes.extend(my_sizes)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i, count))
+               for i, count in enumerate(per_client) if count]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start, sizes)
+
+
+def run_in_process(client, make_request, dataset, requests, warmup=0, **extra):
+    """
+    Sends requests through a django.test.Client, one at a time, and returns
+    summarize()'s figures. With no network or server in the way, the
+    latencies are the time spent in Django itself.
+    """
+    latencies = []
+    sizes = []
+    errors = 0
+    start = time.perf_counter()
+    for n in range(-warmup, requests):
+        method, path, data = make_request(dataset, n)
+        send = client.post if method == 'POST' else client.get
+        started = time.perf_counter()
+        response = send(path, data, **extra)
+        elapsed = time.perf_counter() - started
+        if n < 0:
+            continue
+        if response.status_code < 400:
+            latencies.append(elapsed)
+            sizes.append(len(response.content))
+        else:
+            errors += 1
+    return summarize(latencies, errors, time.perf_counter() - start, sizes)
+
+
+def compare_formats(endpoints):
+    """
+    Returns a line per operation giving the JSON API's mean response size
+    and time as a fraction of the fragment's, from benchmark_api's results.
+    """
+    lines = []
+    for name in sorted(name[:-len('.fragment')] for name in endpoints
+                       if name.endswith('.fragment')):
+        fragment = endpoints[name + '.fragment']
+        api = endpoints.get(name + '.json')
+        if not api or not fragment['mean_bytes'] or not fragment['mean_ms']:
+            continue
+        lines.append('{0}: JSON is {1:.0%} of the bytes and {2:.0%} of the time'.format(
+            name, api['mean_bytes'] / fragment['mean_bytes'],
+            api['mean_ms'] / fragment['mean_ms']))
+    return lines
+
+
+def compare(result, baseline, threshold=0.2):
+    """
+    Returns a line for each endpoint whose p95 latency grew, or whose
+    throughput fell, by more than threshold (a fraction) since baseline.
+    """
+    regressions = []
+    for name, now in sorted(result['endpoints'].items()):
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append('{0}: p95 {1:.1f} ms -> {2:.1f} ms'.format(
+                name, before['p95_ms'], now['p95_ms']))
+        if before['throughput_rps'] and \
+                now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append('{0}: throughput {1:.1f} -> {2:.1f} req/s'.format(
+                name, before['throughput_rps'], now['throughput_rps']))
+    return regressions
@@ -0,0 +1,208 @@
+"""
+Streaming bulk import of categories and pages.
+
+Records are dictionaries with a 'type' of 'category' or 'page':
+
+    {"type": "category", "category": "Python", "views": 128, "likes": 64}
+    {"type": "page", "category": "Python", "title": "Official Python Tutorial",
+     "url": "http://docs.python.org/2/tutorial/", "views": 32}
+
+read_records() yields them one at a time from an NDJSON or CSV file (CSV
+columns: type, category, title, url, views, likes), optionally gzipped, and
+CatalogImporter writes them in batches: a couple of SELECTs to find which
+rows exist, one bulk_create for the new ones and one CASE UPDATE per field
+for the rest, all inside one transaction per batch. Categories are matched
+by name and pages by (category, title), as populate_rango always did.
+
+Only the category name -> id map is kept between batches, so memory use
+doesn't grow with the number of pages.
+"""
+import csv
+import gzip
+import io
+import json
+import time
+
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.template.defaultfilters import slugify
+
+DEFAULT_BATCH_SIZE = 500
+# Rows per CASE UPDATE, to stay inside SQLite's limit on query parameters.
+UPDATE_CHUNK = 200
+
+FIELDS = ('type', 'category', 'title', 'url', 'views', 'likes')
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'ndjson'
+
+
+def read_records(f, fmt='ndjson'):
+    """
+    Yields one record dictionary per line of an NDJSON or CSV file object.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield row
+    else:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def _int(value):
+    return int(value) if value not in (None, '') else 0
+
+
+def _case_update(model, rows, field):
+    """
+    Sets field to a different value for each row id in one UPDATE.
+    rows is a list of (id, value).
+    """
+    output_field = model._meta.get_field(field).__class__()
+    for start in range(0, len(rows), UPDATE_CHUNK):
+        chunk = rows[start:start + UPDATE_CHUNK]
+        whens = [When(id=row_id, then=Value(value)) for row_id, value in chunk]
+        model.objects.filter(id__in=[row_id for row_id, value in chunk]).update(
+            **{field: Case(*whens, output_field=output_field)})
+
+
+class CatalogImporter(object):
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, progress=None, rebuild_search_index=True):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.rebuild_search_index = rebuild_search_index
+        self.category_ids = {}
+        self.rows = 0
+        self.skipped = 0
+        self.categories_created = 0
+        self.pages_created = 0
+        self.started = None
+
+    def rate(self):
+        elapsed = time.time() - self.started if self.started else 0
+        return self.rows / elapsed if elapsed else 0.0
+
+    def run(self, records):
+        """
+        Imports every record from the iterable and returns self.
+        """
+        self.started = time.time()
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        self.finish()
+        return self
+
+    def import_batch(self, batch):
+        categories = {}
+        pages = {}
+        for record in batch:
+            kind = record.get('type') or ('page' if record.get('title') else 'category')
+            name = (record.get('category') or '').strip()
+            if not name or kind not in ('category', 'page'):
+                self.skipped += 1
+                continue
+            if kind == 'category':
+                categories[name] = record
+            elif record.get('title') and record.get('url'):
+                pages[(name, record['title'])] = record
+            else:
+                self.skipped += 1
+
+        with transaction.atomic():
+            self._import_categories(categories, set(name for name, title in pages))
+            self._import_pages(pages)
+
+        self.rows += len(batch)
+        if self.progress:
+            self.progress(self)
+
+    def _import_categories(self, records, referenced):
+        from rango.models import Category
+
+        wanted = (set(records) | referenced) - set(self.category_ids)
+        if wanted:
+            self.category_ids.update(
+                Category.objects.filter(name__in=wanted).values_list('name', 'id'))
+
+        new = [name for name in (set(records) | referenced) if name not in self.category_ids]
+        if new:
+            # bulk_create() doesn't call Category.save(), so set the slug
+            # here the same way save() would.
+            Category.objects.bulk_create([
+                Category(name=name, slug=slugify(name),
+                         views=_int(records.get(name, {}).get('views')),
+                         likes=_int(records.get(name, {}).get('likes')))
+                for name in new])
+            self.category_ids.update(
+                Category.objects.filter(name__in=new).values_list('name', 'id'))
+            self.categories_created += len(new)
+
+        existing = [name for name in records if name not in new]
+        for field in ('views', 'likes'):
+            values = [(self.category_ids[name], _int(records[name].get(field)))
+                      for name in existing]
+            if values:
+                _case_update(Category, values, field)
+
+    def _import_pages(self, records):
+        from rango.models import Page
+
+        if not records:
+            return
+        keys = dict(((self.category_ids[name], title), record)
+                    for (name, title), record in records.items())
+        existing = {}
+        candidates = Page.objects.filter(
+            category_id__in=set(category_id for category_id, title in keys),
+            title__in=set(title for category_id, title in keys))
+        for page_id, category_id, title in candidates.values_list('id', 'category_id', 'title'):
+            if (category_id, title) in keys:
+                existing[(category_id, title)] = page_id
+
+        new = [Page(category_id=category_id, title=title, url=record['url'],
+                    views=_int(record.get('views')))
+               for (category_id, title), record in keys.items()
+               if (category_id, title) not in existing]
+        if new:
+            Page.objects.bulk_create(new)
+            self.pages_created += len(new)
+
+        if existing:
+            _case_update(Page, [(page_id, keys[key]['url']) for key, page_id in existing.items()],
+                         'url')
+            _case_update(Page, [(page_id, _int(keys[key].get('views')))
+                                for key, page_id in existing.items()], 'views')
+
+    def finish(self):
+        """
+        bulk_create() and update() don't send signals, so refresh everything
+        the signal receivers would have kept up to date.
+        """
+        from rango import fts_search, page_cache, sidebar_cache
+        from rango.leaderboard import category_leaderboard, page_leaderboard
+        from rango.suggest_index import category_index
+
+        if self.rebuild_search_index:
+            fts_search.rebuild_index()
+        category_index.reset()
+        sidebar_cache.bump_version()
+        page_cache.bump_version()
+        category_leaderboard.invalidate()
+        page_leaderboard.invalidate()
@@ -0,0 +1,310 @@
+"""
+Append-only log of page clicks, rolled up into hourly and daily buckets.
+
+Page.views only knows the lifetime total, so it can't say how many views a
+page had yesterday or in the last hour. Whenever the view counter flushes
+its buffer, the same counts are also appended to the current segment file
+in RANGO_CLICK_LOG_DIR, one line per page:
+
+    <unix time of the flush> <page id> <clicks>
+
+Appending to a file is much cheaper than updating rows, and the flush
+interval is a few seconds, so the time is accurate enough for hourly
+buckets.
+
+Each process writes its own segment, named clicks-<start>-<pid>-<n>.open,
+and seals it (renames it to .log) once it is RANGO_CLICK_LOG_SEGMENT_SECONDS
+old, whether or not more clicks arrive, or RANGO_CLICK_LOG_SEGMENT_BYTES
+long, and at shutdown. compact() (run
+by manage.py compact_clicks) adds every sealed segment to the PageViewBucket
+rows of its hours and days, records the segment's name in the same
+transaction so it is never counted twice, and deletes the file. Hourly
+buckets are kept for RANGO_CLICK_HOURLY_RETENTION_DAYS, daily ones for
+RANGO_CLICK_DAILY_RETENTION_DAYS (forever if None).
+
+page_views_between() answers "views of this page from start to end" from
+the buckets. The lifetime Page.views is still kept by the view counter's
+own UPDATEs, so it doesn't wait for compaction.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+PREFIX = 'clicks-'
+DEFAULT_SEGMENT_SECONDS = 300
+DEFAULT_SEGMENT_BYTES = 1 << 20
+DEFAULT_HOURLY_RETENTION_DAYS = 14
+# Buckets per query, to stay inside SQLite's limit on query parameters.
+CHUNK = 200
+
+
+def directory():
+    return getattr(settings, 'RANGO_CLICK_LOG_DIR', None)
+
+
+def segment_seconds():
+    return getattr(settings, 'RANGO_CLICK_LOG_SEGMENT_SECONDS', DEFAULT_SEGMENT_SECONDS)
+
+
+def segment_start(name):
+    return int(name[len(PREFIX):].split('-', 1)[0])
+
+
+class ClickLog(object):
+    """
+    This process's open segment.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._timer = None
+        self._started = None
+        self._size = 0
+        self._sequence = 0
+
+    def segment_bytes(self):
+        return getattr(settings, 'RANGO_CLICK_LOG_SEGMENT_BYTES', DEFAULT_SEGMENT_BYTES)
+
+    def append(self, counts, when=None):
+        """
+        Appends {page_id: clicks} as seen at time when (default now).
+        Does nothing if RANGO_CLICK_LOG_DIR is not set.
+        """
+        path = directory()
+        if not path or not counts:
+            return
+        when = int(time.time() if when is None else when)
+        data = ''.join('{0} {1} {2}\n'.format(when, page_id, amount)
+                       for page_id, amount in sorted(counts.items()) if amount).encode('ascii')
+        with self._lock:
+            if self._file is not None and (
+                    os.path.dirname(self._path) != path or self._size >= self.segment_bytes()
+                    or time.time() - self._started >= segment_seconds()):
+                self._seal()
+            if self._file is None:
+                self._open(path)
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+    def close(self):
+        """
+        Seals the open segment, if any, so compaction can pick it up.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._seal()
+
+    def _open(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._sequence += 1
+        self._started = time.time()
+        name = '{0}{1}-{2}-{3}.open'.format(PREFIX, int(self._started), os.getpid(),
+                                            self._sequence)
+        self._path = os.path.join(path, name)
+        self._file = open(self._path, 'ab')
+        self._size = 0
+        # Seal it on time even if this process goes quiet, so compaction
+        # never has to take the segment of a live process for a dead one's.
+        self._timer = threading.Timer(segment_seconds(), self._seal_expired, args=(self._path,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _seal_expired(self, path):
+        with self._lock:
+            if self._path == path:
+                self._seal()
+
+    def _seal(self):
+        try:
+            self._timer.cancel()
+            self._file.close()
+            os.rename(self._path, self._path[:-len('.open')] + '.log')
+        except FileNotFoundError:
+            # Sealed by compact() already, which took this process for dead.
+            pass
+        finally:
+            self._file = self._path = self._timer = None
+
+
+click_log = ClickLog()
+atexit.register(click_log.close)
+
+
+def sealed_segments(path, now=None):
+    """
+    Names of the segments in path that are ready to compact, oldest first.
+    """
+    now = time.time() if now is None else now
+    names = []
+    for name in sorted(os.listdir(path)):
+        if not name.startswith(PREFIX):
+            continue
+        if name.endswith('.open') and segment_start(name) < now - 2 * segment_seconds():
+            # Left open by a process that died. Writers seal a segment
+            # before it gets this old, so nothing more will be added to it.
+            sealed = name[:-len('.open')] + '.log'
+            os.rename(os.path.join(path, name), os.path.join(path, sealed))
+            name = sealed
+        if name.endswith('.log'):
+            names.append(name)
+    return names
+
+
+def read_segment(filename):
+    """
+    Returns ({(page_id, hour): clicks}, total clicks) for a segment file.
+    """
+    hours = defaultdict(int)
+    total = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            try:
+                when, page_id, amount = [int(field) for field in line.split()]
+            except ValueError:
+                # A line cut short by a crash.
+                logger.warning("Skipping bad line in %s: %r", filename, line)
+                continue
+            hours[(page_id, when - when % HOUR)] += amount
+            total += amount
+    return hours, total
+
+
+def _datetime(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def _seconds(value):
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return int(value.timestamp())
+
+
+def _add_to_buckets(resolution, counts):
+    """
+    Adds {(page_id, start seconds): clicks} to the buckets of the given
+    resolution, creating the missing ones.
+    """
+    keys = sorted(counts)
+    for i in range(0, len(keys), CHUNK):
+        _add_chunk(resolution, dict((key, counts[key]) for key in keys[i:i + CHUNK]))
+
+
+def _add_chunk(resolution, counts):
+    from rango.models import Page, PageViewBucket
+
+    pages = set(Page.objects.filter(id__in=set(page_id for page_id, start in counts))
+                .values_list('id', flat=True))
+    counts = dict(((page_id, _datetime(start)), amount)
+                  for (page_id, start), amount in counts.items() if page_id in pages)
+    if not counts:
+        return
+
+    existing = PageViewBucket.objects.filter(
+        resolution=resolution, page_id__in=set(page_id for page_id, start in counts),
+        start__in=set(start for page_id, start in counts))
+    by_amount = defaultdict(list)
+    for bucket_id, page_id, start in existing.values_list('id', 'page_id', 'start'):
+        amount = counts.pop((page_id, start), None)
+        if amount is not None:
+            by_amount[amount].append(bucket_id)
+    for amount, bucket_ids in by_amount.items():
+        PageViewBucket.objects.filter(id__in=bucket_ids).update(views=F('views') + amount)
+
+    PageViewBucket.objects.bulk_create([
+        PageViewBucket(page_id=page_id, resolution=resolution, start=start, views=amount)
+        for (page_id, start), amount in counts.items()])
+
+
+def compact(now=None):
+    """
+    Rolls every sealed segment into the buckets, deletes the segments and
+    prunes buckets past their retention. Returns (segments, clicks) rolled up.
+    """
+    from rango.models import ClickLogSegment, PageViewBucket
+
+    path = directory()
+    segments = clicks = 0
+    if path and os.path.isdir(path):
+        for name in sealed_segments(path, now):
+            filename = os.path.join(path, name)
+            hours, total = read_segment(filename)
+            days = defaultdict(int)
+            for (page_id, start), amount in hours.items():
+                days[(page_id, start - start % DAY)] += amount
+            with transaction.atomic():
+                segment, created = ClickLogSegment.objects.get_or_create(
+                    name=name, defaults={'clicks': total})
+                # Not created: rolled up already by a run that stopped before
+                # deleting the file.
+                if created:
+                    _add_to_buckets(PageViewBucket.HOUR, hours)
+                    _add_to_buckets(PageViewBucket.DAY, days)
+                    segments += 1
+                    clicks += total
+            os.remove(filename)
+    prune(now)
+    return segments, clicks
+
+
+def prune(now=None):
+    from rango.models import ClickLogSegment, PageViewBucket
+
+    now = _datetime(time.time() if now is None else now)
+    hourly_days = getattr(settings, 'RANGO_CLICK_HOURLY_RETENTION_DAYS',
+                          DEFAULT_HOURLY_RETENTION_DAYS)
+    daily_days = getattr(settings, 'RANGO_CLICK_DAILY_RETENTION_DAYS', None)
+    cutoff = now - timedelta(days=hourly_days)
+    PageViewBucket.objects.filter(resolution=PageViewBucket.HOUR, start__lt=cutoff).delete()
+    # A segment is compacted within minutes of being sealed, so its name
+    # is only needed for as long as a crashed run might leave its file behind.
+    ClickLogSegment.objects.filter(compacted__lt=cutoff).delete()
+    if daily_days is not None:
+        PageViewBucket.objects.filter(resolution=PageViewBucket.DAY,
+                                      start__lt=now - timedelta(days=daily_days)).delete()
+
+
+def page_views_between(page_id, start, end):
+    """
+    Views of the page from start up to end (datetimes), rounded out to
+    whole hours. Whole days in the range are read from the daily buckets
+    and the hours either side of them from the hourly ones, in one query.
+    Clicks that haven't been compacted yet are not counted.
+    """
+    from rango.models import PageViewBucket
+
+    start = _seconds(start)
+    start -= start % HOUR
+    end = _seconds(end)
+    end += -end % HOUR
+    first_day = start + -start % DAY
+    last_day = end - end % DAY
+
+    if first_day < last_day:
+        hourly = Q(start__gte=_datetime(start), start__lt=_datetime(first_day)) | \
+            Q(start__gte=_datetime(last_day), start__lt=_datetime(end))
+        buckets = (Q(resolution=PageViewBucket.HOUR) & hourly) | \
+            Q(resolution=PageViewBucket.DAY, start__gte=_datetime(first_day),
+              start__lt=_datetime(last_day))
+    else:
+        buckets = Q(resolution=PageViewBucket.HOUR, start__gte=_datetime(start),
+                    start__lt=_datetime(end))
+    total = PageViewBucket.objects.filter(buckets, page_id=page_id).aggregate(
+        views=Sum('views'))['views']
+    return total or 0
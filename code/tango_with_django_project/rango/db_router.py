@@ -0,0 +1,177 @@
+"""
+Primary/replica database routing.
+
+Writes always go to the 'default' (primary) database. Reads of rango's own
+models go to one of the aliases in RANGO_DATABASE_REPLICAS, picked at
+random among the healthy ones, so the read-heavy pages don't compete with
+the writes from likes and clicks. Other apps (sessions, auth) keep reading
+from the primary.
+
+Replicas lag behind the primary, so reads are pinned to the primary:
+
+- for the rest of the request (or thread) as soon as it writes, and while
+  it is inside a transaction on the primary;
+- for RANGO_REPLICA_PIN_SECONDS after that, through a cookie set by
+  ReplicaPinningMiddleware, so a user who has just added a page or liked a
+  category sees it on the next page they load;
+- inside primary_reads(), which the shared caches use while refilling an
+  entry. A write retires their entries for every client, and the next
+  reader, whoever it is, must not refill one from a replica that hasn't
+  seen the write yet: the stale copy would be cached under the new version.
+
+A replica is checked (with a cheap query) at most once every
+RANGO_REPLICA_HEALTH_INTERVAL seconds; one that fails is skipped until its
+next check, and with no healthy replica every read goes to the primary.
+The check runs in whichever request happens to need it, so it isn't charged
+to that view's query budget.
+
+For local testing, replicas can be plain SQLite files kept up to date with
+manage.py sync_replicas.
+"""
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from rango.query_budget import not_charged
+
+PIN_COOKIE = 'rango_pin'
+DEFAULT_PIN_SECONDS = 5
+DEFAULT_HEALTH_INTERVAL = 10
+REPLICATED_APPS = ('rango',)
+
+_state = threading.local()
+_health_lock = threading.Lock()
+_health = {}
+
+
+def replicas():
+    return getattr(settings, 'RANGO_DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'RANGO_REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def pin():
+    """
+    Sends this thread's reads to the primary until unpin().
+    """
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = False
+    _state.wrote = False
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends this thread's reads to the primary for the duration of the block.
+    """
+    pinned = getattr(_state, 'pinned', False)
+    _state.pinned = True
+    try:
+        yield
+    finally:
+        _state.pinned = pinned
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or getattr(_state, 'wrote', False)
+
+
+def _check(alias):
+    from rango.models import Category
+
+    settings_dict = connections[alias].settings_dict
+    name = settings_dict['NAME']
+    if settings_dict['ENGINE'].endswith('sqlite3') and name != ':memory:' and \
+            not name.startswith('file:') and not os.path.exists(name):
+        # Connecting would just create an empty file.
+        return False
+    try:
+        Category.objects.using(alias).exists()
+        return True
+    except Exception:
+        connections[alias].close()
+        return False
+
+
+def is_healthy(alias):
+    interval = getattr(settings, 'RANGO_REPLICA_HEALTH_INTERVAL', DEFAULT_HEALTH_INTERVAL)
+    now = time.time()
+    with _health_lock:
+        known = _health.get(alias)
+    if known is not None and now - known[1] < interval:
+        return known[0]
+    with not_charged():
+        healthy = _check(alias)
+    with _health_lock:
+        _health[alias] = (healthy, now)
+    return healthy
+
+
+def mark_unhealthy(alias):
+    with _health_lock:
+        _health[alias] = (False, time.time())
+
+
+def reset_health():
+    with _health_lock:
+        _health.clear()
+
+
+class PrimaryReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICATED_APPS or is_pinned():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replicas() if is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICATED_APPS:
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data, so objects read from any of
+        # them can be related.
+        aliases = set([DEFAULT_DB_ALIAS] + list(replicas()))
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, schema included.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware(object):
+
+    def process_request(self, request):
+        unpin()
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        if pinned_until > time.time():
+            pin()
+
+    def process_response(self, request, response):
+        if getattr(_state, 'wrote', False) and replicas():
+            seconds = pin_seconds()
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds,
+                                httponly=True)
+        unpin()
+        return response
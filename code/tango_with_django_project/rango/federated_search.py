@@ -0,0 +1,140 @@
+"""
+Federated search over every configured search backend.
+
+run_query() sends the query to each module listed in RANGO_SEARCH_BACKENDS
+at the same time, on a shared thread pool, and waits at most
+RANGO_SEARCH_DEADLINE seconds. Whatever has come back by then is merged
+(round-robin by rank, first occurrence of a URL wins) and returned; a slow or
+failing backend only loses its own results.
+
+Each backend module just has to provide run_query(search_terms, size) that
+returns a list of {'title', 'link', 'summary'} dictionaries.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from importlib import import_module
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKENDS = ['rango.webhose_search', 'rango.bing_search']
+DEFAULT_DEADLINE = 2.0
+DEFAULT_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RANGO_SEARCH_WORKERS', DEFAULT_WORKERS))
+        return _executor
+
+
+def get_backends():
+    """
+    Returns (name, run_query) for each configured backend, in order.
+    """
+    backends = []
+    for path in getattr(settings, 'RANGO_SEARCH_BACKENDS', DEFAULT_BACKENDS):
+        module = import_module(path)
+        backends.append((path.rsplit('.', 1)[-1], module.run_query))
+    return backends
+
+
+def _record(name, **counts):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {'calls': 0, 'errors': 0, 'timeouts': 0,
+                                         'latency_total': 0.0, 'latency_max': 0.0})
+        for key, value in counts.items():
+            if key == 'latency':
+                stats['latency_total'] += value
+                stats['latency_max'] = max(stats['latency_max'], value)
+            else:
+                stats[key] += value
+
+
+def backend_stats():
+    """
+    Returns a copy of the per-backend counters: calls, errors, timeouts and
+    the total and maximum latency in seconds.
+    """
+    with _stats_lock:
+        return dict((name, dict(stats)) for name, stats in _stats.items())
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _call_backend(name, backend_query, search_terms, size):
+    start = time.time()
+    try:
+        return backend_query(search_terms, size)
+    except Exception:
+        _record(name, errors=1)
+        logger.exception("Search backend %s failed", name)
+        return []
+    finally:
+        _record(name, calls=1, latency=time.time() - start)
+
+
+def _url_key(link):
+    return link.strip().rstrip('/').lower()
+
+
+def merge_results(result_lists, size):
+    """
+    Interleaves the ranked result lists, dropping repeated URLs.
+    """
+    merged = []
+    seen = set()
+    for rank in range(max([len(results) for results in result_lists] or [0])):
+        for results in result_lists:
+            if rank >= len(results):
+                continue
+            result = results[rank]
+            key = _url_key(result['link'])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(result)
+            if len(merged) >= size:
+                return merged
+    return merged
+
+
+def run_query(search_terms, size=10):
+    """
+    Queries every backend concurrently and returns the merged results that
+    arrived before the deadline.
+    """
+    deadline = getattr(settings, 'RANGO_SEARCH_DEADLINE', DEFAULT_DEADLINE)
+    executor = get_executor()
+    futures = []
+    for name, backend_query in get_backends():
+        futures.append((name, executor.submit(_call_backend, name, backend_query,
+                                              search_terms, size)))
+
+    wait([future for name, future in futures], timeout=deadline)
+
+    result_lists = []
+    for name, future in futures:
+        if future.done():
+            result_lists.append(future.result())
+        else:
+            # The call keeps running in the pool (and will still fill the
+            # search cache), we just don't wait for it.
+            _record(name, timeouts=1)
+            logger.warning("Search backend %s missed the %ss deadline", name, deadline)
+    return merge_results(result_lists, size)
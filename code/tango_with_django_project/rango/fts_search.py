@@ -0,0 +1,172 @@
+"""
+Local full-text search over our own Pages and Categories.
+
+The index is an SQLite FTS5 table, rango_search_index, with a title and a
+url column. Pages and categories share it by rowid: a page is stored at
+rowid 2 * page.id and a category at 2 * category.id + 1, so keeping a row in
+sync is a keyed delete/insert rather than a scan. The table is created after
+migrate, kept up to date by the post_save/post_delete receivers in
+rango.signals and can be rebuilt with `manage.py rebuild_search_index`.
+
+run_query() has the same signature as the web search backends, so it can be
+listed in RANGO_SEARCH_BACKENDS. Hits are ranked by BM25 (title matches
+weighted over url matches) and boosted by how often they have been viewed.
+
+On databases other than SQLite everything here is a no-op.
+"""
+import re
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+
+INDEX_TABLE = 'rango_search_index'
+
+# Title hits count this many times more than URL hits.
+TITLE_WEIGHT = 10.0
+# A hit with this many views gets half of the maximum (2x) boost.
+VIEWS_HALF_BOOST = 10.0
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def page_rowid(page_id):
+    return 2 * page_id
+
+
+def category_rowid(category_id):
+    return 2 * category_id + 1
+
+
+def create_index():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS {0} USING fts5("
+            "title, url, tokenize='unicode61')".format(INDEX_TABLE))
+
+
+def drop_index():
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS {0}".format(INDEX_TABLE))
+
+
+def _replace(rowid, title, url):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {0} WHERE rowid = %s".format(INDEX_TABLE), [rowid])
+        cursor.execute("INSERT INTO {0} (rowid, title, url) VALUES (%s, %s, %s)".format(INDEX_TABLE),
+                       [rowid, title, url])
+
+
+def _remove(rowid):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM {0} WHERE rowid = %s".format(INDEX_TABLE), [rowid])
+
+
+def index_page(page):
+    if is_supported():
+        _replace(page_rowid(page.id), page.title, page.url)
+
+
+def index_pages(pages):
+    """
+    Indexes many pages with one statement each for the delete and the insert.
+    """
+    if not is_supported() or not pages:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany("DELETE FROM {0} WHERE rowid = %s".format(INDEX_TABLE),
+                           [[page_rowid(page.id)] for page in pages])
+        cursor.executemany("INSERT INTO {0} (rowid, title, url) VALUES (%s, %s, %s)".format(
+            INDEX_TABLE), [[page_rowid(page.id), page.title, page.url] for page in pages])
+
+
+def unindex_page(page):
+    if is_supported():
+        _remove(page_rowid(page.id))
+
+
+def index_category(category):
+    if is_supported():
+        _replace(category_rowid(category.id), category.name, '')
+
+
+def unindex_category(category):
+    if is_supported():
+        _remove(category_rowid(category.id))
+
+
+def rebuild_index():
+    """
+    Recreates the index from every Page and Category in one pass.
+    Returns the number of rows indexed.
+    """
+    from rango.models import Category, Page
+
+    if not is_supported():
+        return 0
+    drop_index()
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {0} (rowid, title, url) SELECT 2 * id, title, url FROM {1}".format(
+                INDEX_TABLE, Page._meta.db_table))
+        pages = cursor.rowcount
+        cursor.execute(
+            "INSERT INTO {0} (rowid, title, url) SELECT 2 * id + 1, name, '' FROM {1}".format(
+                INDEX_TABLE, Category._meta.db_table))
+        categories = cursor.rowcount
+        cursor.execute("INSERT INTO {0} ({0}) VALUES ('optimize')".format(INDEX_TABLE))
+    return pages + categories
+
+
+def make_match_query(search_terms):
+    """
+    Turns free text into an FTS5 query: every word must match, as a prefix.
+    """
+    words = re.findall(r'\w+', search_terms, re.UNICODE)
+    return ' '.join('"{0}"*'.format(word) for word in words)
+
+
+def run_query(search_terms, size=10):
+    """
+    Returns up to size {'title', 'link', 'summary'} results for the search
+    terms from our own pages and categories.
+    """
+    from rango.models import Category, Page
+
+    match = make_match_query(search_terms)
+    if not match or not is_supported():
+        return []
+
+    # bm25() is negative, lower is better; the views boost scales it further
+    # from zero, so the result is still sorted ascending.
+    sql = (
+        "SELECT i.rowid, p.title, p.url, c.name, c.slug, pc.name "
+        "FROM {index} i "
+        "LEFT JOIN {page} p ON i.rowid %% 2 = 0 AND p.id = i.rowid / 2 "
+        "LEFT JOIN {category} pc ON pc.id = p.category_id "
+        "LEFT JOIN {category} c ON i.rowid %% 2 = 1 AND c.id = i.rowid / 2 "
+        "WHERE {index} MATCH %s "
+        "ORDER BY bm25({index}, %s, 1.0) * "
+        "(1.0 + COALESCE(p.views, c.views, 0) / (COALESCE(p.views, c.views, 0) + %s)) "
+        "LIMIT %s").format(index=INDEX_TABLE, page=Page._meta.db_table,
+                           category=Category._meta.db_table)
+
+    results = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, TITLE_WEIGHT, VIEWS_HALF_BOOST, size])
+        for rowid, title, url, name, slug, page_category in cursor.fetchall():
+            if rowid % 2 == 0 and title is not None:
+                results.append({'title': title,
+                                'link': url,
+                                'summary': 'Page in {0}'.format(page_category)})
+            elif rowid % 2 == 1 and name is not None:
+                results.append({'title': name,
+                                'link': reverse('show_category', args=[slug]),
+                                'summary': 'Category'})
+    return results
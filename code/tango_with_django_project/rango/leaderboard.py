@@ -0,0 +1,107 @@
+"""
+Precomputed top-K lists for the index page.
+
+index used to sort the whole Category and Page tables on every hit. The
+most liked categories and most viewed pages are now kept in the cache as
+short, ordered lists of rows. Whenever the like coalescer or the view
+counter writes new counts it offers them to the matching leaderboard, which
+moves or inserts the row in place. Counts only ever go up through those
+paths, so a row outside the list can only get in by beating the last entry.
+
+Every RANGO_LEADERBOARD_RECONCILE_INTERVAL seconds (and after any
+Category/Page save or delete, which may rename, add or remove rows) the list
+is rebuilt from the database, to correct any drift between processes.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rango.db_router import primary_reads
+
+DEFAULT_SIZE = 10
+DEFAULT_RECONCILE_INTERVAL = 60
+
+
+class Leaderboard(object):
+
+    def __init__(self, name, score_field, fields, get_queryset):
+        self.key = 'rango:leaderboard:{0}'.format(name)
+        self.score_field = score_field
+        self.fields = fields
+        self.get_queryset = get_queryset
+        self._lock = threading.Lock()
+
+    def size(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_SIZE', DEFAULT_SIZE)
+
+    def reconcile_interval(self):
+        return getattr(settings, 'RANGO_LEADERBOARD_RECONCILE_INTERVAL',
+                       DEFAULT_RECONCILE_INTERVAL)
+
+    def _sort(self, rows):
+        rows.sort(key=lambda row: (-row[self.score_field], row['id']))
+        del rows[self.size():]
+
+    def rebuild(self):
+        # From the primary, since it is often rebuilt just after a write.
+        with primary_reads():
+            rows = list(self.get_queryset().order_by('-' + self.score_field, 'id')
+                        .values(*self.fields)[:self.size()])
+        board = {'built': time.time(), 'rows': rows}
+        cache.set(self.key, board, None)
+        return board
+
+    def invalidate(self):
+        cache.delete(self.key)
+
+    def _load(self):
+        board = cache.get(self.key)
+        if board is None or time.time() - board['built'] > self.reconcile_interval():
+            board = self.rebuild()
+        return board
+
+    def top(self, k=5):
+        """
+        Returns the best k rows (dictionaries of the leaderboard's fields).
+        """
+        return self._load()['rows'][:k]
+
+    def offer(self, scores):
+        """
+        Takes {id: new score} and updates the list with any that belong in it.
+        """
+        with self._lock:
+            board = self._load()
+            rows = board['rows']
+            by_id = dict((row['id'], row) for row in rows)
+            lowest = rows[-1][self.score_field] if len(rows) >= self.size() else None
+
+            entrants = []
+            for item_id, score in scores.items():
+                if item_id in by_id:
+                    by_id[item_id][self.score_field] = score
+                elif lowest is None or score > lowest:
+                    entrants.append(item_id)
+            if entrants:
+                with primary_reads():
+                    rows.extend(self.get_queryset().filter(id__in=entrants)
+                                .values(*self.fields))
+            self._sort(rows)
+            cache.set(self.key, board, None)
+
+
+def _categories():
+    from rango.models import Category
+    return Category.objects.all()
+
+
+def _pages():
+    from rango.models import Page
+    return Page.objects.all()
+
+
+category_leaderboard = Leaderboard('categories', 'likes', ('id', 'name', 'slug', 'likes'),
+                                   _categories)
+page_leaderboard = Leaderboard('pages', 'views', ('id', 'title', 'views'), _pages)
@@ -0,0 +1,143 @@
+"""
+Coalesced, lost-update-free category likes.
+
+like_category used to load the Category, add one in Python and save() the
+whole row, so two concurrent likes could overwrite each other. Likes now go
+through a LikeCoalescer: the first like for a category opens a short window
+(RANGO_LIKE_COALESCE_WINDOW seconds), every like arriving during that window
+joins it, and when the window closes a single conditional UPDATE
+
+    UPDATE rango_category SET likes = likes + n WHERE id = %s AND likes = %s
+
+is issued for the whole batch. The coalescer remembers the last count it
+wrote, so each caller gets back the exact count after its own like without
+a second SELECT. If the conditional UPDATE misses (somebody else changed the
+row, e.g. another worker process), the count is re-read and the UPDATE
+retried.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+from rango import trending
+from rango.leaderboard import category_leaderboard
+from rango.suggest_index import category_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 0.05
+MAX_RETRIES = 5
+
+
+class _Batch(object):
+
+    def __init__(self):
+        self.size = 0
+        self.base = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class LikeCoalescer(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Only one batch is written at a time, so the remembered counts
+        # and the database stay in step.
+        self._write_lock = threading.Lock()
+        self._batches = {}
+        self._counts = {}
+
+    def window(self):
+        return getattr(settings, 'RANGO_LIKE_COALESCE_WINDOW', DEFAULT_WINDOW)
+
+    def forget(self, category_id=None):
+        """
+        Drops the remembered count for one category (or all of them).
+        """
+        with self._write_lock:
+            if category_id is None:
+                self._counts.clear()
+            else:
+                self._counts.pop(category_id, None)
+
+    def like(self, category_id, amount=1):
+        """
+        Adds amount likes to the category and returns its like count
+        including them. Raises Category.DoesNotExist for an unknown id.
+        """
+        with self._lock:
+            batch = self._batches.get(category_id)
+            leader = batch is None
+            if leader:
+                batch = self._batches[category_id] = _Batch()
+            position = batch.size
+            batch.size += amount
+
+        if leader:
+            time.sleep(self.window())
+            with self._lock:
+                # Close the batch; likes arriving from now on start a new one.
+                del self._batches[category_id]
+            try:
+                batch.base = self._apply(category_id, batch.size)
+            except Exception as e:
+                batch.error = e
+            batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.base + position + amount
+
+    def _apply(self, category_id, amount):
+        """
+        Adds amount to the category's likes and returns the count before.
+        """
+        from rango.models import Category
+
+        with self._write_lock:
+            known = self._counts.get(category_id)
+            for attempt in range(MAX_RETRIES):
+                if known is None:
+                    known = Category.objects.values_list('likes', flat=True).get(id=category_id)
+                updated = Category.objects.filter(id=category_id, likes=known).update(
+                    likes=F('likes') + amount)
+                if updated:
+                    self._counts[category_id] = known + amount
+                    self._publish(category_id, known + amount)
+                    return known
+                known = None
+
+            # The row keeps changing under us; fall back to a plain
+            # relative update and read the result back.
+            Category.objects.filter(id=category_id).update(likes=F('likes') + amount)
+            likes = Category.objects.values_list('likes', flat=True).get(id=category_id)
+            self._counts[category_id] = likes
+            self._publish(category_id, likes)
+            return likes - amount
+
+    def _publish(self, category_id, likes):
+        # The likes are already written; keeping the suggestion index and
+        # leaderboard current is best effort.
+        try:
+            category_index.update_likes(category_id, likes)
+            category_leaderboard.offer({category_id: likes})
+        except Exception:
+            logger.exception("Could not publish new like count for category %s", category_id)
+
+
+category_likes = LikeCoalescer()
+
+
+def like_category(category_id):
+    """
+    Records one like for the category and returns the new like count.
+    """
+    likes = category_likes.like(category_id)
+    trending.record_like(category_id)
+    return likes
@@ -0,0 +1,179 @@
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils.crypto import get_random_string
+
+from rango import benchmark, trending, view_counter, visitor_stats
+from rango.catalog_import import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database, serves the project on a local port and '
+            'measures throughput and latency of every rango endpoint under '
+            'concurrent load.')
+    endpoints = benchmark.ENDPOINTS
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=1000)
+        parser.add_argument('--pages-per-category', type=int, default=50)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent clients per endpoint.')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Unmeasured requests each client sends first.')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='Only run this endpoint (may be repeated).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='Compare with the results in this JSON file.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Slowdown (as a fraction) that counts as a regression.')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in self.endpoints
+                     if not options['endpoints'] or endpoint[0] in options['endpoints']]
+        if not endpoints:
+            raise CommandError('No such endpoint. Choose from: {0}'.format(
+                ', '.join(endpoint[0] for endpoint in self.endpoints)))
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        directory = tempfile.mkdtemp(prefix='rango-benchmark-')
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite':
+            # A file rather than the in-memory default, so the server's
+            # threads all see the same database.
+            test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Only the local search backend, so no request leaves the machine,
+            # no click log, since the pages go away with the database, and no
+            # throttling, since every client comes from the same address.
+            with override_settings(ALLOWED_HOSTS=['127.0.0.1', 'localhost'],
+                                   RANGO_SEARCH_BACKENDS=['rango.fts_search'],
+                                   MEDIA_ROOT=directory, RANGO_CLICK_LOG_DIR=None,
+                                   RANGO_THROTTLE_RATES={}):
+                dataset, session_cookie = self.seed(options)
+                result = self.run_endpoints(endpoints, dataset, session_cookie, options)
+        finally:
+            # Write out what the requests left buffered while the database
+            # they belong to is still there.
+            with override_settings(RANGO_CLICK_LOG_DIR=None):
+                view_counter.page_views.flush()
+            trending.flush()
+            visitor_stats.visitors.flush()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+            shutil.rmtree(directory, ignore_errors=True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            self.stdout.write('Wrote {0}'.format(options['output']))
+
+        if baseline is not None:
+            regressions = benchmark.compare(result, baseline, options['threshold'])
+            for line in regressions:
+                self.stdout.write('REGRESSION {0}'.format(line))
+            if not regressions:
+                self.stdout.write('No regressions against {0}.'.format(options['baseline']))
+            if regressions and options['fail_on_regression']:
+                raise CommandError('{0} regression(s).'.format(len(regressions)))
+
+    def seed(self, options):
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.contrib.sessions.backends.db import SessionStore
+        from rango.models import Category, Page, UserProfile
+
+        start = time.time()
+        CatalogImporter(batch_size=1000).run(benchmark.generate_records(
+            options['categories'], options['pages_per_category'], options['seed']))
+
+        password = make_password('benchmark')
+        User.objects.bulk_create([User(username='bench{0:05d}'.format(i), password=password)
+                                  for i in range(max(options['users'], 1))])
+        users = list(User.objects.filter(username__startswith='bench').order_by('id'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, website='http://example.com/{0}/'.format(user.username))
+            for user in users])
+        self.stdout.write('Seeded {0} categories, {1} pages and {2} users in {3:.1f}s.'.format(
+            Category.objects.count(), Page.objects.count(), len(users), time.time() - start))
+
+        # Log the clients of endpoints that need it in as the first user, by
+        # making its session directly.
+        session = SessionStore()
+        session[SESSION_KEY] = str(users[0].pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = users[0].get_session_auth_hash()
+        session.save()
+        session_cookie = '{0}={1}'.format(settings.SESSION_COOKIE_NAME, session.session_key)
+
+        dataset = benchmark.Dataset(
+            list(Category.objects.values_list('id', flat=True)),
+            list(Category.objects.values_list('slug', flat=True)),
+            list(Page.objects.values_list('id', flat=True)),
+            [user.username for user in users], seed=options['seed'])
+        return dataset, session_cookie
+
+    def run_endpoints(self, endpoints, dataset, session_cookie, options):
+        # Every client presents the same CSRF cookie, and POSTs the matching
+        # form field.
+        csrf_token = get_random_string(32)
+        csrf_cookie = '{0}={1}'.format(settings.CSRF_COOKIE_NAME, csrf_token)
+        server = benchmark.start_server(get_wsgi_application())
+        address = server.server_address[:2]
+        results = {}
+        try:
+            self.stdout.write('{0:<18} {1:>8} {2:>7} {3:>10} {4:>9} {5:>9} {6:>9} {7:>9}'.format(
+                'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'bytes'))
+            for name, make_path, needs_login in endpoints:
+                cookies = [csrf_cookie, session_cookie] if needs_login else [csrf_cookie]
+                figures = benchmark.run_endpoint(
+                    address, make_path, dataset, options['requests'], options['concurrency'],
+                    headers={'Cookie': '; '.join(cookies)}, warmup=options['warmup'],
+                    csrf_token=csrf_token)
+                results[name] = figures
+                self.write_figures(name, figures)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        return {'meta': self.meta(options), 'endpoints': results}
+
+    def write_figures(self, name, figures):
+        self.stdout.write(
+            '{0:<18} {1[requests]:>8} {1[errors]:>7} {1[throughput_rps]:>10.1f} '
+            '{1[p50_ms]:>9.2f} {1[p95_ms]:>9.2f} {1[p99_ms]:>9.2f} '
+            '{1[mean_bytes]:>9.0f}'.format(name, figures))
+
+    def meta(self, options):
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'categories': options['categories'],
+            'pages_per_category': options['pages_per_category'],
+            'users': options['users'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+        }
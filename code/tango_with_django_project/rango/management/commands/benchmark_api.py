@@ -0,0 +1,28 @@
+from django.test import Client
+
+from rango import benchmark
+from rango.management.commands.benchmark import Command as BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = ('Seeds a throwaway database and compares the response size and time of '
+            'the AJAX calls as HTML fragments and as the JSON API. Requests are '
+            'sent in-process, one at a time, so the times are Django\'s own.')
+    endpoints = benchmark.FORMAT_PAIRS
+
+    def run_endpoints(self, endpoints, dataset, cookie, options):
+        client = Client(HTTP_HOST='localhost')
+        results = {}
+        self.stdout.write('{0:<20} {1:>8} {2:>7} {3:>9} {4:>9} {5:>9}'.format(
+            'endpoint', 'requests', 'errors', 'mean ms', 'p95 ms', 'bytes'))
+        for name, make_request, needs_login in endpoints:
+            extra = {'HTTP_COOKIE': cookie} if needs_login else {}
+            figures = benchmark.run_in_process(client, make_request, dataset,
+                                               options['requests'], options['warmup'], **extra)
+            results[name] = figures
+            self.stdout.write(
+                '{0:<20} {1[requests]:>8} {1[errors]:>7} {1[mean_ms]:>9.2f} '
+                '{1[p95_ms]:>9.2f} {1[mean_bytes]:>9.0f}'.format(name, figures))
+        for line in benchmark.compare_formats(results):
+            self.stdout.write(line)
+        return {'meta': dict(self.meta(options), concurrency=1), 'endpoints': results}
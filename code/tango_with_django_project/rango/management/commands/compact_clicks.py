@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango import click_log
+
+
+class Command(BaseCommand):
+    help = ('Rolls sealed click log segments into hourly and daily page view buckets, '
+            'deletes them and prunes buckets past their retention.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep compacting every this many seconds.')
+
+    def handle(self, *args, **options):
+        if not click_log.directory():
+            self.stderr.write('RANGO_CLICK_LOG_DIR is not set.')
+            return
+        while True:
+            segments, clicks = click_log.compact()
+            self.stdout.write('Compacted {0} segments ({1} clicks).'.format(segments, clicks))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from rango import visitor_stats
+
+
+class Command(BaseCommand):
+    help = ("Merges each finished day's visitor sketches into one row. "
+            "Run it once a day, after midnight UTC.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep compacting every this many seconds.')
+
+    def handle(self, *args, **options):
+        while True:
+            days = visitor_stats.compact_finished_days()
+            self.stdout.write('Compacted {0} days.'.format(days))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
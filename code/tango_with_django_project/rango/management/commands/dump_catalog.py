@@ -0,0 +1,46 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand
+
+from rango.catalog_export import export_lines
+from rango.catalog_import import guess_format
+
+
+class Command(BaseCommand):
+    help = ('Writes every category and page as NDJSON or CSV, in the format '
+            'load_catalog reads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help="File to write to, or - for standard output.")
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='Output format. Guessed from the file name by default.')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Compress the output (implied by a .gz file name).')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        fmt = options['format'] or ('ndjson' if path == '-' else guess_format(path))
+        compress = options['gzip'] or path.endswith('.gz')
+
+        if path == '-':
+            out = gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb') if compress else None
+        elif compress:
+            out = gzip.open(path, 'wb')
+        else:
+            out = open(path, 'wb')
+
+        lines = 0
+        try:
+            for line in export_lines(fmt):
+                if out is None:
+                    self.stdout.write(line, ending='')
+                else:
+                    out.write(line.encode('utf-8'))
+                lines += 1
+        finally:
+            if out is not None:
+                out.close()
+        if path != '-':
+            self.stdout.write('Wrote {0} lines to {1}.'.format(lines, path))
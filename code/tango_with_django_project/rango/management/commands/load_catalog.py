@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from rango.catalog_import import (DEFAULT_BATCH_SIZE, CatalogImporter, guess_format,
+                                  open_text, read_records)
+
+
+class Command(BaseCommand):
+    help = ('Streams categories and pages from NDJSON or CSV files (optionally .gz) '
+            'into the database in batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files to import, in order.')
+        parser.add_argument('--format', choices=['ndjson', 'csv'],
+                            help='File format. Guessed from the extension by default.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help="Don't rebuild the local search index afterwards.")
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(batch_size=options['batch_size'],
+                                   progress=self.report_progress,
+                                   rebuild_search_index=not options['skip_search_index'])
+        self.reported = 0
+        for path in options['paths']:
+            with open_text(path) as f:
+                importer.run(read_records(f, options['format'] or guess_format(path)))
+        self.stdout.write(
+            'Imported {0} rows ({1:.0f} rows/s): {2} new categories, {3} new pages, '
+            '{4} skipped.'.format(importer.rows, importer.rate(), importer.categories_created,
+                                  importer.pages_created, importer.skipped))
+
+    def report_progress(self, importer):
+        if importer.rows - self.reported >= 50000:
+            self.reported = importer.rows
+            self.stdout.write('{0} rows ({1:.0f} rows/s)'.format(importer.rows, importer.rate()))
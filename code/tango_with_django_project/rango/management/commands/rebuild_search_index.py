@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from rango import fts_search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the local full-text search index from all pages and categories.'
+
+    def handle(self, *args, **options):
+        if not fts_search.is_supported():
+            self.stderr.write('The local search index needs an SQLite database.')
+            return
+        rows = fts_search.rebuild_index()
+        self.stdout.write('Indexed {0} pages and categories.'.format(rows))
@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from rango import db_router
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database over each SQLite replica in '
+            'RANGO_DATABASE_REPLICAS, for trying out read replicas locally.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying every this many seconds.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied; replicate other '
+                               "databases with the database's own tools.")
+        aliases = db_router.replicas()
+        if not aliases:
+            raise CommandError('RANGO_DATABASE_REPLICAS is empty.')
+        for alias in aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('Replica {0} is not an SQLite database.'.format(alias))
+
+        while True:
+            start = time.time()
+            for alias in aliases:
+                copy_database(primary, connections[alias].settings_dict['NAME'])
+                # Reopen on the new file next time.
+                connections[alias].close()
+            db_router.reset_health()
+            self.stdout.write('Copied the primary to {0} in {1:.2f}s.'.format(
+                ', '.join(aliases), time.time() - start))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+
+def copy_database(connection, path):
+    """
+    Writes a consistent snapshot of connection's SQLite database to path.
+    The copy is made next to path and moved over it, so readers of the old
+    file are never shown a half-written one.
+    """
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    if os.path.exists(temp):
+        os.remove(temp)
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM INTO %s', [temp])
+    os.replace(temp, path)
@@ -0,0 +1,490 @@
+"""
+Per-view request metrics, exported in the Prometheus text format.
+
+MetricsMiddleware times every request and labels what it measured with the
+URL name of the view that served it (e.g. 'show_category'):
+
+    rango_request_duration_seconds   histogram of wall-clock latency
+    rango_request_db_queries         histogram of queries per request
+    rango_request_db_seconds_total   time spent in the database
+    rango_request_template_seconds_total
+                                     time spent rendering templates
+    rango_response_size_bytes        histogram of (non-streaming) body sizes
+    rango_requests_total             requests by view, method and status
+
+Query counts and times come from wrapping the cursors of the thread's
+connections for the length of the request (watch_queries(), which
+rango.query_budget uses too), rather than from Django's query log, which
+would also keep the SQL of every query. Template time comes from
+TimedDjangoTemplates, a drop-in replacement for the DjangoTemplates backend.
+
+Recording is lock-cheap: each thread adds to its own shard, whose lock is
+only ever contended by a scrape. Each process writes a snapshot of its
+totals to RANGO_METRICS_DIR every RANGO_METRICS_FLUSH_INTERVAL seconds, and
+the /rango/metrics/ endpoint adds up every process's snapshot, so whichever
+worker serves the scrape reports for all of them. Without RANGO_METRICS_DIR
+only the serving process is reported.
+
+The endpoint is open to staff users, or to anyone presenting
+RANGO_METRICS_TOKEN as a bearer token.
+"""
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+DEFAULT_FLUSH_INTERVAL = 15
+# Snapshots of processes that have stopped writing are dropped after this long.
+STALE_AFTER = 60 * 60
+
+HELP = {
+    'rango_request_duration_seconds': ('histogram', 'Request latency by view.'),
+    'rango_request_db_queries': ('histogram', 'Database queries per request by view.'),
+    'rango_request_db_seconds_total': ('counter', 'Time spent in database queries by view.'),
+    'rango_request_template_seconds_total': ('counter', 'Time spent rendering templates by view.'),
+    'rango_response_size_bytes': ('histogram', 'Response body size by view.'),
+    'rango_requests_total': ('counter', 'Requests by view, method and status.'),
+    'rango_query_budget_exceeded_total': ('counter', 'Requests that ran more queries, or '
+                                                     'spent longer on them, than their '
+                                                     "view's budget."),
+    'rango_search_cache_events_total': ('counter', 'Search cache hits, misses, coalesced '
+                                                   'calls and evictions.'),
+    'rango_search_backend_calls_total': ('counter', 'Calls to each search backend.'),
+    'rango_search_backend_errors_total': ('counter', 'Failed calls to each search backend.'),
+    'rango_search_backend_timeouts_total': ('counter', 'Calls to each search backend that '
+                                                       'missed the deadline.'),
+    'rango_search_backend_seconds_total': ('counter', 'Time spent waiting on each search '
+                                                      'backend.'),
+    'rango_throttled_requests_total': ('counter', 'Requests turned away with a 429 by view.'),
+}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class _Shard(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._collectors = []
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name, labels, amount=1):
+        shard = self._shard()
+        key = _key(name, labels)
+        with shard.lock:
+            shard.counters[key] = shard.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        shard = self._shard()
+        key = _key(name, labels)
+        with shard.lock:
+            histogram = shard.histograms.get(key)
+            if histogram is None:
+                histogram = shard.histograms[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][i] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    def add_collector(self, collect):
+        """
+        Registers a function returning [(name, labels, value)] counters that
+        are kept elsewhere, to be included in every snapshot.
+        """
+        self._collectors.append(collect)
+
+    def reset(self):
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            with shard.lock:
+                shard.counters.clear()
+                shard.histograms.clear()
+
+    def snapshot(self):
+        """
+        Returns this process's totals as {'counters': [...], 'histograms': [...]},
+        in a form that can be written as JSON and merged with others.
+        """
+        counters = {}
+        histograms = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            with shard.lock:
+                shard_counters = list(shard.counters.items())
+                shard_histograms = [(key, [h[0], list(h[1]), h[2], h[3]])
+                                    for key, h in shard.histograms.items()]
+            _add_counters(counters, shard_counters)
+            _add_histograms(histograms, shard_histograms)
+        for collect in self._collectors:
+            try:
+                _add_counters(counters, [(_key(name, labels), value)
+                                         for name, labels, value in collect()])
+            except Exception:
+                logger.exception("Metrics collector %r failed", collect)
+        return _to_json(counters, histograms)
+
+
+def _add_counters(totals, items):
+    for key, value in items:
+        totals[key] = totals.get(key, 0) + value
+
+
+def _add_histograms(totals, items):
+    for key, (buckets, counts, total, count) in items:
+        histogram = totals.get(key)
+        if histogram is None or histogram[0] != list(buckets):
+            histogram = totals[key] = [list(buckets), [0] * len(buckets), 0.0, 0]
+        for i, n in enumerate(counts):
+            histogram[1][i] += n
+        histogram[2] += total
+        histogram[3] += count
+
+
+def _to_json(counters, histograms):
+    return {
+        'counters': [[name, [list(label) for label in labels], value]
+                     for (name, labels), value in counters.items()],
+        'histograms': [[name, [list(label) for label in labels]] + histogram
+                       for (name, labels), histogram in histograms.items()],
+    }
+
+
+def merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        _add_counters(counters, [((name, tuple(tuple(label) for label in labels)), value)
+                                 for name, labels, value in snapshot['counters']])
+        _add_histograms(histograms, [((name, tuple(tuple(label) for label in labels)), rest)
+                                     for name, labels, *rest in snapshot['histograms']])
+    return _to_json(counters, histograms)
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(
+        name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    """
+    Formats a snapshot in the Prometheus text exposition format.
+    """
+    by_name = {}
+    for name, labels, value in snapshot['counters']:
+        by_name.setdefault(name, []).append(('counter', labels, value))
+    for name, labels, buckets, counts, total, count in snapshot['histograms']:
+        by_name.setdefault(name, []).append(('histogram', labels, (buckets, counts, total, count)))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, description = HELP.get(name, (by_name[name][0][0], name))
+        lines.append('# HELP {0} {1}'.format(name, description))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        for kind, labels, value in sorted(by_name[name], key=lambda item: item[1]):
+            if kind == 'counter':
+                lines.append('{0}{1} {2}'.format(name, _labels(labels), _number(value)))
+                continue
+            buckets, counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, _labels(labels, [('le', _number(bound))]), cumulative))
+            lines.append('{0}_bucket{1} {2}'.format(name, _labels(labels, [('le', '+Inf')]), count))
+            lines.append('{0}_sum{1} {2}'.format(name, _labels(labels), _number(total)))
+            lines.append('{0}_count{1} {2}'.format(name, _labels(labels), count))
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class SnapshotWriter(object):
+    """
+    Periodically writes this process's snapshot to RANGO_METRICS_DIR.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.token = '{0}-{1}'.format(os.getpid(), uuid.uuid4().hex[:8])
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def directory(self):
+        return getattr(settings, 'RANGO_METRICS_DIR', None)
+
+    def interval(self):
+        return getattr(settings, 'RANGO_METRICS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    def path(self):
+        return os.path.join(self.directory(), 'rango-metrics-{0}.json'.format(self.token))
+
+    def write(self):
+        directory = self.directory()
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = self.path()
+        temp = path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(temp, path)
+
+    def ensure_started(self):
+        if self._thread is not None or not self.directory() or not self.interval():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rango-metrics')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval())
+            try:
+                self.write()
+            except Exception:
+                logger.exception("Could not write metrics snapshot")
+
+    def collect(self):
+        """
+        Returns the merged snapshot of every live process.
+        """
+        directory = self.directory()
+        if not directory:
+            return self.registry.snapshot()
+        self.write()
+        snapshots = []
+        now = time.time()
+        for path in glob.glob(os.path.join(directory, 'rango-metrics-*.json')):
+            try:
+                if now - os.path.getmtime(path) > STALE_AFTER:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed or being replaced by its process; skip it.
+                continue
+        return merge(snapshots)
+
+
+writer = SnapshotWriter(registry)
+
+
+def authorized(request):
+    if request.user.is_authenticated() and request.user.is_staff:
+        return True
+    token = getattr(settings, 'RANGO_METRICS_TOKEN', None)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, 'Bearer {0}'.format(token))
+
+
+class _TimedCursor(object):
+    """
+    Wraps one of Django's cursor wrappers, passing the SQL and duration of
+    each execute() to record.
+    """
+
+    def __init__(self, cursor, record):
+        self.cursor = cursor
+        self.record = record
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _timed(self, method, sql, params):
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            self.record(sql, time.perf_counter() - start)
+
+    def execute(self, sql, params=None):
+        return self._timed(self.cursor.execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._timed(self.cursor.executemany, sql, param_list)
+
+
+def watch_queries(record):
+    """
+    Calls record(sql, seconds) for every query this thread's connections run
+    until unwatch_queries() is given the returned value. Watches nest, as
+    long as they are undone in reverse order.
+    """
+    saved = []
+    for conn in connections.all():
+        for name in ('make_cursor', 'make_debug_cursor'):
+            saved.append((conn, name, conn.__dict__.get(name)))
+            original = getattr(conn, name)
+            setattr(conn, name, lambda cursor, original=original: _TimedCursor(
+                original(cursor), record))
+    return saved
+
+
+def unwatch_queries(saved):
+    for conn, name, previous in reversed(saved):
+        if previous is None:
+            conn.__dict__.pop(name, None)
+        else:
+            setattr(conn, name, previous)
+
+
+class _QueryTally(object):
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def record(self, sql, seconds):
+        self.queries += 1
+        self.seconds += seconds
+
+
+# Template render time of the request being served by this thread.
+_timing = threading.local()
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        depth = getattr(_timing, 'depth', 0)
+        _timing.depth = depth + 1
+        start = time.time()
+        try:
+            return super(TimedTemplate, self).render(context, request)
+        finally:
+            _timing.depth = depth
+            # Templates rendered from inside another (e.g. the sidebar) are
+            # already part of the outer render's time.
+            if depth == 0:
+                _timing.seconds = getattr(_timing, 'seconds', 0.0) + time.time() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The DjangoTemplates backend, timing each render for MetricsMiddleware.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, *args, **kwargs):
+        template = super(TimedDjangoTemplates, self).get_template(*args, **kwargs)
+        return TimedTemplate(template.template, self)
+
+
+class MetricsMiddleware(object):
+
+    def process_request(self, request):
+        request._metrics_start = time.time()
+        _timing.seconds = 0.0
+        request._metrics_queries = _QueryTally()
+        request._metrics_watch = watch_queries(request._metrics_queries.record)
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is None:
+            return response
+        duration = time.time() - start
+
+        unwatch_queries(request._metrics_watch)
+        queries = request._metrics_queries.queries
+        db_seconds = request._metrics_queries.seconds
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match is not None else None) or 'unmatched'
+        labels = {'view': view}
+        registry.observe('rango_request_duration_seconds', labels, duration, LATENCY_BUCKETS)
+        registry.observe('rango_request_db_queries', labels, queries, QUERY_BUCKETS)
+        registry.inc('rango_request_db_seconds_total', labels, db_seconds)
+        registry.inc('rango_request_template_seconds_total', labels,
+                     getattr(_timing, 'seconds', 0.0))
+        if not response.streaming:
+            registry.observe('rango_response_size_bytes', labels, len(response.content),
+                             SIZE_BUCKETS)
+        registry.inc('rango_requests_total', {'view': view, 'method': request.method,
+                                              'status': str(response.status_code)})
+        writer.ensure_started()
+        return response
+
+
+def _search_cache_counters():
+    from rango.search_cache import search_cache
+    stats = search_cache.stats()
+    return [('rango_search_cache_events_total', {'event': event}, stats[event])
+            for event in ('hits', 'misses', 'coalesced', 'evictions')]
+
+
+def _search_backend_counters():
+    from rango.federated_search import backend_stats
+    counters = []
+    for backend, stats in backend_stats().items():
+        labels = {'backend': backend}
+        counters.extend([
+            ('rango_search_backend_calls_total', labels, stats['calls']),
+            ('rango_search_backend_errors_total', labels, stats['errors']),
+            ('rango_search_backend_timeouts_total', labels, stats['timeouts']),
+            ('rango_search_backend_seconds_total', labels, stats['latency_total']),
+        ])
+    return counters
+
+
+registry.add_collector(_search_cache_counters)
+registry.add_collector(_search_backend_counters)
@@ -7,8 +7,10 @@ from django.contrib.auth.models import User
 class Category(models.Model):
     name = models.CharField(max_length=128, unique=True)
     views = models.IntegerField(default=0)
-    likes = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0, db_index=True)
     slug = models.SlugField(unique=True)
+    # Log of the forward-decayed activity (see rango.trending).
+    trending_score = models.FloatField(null=True, blank=True, db_index=True)
     
     def save(self, *args, **kwargs):
         self.slug = slugify(self.name)
@@ -24,7 +26,12 @@ class Page(models.Model):
     category = models.ForeignKey(Category)
     title = models.CharField(max_length=128)
     url = models.URLField()
-    views = models.IntegerField(default=0)
+    views = models.IntegerField(default=0, db_index=True)
+    trending_score = models.FloatField(null=True, blank=True, db_index=True)
+    
+    class Meta:
+        # Backs the keyset pagination of a category's pages (rango.pagination).
+        index_together = [('category', 'views', 'id')]
     
     def __str__(self):
         return self.title
@@ -39,4 +46,43 @@ class UserProfile(models.Model):
     
     # Override the __unicode__() method to return out something meaningful!
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.user.username
+
+class VisitorSketch(models.Model):
+    # One process's HyperLogLog sketch of a day's visitors (see rango.visitor_stats).
+    day = models.DateField()
+    shard = models.CharField(max_length=32)
+    registers = models.BinaryField()
+    
+    class Meta:
+        unique_together = [('day', 'shard')]
+    
+    def __str__(self):
+        return '{0} ({1})'.format(self.day, self.shard)
+
+class PageViewBucket(models.Model):
+    # Clicks on a page in one hour or one day, rolled up from the click log
+    # (see rango.click_log).
+    HOUR = 'h'
+    DAY = 'd'
+    RESOLUTIONS = ((HOUR, 'hour'), (DAY, 'day'))
+    
+    page = models.ForeignKey(Page)
+    resolution = models.CharField(max_length=1, choices=RESOLUTIONS)
+    start = models.DateTimeField()
+    views = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = [('page', 'resolution', 'start')]
+    
+    def __str__(self):
+        return '{0} {1} {2}'.format(self.page_id, self.get_resolution_display(), self.start)
+
+class ClickLogSegment(models.Model):
+    # A click log segment already rolled up, so it is never counted twice.
+    name = models.CharField(max_length=128, unique=True)
+    clicks = models.IntegerField(default=0)
+    compacted = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.name
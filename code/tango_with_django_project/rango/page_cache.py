@@ -0,0 +1,138 @@
+"""
+Full-page cache for anonymous readers.
+
+Pages decorated with cache_anonymous_page are stored, once rendered for an
+anonymous GET, under a key made of a version number and the request's full
+path. Saving or deleting a Category or Page bumps the version (see
+rango.signals), which retires every cached page at once, in every worker,
+since the version lives in the shared default cache; like and view
+counts, which change without signals, are at most
+RANGO_PAGE_CACHE_TIMEOUT seconds stale.
+
+Each cached page carries a strong ETag (a hash of its body), so a browser
+that already has the page gets a 304 Not Modified with no body. When
+several anonymous requests miss on the same page at once, only one renders
+it and the rest wait for its result.
+
+Responses are only stored if they are a plain 200 that sets no cookies and
+didn't use the CSRF token, since those would be specific to one visitor.
+Logged-in users always get a freshly rendered page. A timeout of 0 turns
+the cache off.
+"""
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from rango.db_router import primary_reads
+
+VERSION_KEY = 'rango:pages:version'
+DEFAULT_TIMEOUT = 60
+
+
+def timeout():
+    return getattr(settings, 'RANGO_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock, as rango.sidebar_cache does.
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def make_key(request):
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return 'rango:pages:{0}:{1}'.format(get_version(), path)
+
+
+def make_etag(content):
+    return '"{0}"'.format(hashlib.sha1(content).hexdigest())
+
+
+def _cacheable(request, response):
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED'))
+
+
+def _respond(request, entry):
+    etags = [etag.strip() for etag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+    if entry['etag'] in etags or '*' in etags:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+class _Render(object):
+
+    def __init__(self):
+        self.entry = None
+        self.done = threading.Event()
+
+
+_lock = threading.Lock()
+_inflight = {}
+
+
+def cache_anonymous_page(view):
+    """
+    Serves anonymous GETs of view from the page cache.
+    """
+    @wraps(view)
+    def cached(request, *args, **kwargs):
+        if not timeout() or request.method not in ('GET', 'HEAD') or \
+                request.user.is_authenticated():
+            return view(request, *args, **kwargs)
+
+        key = make_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            return _respond(request, entry)
+
+        with _lock:
+            render = _inflight.get(key)
+            leader = render is None
+            if leader:
+                render = _inflight[key] = _Render()
+        if not leader:
+            render.done.wait()
+            if render.entry is not None:
+                return _respond(request, render.entry)
+            # The leader's response couldn't be shared; render our own.
+            return view(request, *args, **kwargs)
+
+        try:
+            # The page is about to be shared, so render it from the primary
+            # rather than from a replica that may not have the change that
+            # retired the last copy.
+            with primary_reads():
+                response = view(request, *args, **kwargs)
+            if not _cacheable(request, response):
+                return response
+            render.entry = {'content': response.content,
+                            'content_type': response['Content-Type'],
+                            'etag': make_etag(response.content)}
+            cache.set(key, render.entry, timeout())
+            return _respond(request, render.entry)
+        finally:
+            with _lock:
+                del _inflight[key]
+            render.done.set()
+    return cached
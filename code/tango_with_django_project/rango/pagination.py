@@ -0,0 +1,84 @@
+"""
+Keyset (cursor) pagination for the pages in a category and for the list of
+user profiles.
+
+Pages are listed most viewed first, ties broken by newest id, and each slice
+starts strictly after the (views, id) of the last row of the previous one.
+Unlike OFFSET, that costs the same however deep the reader goes, and the
+composite index on (category, views, id) serves both the filter and the
+ordering.
+
+Profiles are simply listed by id, so their cursor is the id of the last
+profile shown.
+"""
+from django.conf import settings
+
+DEFAULT_PAGE_SIZE = 20
+DEFAULT_PROFILES_PAGE_SIZE = 20
+
+
+def page_size():
+    return getattr(settings, 'RANGO_CATEGORY_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+
+
+def profiles_page_size():
+    return getattr(settings, 'RANGO_PROFILES_PAGE_SIZE', DEFAULT_PROFILES_PAGE_SIZE)
+
+
+def encode_cursor(page):
+    return '{0}.{1}'.format(page.views, page.id)
+
+
+def decode_cursor(cursor):
+    """
+    Returns (views, id) from a cursor string, or None if it isn't one.
+    """
+    try:
+        views, page_id = cursor.split('.')
+        return int(views), int(page_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def category_pages(category, cursor=None, size=None):
+    """
+    Returns (pages, next_cursor) for the slice of the category's pages that
+    follows cursor. next_cursor is None on the last slice.
+    """
+    from rango.models import Page
+
+    size = size or page_size()
+    pages = Page.objects.filter(category=category).order_by('-views', '-id')
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        views, page_id = position
+        pages = pages.filter(views__lte=views).exclude(views=views, id__gte=page_id)
+
+    pages = list(pages[:size + 1])
+    next_cursor = None
+    if len(pages) > size:
+        pages = pages[:size]
+        next_cursor = encode_cursor(pages[-1])
+    return pages, next_cursor
+
+
+def profile_page(cursor=None, size=None):
+    """
+    Returns (profiles, next_cursor) for the slice of user profiles after
+    cursor, with each profile's user fetched in the same query.
+    """
+    from rango.models import UserProfile
+
+    size = size or profiles_page_size()
+    profiles = UserProfile.objects.select_related('user').order_by('id')
+    try:
+        profiles = profiles.filter(id__gt=int(cursor)) if cursor else profiles
+    except ValueError:
+        pass
+
+    profiles = list(profiles[:size + 1])
+    next_cursor = None
+    if len(profiles) > size:
+        profiles = profiles[:size]
+        next_cursor = str(profiles[-1].id)
+    return profiles, next_cursor
@@ -0,0 +1,154 @@
+"""
+Per-view query budgets.
+
+    @query_budget(queries=4)
+    def show_category(request, category_name_slug):
+        ...
+
+declares that the view may run at most 4 SQL queries, and spend at most
+RANGO_QUERY_BUDGET_SECONDS (or the seconds argument) waiting on them, per
+request. The same works in a URLconf: url(r'^x/$', query_budget(2)(view)).
+The budget covers everything the view does, including rendering its
+template and loading the session and user on first use, but not the
+middleware before or after it, nor the body of a streaming response. A
+view whose work happens in that body, like the catalog export, is marked
+with @no_query_budget instead, so it doesn't claim a budget that checks
+nothing.
+
+When RANGO_QUERY_BUDGET_STRICT is true (it defaults to DEBUG, and the
+project turns it on for tests too), a request over budget raises
+QueryBudgetExceeded listing every query it ran with the stack that ran it,
+so an N+1 shows up as a failing test rather than a slow page. Otherwise the
+overage is logged and counted in the rango_query_budget_exceeded_total
+metric, and the response goes out as usual.
+
+Queries are counted by wrapping the cursors of this thread's connections
+for the duration of the view (rango.metrics.watch_queries), so nothing is
+added to requests of views without a budget. Queries a view triggers on
+behalf of the whole process, like the replica health checks, are run inside
+not_charged() and left out of its budget.
+"""
+import logging
+import os
+import threading
+import traceback
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+from rango import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SECONDS = 1.0
+STACK_DEPTH = 8
+# Where the cursor wrappers live, left out of the recorded stacks.
+INTERNAL_FILES = (os.path.join('rango', 'query_budget.py'), os.path.join('rango', 'metrics.py'))
+
+_active = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def strict():
+    value = getattr(settings, 'RANGO_QUERY_BUDGET_STRICT', None)
+    return settings.DEBUG if value is None else value
+
+
+def _project_stack():
+    # Only our own frames; the ORM's are the same for every query.
+    base = getattr(settings, 'BASE_DIR', '')
+    frames = [frame for frame in traceback.extract_stack()[:-3]
+              if frame[0].startswith(base) and os.sep + 'site-packages' + os.sep not in frame[0]
+              and not frame[0].endswith(INTERNAL_FILES)]
+    return frames[-STACK_DEPTH:]
+
+
+class Budget(object):
+
+    def __init__(self, name, queries, seconds, keep_stacks):
+        self.name = name
+        self.queries = queries
+        self.seconds = seconds
+        self.keep_stacks = keep_stacks
+        self.log = []
+        self.elapsed = 0.0
+
+    def record(self, sql, elapsed):
+        if getattr(_active, 'exempt', 0):
+            return
+        self.elapsed += elapsed
+        self.log.append((sql, elapsed, _project_stack() if self.keep_stacks else None))
+
+    def exceeded(self):
+        return len(self.log) > self.queries or self.elapsed > self.seconds
+
+    def describe(self):
+        lines = ['{0} ran {1} queries in {2:.3f}s; its budget is {3} queries in {4:.3f}s.'.format(
+            self.name, len(self.log), self.elapsed, self.queries, self.seconds)]
+        for i, (sql, elapsed, stack) in enumerate(self.log, 1):
+            lines.append('')
+            lines.append('{0}. ({1:.3f}s) {2}'.format(i, elapsed, sql))
+            if stack:
+                lines.extend(line.rstrip('\n') for line in traceback.format_list(stack))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def not_charged():
+    """
+    Leaves the queries run inside the block out of the current view's budget.
+    """
+    depth = getattr(_active, 'exempt', 0)
+    _active.exempt = depth + 1
+    try:
+        yield
+    finally:
+        _active.exempt = depth
+
+
+def query_budget(queries, seconds=None):
+    """
+    Decorates a view with a budget of queries and seconds of query time.
+    """
+    def decorator(view):
+        name = getattr(view, '__name__', repr(view))
+
+        @wraps(view)
+        def budgeted(request, *args, **kwargs):
+            if getattr(_active, 'budget', None) is not None:
+                # Called from another budgeted view, whose budget applies.
+                return view(request, *args, **kwargs)
+
+            is_strict = strict()
+            limit = seconds if seconds is not None else getattr(
+                settings, 'RANGO_QUERY_BUDGET_SECONDS', DEFAULT_SECONDS)
+            budget = _active.budget = Budget(name, queries, limit, keep_stacks=is_strict)
+            watch = metrics.watch_queries(budget.record)
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                metrics.unwatch_queries(watch)
+                _active.budget = None
+
+            if budget.exceeded():
+                if is_strict:
+                    raise QueryBudgetExceeded(budget.describe())
+                logger.warning('%s ran %d queries in %.3fs; its budget is %d queries in %.3fs.',
+                               name, len(budget.log), budget.elapsed, queries, limit)
+                metrics.registry.inc('rango_query_budget_exceeded_total', {'view': name})
+            return response
+        budgeted.query_budget = (queries, seconds)
+        return budgeted
+    return decorator
+
+
+def no_query_budget(view):
+    """
+    Marks a view as deliberately left without a budget.
+    """
+    view.query_budget = None
+    return view
@@ -0,0 +1,168 @@
+"""
+Caching for the search backends' run_query functions.
+
+Results are stored in Django's cache framework, keyed by backend, normalised
+query and result size, and expire after RANGO_SEARCH_CACHE_TIMEOUT seconds.
+On top of that each process keeps an LRU list of the keys it has stored and
+deletes the least recently used one once RANGO_SEARCH_CACHE_MAX_ENTRIES is
+reached, so the cache can't grow without bound.
+
+Concurrent misses for the same key are coalesced ("single-flight"): the
+first request calls the upstream API and the others wait for its result
+instead of making their own calls.
+"""
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def normalise_query(search_terms):
+    return ' '.join(search_terms.lower().split())
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class SearchCache(object):
+
+    def __init__(self, prefix='rango:search'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RANGO_SEARCH_CACHE_ALIAS', 'default')]
+
+    def timeout(self):
+        return getattr(settings, 'RANGO_SEARCH_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def max_entries(self):
+        return getattr(settings, 'RANGO_SEARCH_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    def make_key(self, backend, search_terms, size):
+        digest = hashlib.sha1(normalise_query(search_terms).encode('utf-8')).hexdigest()
+        return '{0}:{1}:{2}:{3}'.format(self.prefix, backend, size, digest)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'evictions': self.evictions,
+                    'entries': len(self._keys)}
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._keys)
+            self._keys.clear()
+            self.hits = self.misses = self.coalesced = self.evictions = 0
+        self.cache.delete_many(keys)
+
+    def get_or_call(self, key, func):
+        """
+        Returns the cached value for key, calling func() to produce it on a
+        miss. Only one concurrent caller per key runs func().
+        """
+        result = self.cache.get(key)
+        if result is not None:
+            with self._lock:
+                self.hits += 1
+            self._touch(key)
+            return result
+
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            # The previous leader may have stored the result between our
+            # miss and taking the lead.
+            call.result = self.cache.get(key)
+            if call.result is not None:
+                with self._lock:
+                    self.hits += 1
+                self._touch(key)
+                return call.result
+            with self._lock:
+                self.misses += 1
+            call.result = func()
+            # Empty lists are what the backends return on upstream errors,
+            # so only cache real results.
+            if call.result:
+                self.cache.set(key, call.result, self.timeout())
+                self._touch(key)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+        return call.result
+
+    def _touch(self, key):
+        evicted = []
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+            else:
+                self._keys[key] = True
+            while len(self._keys) > self.max_entries():
+                evicted.append(self._keys.popitem(last=False)[0])
+            self.evictions += len(evicted)
+        if evicted:
+            self.cache.delete_many(evicted)
+
+
+search_cache = SearchCache()
+
+
+def cached_search(backend):
+    """
+    Decorates a backend's run_query(search_terms, ...) so that its results
+    are served from the search cache.
+    """
+    def decorator(run_query):
+        signature = inspect.signature(run_query)
+
+        @wraps(run_query)
+        def wrapper(search_terms, *args, **kwargs):
+            bound = signature.bind(search_terms, *args, **kwargs)
+            bound.apply_defaults()
+            size = bound.arguments.get('size')
+            key = search_cache.make_key(backend, search_terms, size)
+            return search_cache.get_or_call(
+                key, lambda: run_query(search_terms, *args, **kwargs))
+
+        wrapper.uncached = run_query
+        return wrapper
+    return decorator
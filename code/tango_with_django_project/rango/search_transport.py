@@ -0,0 +1,178 @@
+"""
+Shared HTTP transport for the search backends.
+
+The API keys are read from their key files once, when the rango app is
+loaded, instead of on every query. Requests go through a small pool of
+persistent (keep-alive) connections per host, so a search doesn't pay for a
+new TCP/TLS handshake each time. Every connection gets a connect timeout
+and a read timeout (RANGO_SEARCH_CONNECT_TIMEOUT, RANGO_SEARCH_READ_TIMEOUT)
+and at most RANGO_SEARCH_POOL_SIZE connections are open to any one host.
+"""
+import http.client
+import json
+import threading
+import urllib.parse
+
+from django.conf import settings
+
+DEFAULT_KEY_FILES = {'webhose': 'search.key', 'bing': 'bing.key'}
+DEFAULT_POOL_SIZE = 4
+DEFAULT_CONNECT_TIMEOUT = 2.0
+DEFAULT_READ_TIMEOUT = 5.0
+
+
+class TransportError(IOError):
+    pass
+
+
+_keys = {}
+_keys_loaded = False
+_keys_lock = threading.Lock()
+
+
+def load_keys():
+    """
+    Reads every key file listed in RANGO_SEARCH_KEY_FILES. A missing file
+    just leaves that key unset; the backend complains when it is used.
+    """
+    global _keys_loaded
+    key_files = getattr(settings, 'RANGO_SEARCH_KEY_FILES', DEFAULT_KEY_FILES)
+    keys = {}
+    for name, path in key_files.items():
+        try:
+            with open(path, 'r') as f:
+                keys[name] = f.readline().strip() or None
+        except IOError:
+            keys[name] = None
+    with _keys_lock:
+        _keys.clear()
+        _keys.update(keys)
+        _keys_loaded = True
+
+
+def get_key(name):
+    """
+    Returns the API key for the named backend, or None if there isn't one.
+    """
+    if not _keys_loaded:
+        load_keys()
+    with _keys_lock:
+        return _keys.get(name)
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of keep-alive connections to a single host.
+    """
+
+    def __init__(self, scheme, host, port, size, connect_timeout, read_timeout):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        # Connected: from here on the read timeout applies.
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.connect_timeout):
+            raise TransportError('No free connection to {0}'.format(self.host))
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        try:
+            return self._new_connection(), False
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable):
+        if reusable:
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def request(self, method, path, headers):
+        """
+        Sends the request and returns (status, body). A kept-alive
+        connection that the server has since dropped is retried once on a
+        fresh connection.
+        """
+        for attempt in range(2):
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError):
+                self._release(conn, False)
+                if reused and attempt == 0:
+                    continue
+                raise
+            self._release(conn, not response.will_close)
+            return response.status, body
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(scheme, host, port):
+    key = (scheme, host, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                scheme, host, port,
+                getattr(settings, 'RANGO_SEARCH_POOL_SIZE', DEFAULT_POOL_SIZE),
+                getattr(settings, 'RANGO_SEARCH_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+                getattr(settings, 'RANGO_SEARCH_READ_TIMEOUT', DEFAULT_READ_TIMEOUT))
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def get_json(url, headers=None):
+    """
+    GETs url over a pooled connection and returns the decoded JSON body.
+    Raises TransportError for anything but a 200 response.
+    """
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = '{0}?{1}'.format(path, parts.query)
+
+    request_headers = {'Accept': 'application/json', 'Connection': 'keep-alive'}
+    request_headers.update(headers or {})
+
+    pool = get_pool(parts.scheme, parts.hostname, port)
+    status, body = pool.request('GET', path, request_headers)
+    if status != 200:
+        raise TransportError('{0} returned HTTP {1}'.format(parts.hostname, status))
+    return json.loads(body.decode('utf-8'))
@@ -0,0 +1,77 @@
+"""
+Versioned fragment cache for the category sidebar.
+
+The rendered category list is cached under a key that includes a version
+number and the id of the highlighted (active) category. Saving or deleting
+a Category bumps the version (see rango.signals), which retires every cached
+fragment at once; until then the sidebar is served from the cache without
+touching the database. The category rows themselves are cached per version
+too, so a highlight that hasn't been rendered yet doesn't re-query them.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from rango.db_router import primary_reads
+from rango.suggest_index import CategoryEntry
+
+VERSION_KEY = 'rango:sidebar:version'
+DEFAULT_TIMEOUT = 24 * 60 * 60
+
+
+def timeout():
+    return getattr(settings, 'RANGO_SIDEBAR_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a restarted cache can't hand out a
+        # version that an older fragment was stored under.
+        cache.add(VERSION_KEY, int(time.time()), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def get_categories(version):
+    key = 'rango:sidebar:{0}:categories'.format(version)
+    categories = cache.get(key)
+    if categories is None:
+        from rango.models import Category
+        # Read from the primary, or a lagging replica could put the rows
+        # from before the change that bumped the version under the new one.
+        with primary_reads():
+            categories = [CategoryEntry(*row) for row in
+                          Category.objects.values_list('id', 'name', 'slug', 'likes')]
+        cache.set(key, categories, timeout())
+    return categories
+
+
+def render_category_list(active=None):
+    """
+    Returns the rendered rango/cats.html for all categories, with active
+    (a Category or None) highlighted.
+    """
+    version = get_version()
+    active_id = getattr(active, 'id', None) or 0
+    key = 'rango:sidebar:{0}:{1}'.format(version, active_id)
+    html = cache.get(key)
+    if html is None:
+        categories = get_categories(version)
+        act_cat = None
+        for category in categories:
+            if category.id == active_id:
+                act_cat = category
+        html = render_to_string('rango/cats.html', {'cats': categories, 'act_cat': act_cat})
+        cache.set(key, html, timeout())
+    return mark_safe(html)
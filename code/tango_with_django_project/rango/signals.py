@@ -0,0 +1,55 @@
+"""
+Signal receivers that keep rango's derived data (search index, caches,
+thumbnails) in step with the Category, Page and UserProfile tables.
+Connected in RangoConfig.ready().
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rango import fts_search, page_cache, sidebar_cache, thumbnails
+from rango.leaderboard import category_leaderboard, page_leaderboard
+from rango.suggest_index import category_index
+from rango.models import Category, Page, UserProfile
+
+
+def create_search_index(sender, **kwargs):
+    fts_search.create_index()
+
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, **kwargs):
+    fts_search.index_page(instance)
+    page_leaderboard.invalidate()
+    page_cache.bump_version()
+
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+    fts_search.unindex_page(instance)
+    page_leaderboard.invalidate()
+    page_cache.bump_version()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+    fts_search.index_category(instance)
+    category_index.upsert(instance)
+    sidebar_cache.bump_version()
+    page_cache.bump_version()
+    category_leaderboard.invalidate()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    fts_search.unindex_category(instance)
+    category_index.remove(instance.id)
+    sidebar_cache.bump_version()
+    page_cache.bump_version()
+    category_leaderboard.invalidate()
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_saved(sender, instance, **kwargs):
+    # A new upload always gets a new file name, so its thumbnails are missing.
+    if instance.picture and thumbnails.missing(instance.picture.name):
+        thumbnails.schedule(instance.picture.name)
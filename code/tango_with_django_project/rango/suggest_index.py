@@ -0,0 +1,225 @@
+"""
+In-memory prefix index over category names, for the suggest_category
+autocomplete.
+
+Names are case-folded and kept in a sorted list, so all the categories
+starting with a prefix are one bisect away. The best RANGO_SUGGEST_MEMO_DEPTH
+categories (by likes) for each prefix asked for are remembered until a
+category under that prefix changes, so repeated keystrokes cost a dict
+lookup.
+
+The index is loaded from the database with a single query the first time it
+is used and reloaded every RANGO_SUGGEST_INDEX_TTL seconds, to pick up
+changes made by other processes. Changes made in this process are applied
+straight away: rango.signals updates it on Category save/delete, and the
+like coalescer reports new like counts.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+DEFAULT_TTL = 300
+DEFAULT_MEMO_DEPTH = 20
+MEMO_SIZE = 4096
+
+CategoryEntry = namedtuple('CategoryEntry', ['id', 'name', 'slug', 'likes'])
+
+
+def fold(name):
+    return name.casefold()
+
+
+def _rank(entry):
+    return (entry.likes, -entry.id)
+
+
+class CategoryPrefixIndex(object):
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        self._memo = OrderedDict()
+        self._loaded_at = None
+        self._changes = None
+
+    def ttl(self):
+        return getattr(settings, 'RANGO_SUGGEST_INDEX_TTL', DEFAULT_TTL)
+
+    def memo_depth(self):
+        return getattr(settings, 'RANGO_SUGGEST_MEMO_DEPTH', DEFAULT_MEMO_DEPTH)
+
+    def reset(self):
+        """
+        Forgets everything; the next lookup reloads from the database.
+        """
+        with self._lock:
+            self._record(self.reset)
+            self._keys = []
+            self._entries = {}
+            self._memo.clear()
+            self._loaded_at = None
+
+    def load(self):
+        """
+        Reloads the index from the database. Lookups keep using the old
+        index until the new one is built; changes reported while it is being
+        built are applied to it afterwards, in case the query missed them.
+        """
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        from rango.models import Category
+
+        with self._lock:
+            self._changes = []
+        try:
+            rows = Category.objects.values_list('id', 'name', 'slug', 'likes')
+            entries = dict((row[0], CategoryEntry(*row)) for row in rows.iterator())
+            keys = sorted((fold(entry.name), entry.id) for entry in entries.values())
+
+            # One-letter prefixes match the most names, so work those out now
+            # rather than on somebody's first keystroke.
+            by_letter = {}
+            for name, category_id in keys:
+                if name:
+                    by_letter.setdefault(name[0], []).append(entries[category_id])
+            depth = self.memo_depth()
+            memo = OrderedDict(
+                (letter, heapq.nlargest(depth, letter_entries, key=_rank))
+                for letter, letter_entries in by_letter.items())
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            changes, self._changes = self._changes, None
+            self._entries = entries
+            self._keys = keys
+            self._memo = memo
+            self._loaded_at = time.time()
+            for method, args in changes:
+                method(*args)
+
+    def _stale(self):
+        return self._loaded_at is None or time.time() - self._loaded_at > self.ttl()
+
+    def _ensure_loaded(self):
+        if not self._stale():
+            return
+        if self._loaded_at is None:
+            # Nothing to answer from yet, so wait for whoever is loading.
+            self._load_lock.acquire()
+        elif not self._load_lock.acquire(blocking=False):
+            # Somebody else is reloading; the old index will do until then.
+            return
+        try:
+            if self._stale():
+                self._load()
+        finally:
+            self._load_lock.release()
+
+    def _record(self, method, *args):
+        """
+        Remembers a change made while a load is running. Must hold the lock.
+        """
+        if self._changes is not None:
+            self._changes.append((method, args))
+
+    def _invalidate(self, folded_name):
+        for i in range(1, len(folded_name) + 1):
+            self._memo.pop(folded_name[:i], None)
+
+    def _remove(self, category_id):
+        entry = self._entries.pop(category_id, None)
+        if entry is not None:
+            key = (fold(entry.name), entry.id)
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+            self._invalidate(key[0])
+
+    def upsert(self, category):
+        """
+        Adds or updates a category (any object with id, name, slug, likes).
+        """
+        entry = CategoryEntry(category.id, category.name, category.slug, category.likes)
+        with self._lock:
+            self._record(self.upsert, entry)
+            if self._loaded_at is None:
+                return
+            self._remove(entry.id)
+            self._entries[entry.id] = entry
+            insort(self._keys, (fold(entry.name), entry.id))
+            self._invalidate(fold(entry.name))
+
+    def remove(self, category_id):
+        with self._lock:
+            self._record(self.remove, category_id)
+            self._remove(category_id)
+
+    def update_likes(self, category_id, likes):
+        with self._lock:
+            self._record(self.update_likes, category_id, likes)
+            entry = self._entries.get(category_id)
+            if entry is None or entry.likes == likes:
+                return
+            updated = self._entries[category_id] = entry._replace(likes=likes)
+            if likes < entry.likes:
+                self._invalidate(fold(entry.name))
+                return
+
+            # More likes can only move the category up, so the remembered
+            # lists can be patched instead of recomputed.
+            depth = self.memo_depth()
+            folded = fold(entry.name)
+            for i in range(1, len(folded) + 1):
+                best = self._memo.get(folded[:i])
+                if best is None:
+                    continue
+                if entry in best:
+                    best.remove(entry)
+                elif len(best) >= depth and _rank(updated) <= _rank(best[-1]):
+                    continue
+                best.append(updated)
+                best.sort(key=_rank, reverse=True)
+                del best[depth:]
+
+    def _scan(self, prefix, limit):
+        lo = bisect_left(self._keys, (prefix,))
+        hi = bisect_left(self._keys, (prefix + '\U0010ffff',))
+        entries = (self._entries[category_id] for name, category_id in self._keys[lo:hi])
+        if limit is None:
+            return sorted(entries, key=_rank, reverse=True)
+        return heapq.nlargest(limit, entries, key=_rank)
+
+    def top(self, prefix, limit=None):
+        """
+        Returns the categories whose names start with prefix (ignoring case),
+        most liked first. All of them if limit is None.
+        """
+        prefix = fold(prefix)
+        self._ensure_loaded()
+        with self._lock:
+            depth = self.memo_depth()
+            if limit is None or limit > depth:
+                return self._scan(prefix, limit)
+
+            best = self._memo.get(prefix)
+            if best is None:
+                best = self._memo[prefix] = self._scan(prefix, depth)
+                if len(self._memo) > MEMO_SIZE:
+                    self._memo.popitem(last=False)
+            else:
+                self._memo.move_to_end(prefix)
+            return best[:limit]
+
+
+category_index = CategoryPrefixIndex()
@@ -1,10 +1,18 @@
 from django import template
-from rango.models import Category
+from rango import sidebar_cache, thumbnails
 	
 register = template.Library()
 
 	
-@register.inclusion_tag('rango/cats.html')
+@register.simple_tag
 def get_category_list(cat=None):
-	return {'cats': Category.objects.all(),
-		'act_cat': cat}
\ No newline at end of file
+	# Renders rango/cats.html, served from a fragment cache that is
+	# invalidated whenever a category is saved or deleted.
+	return sidebar_cache.render_category_list(cat)
+
+
+@register.filter
+def thumbnail_url(picture, size):
+	# The URL of a square thumbnail of an ImageField file, e.g.
+	# {{ userprofile.picture|thumbnail_url:300 }}
+	return thumbnails.thumbnail_url(picture, int(size))
@@ -1,6 +1,7 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.urlresolvers import reverse
 from django.contrib.staticfiles import finders
+from django.utils.six import StringIO
 
 # Thanks to Enzo Roiz https://github.com/enzoroiz who made these tests during an internship with us
 
@@ -247,4 +248,1688 @@ class Chapter7ViewTests(TestCase):
     #<a href="/rango/add_category/">Add a New Category</a><br />
 
 
-    # test if the add_page.html template exists.
\ No newline at end of file
+    # test if the add_page.html template exists.
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=0)
+class TrackUrlTests(TestCase):
+
+    def setUp(self):
+        from rango import view_counter
+        from rango.models import Category, Page
+        view_counter.page_views.drain()
+        cat = Category.objects.create(name='Python')
+        self.page = Page.objects.create(category=cat, title='Docs',
+                                        url='http://docs.python.org/')
+
+    def test_goto_redirects_without_writing(self):
+        from rango import view_counter
+        from rango.models import Page
+        response = self.client.get(reverse('goto'), {'page_id': self.page.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], 'http://docs.python.org/')
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 0)
+        self.assertEqual(view_counter.page_views.pending(), {self.page.id: 1})
+
+    def test_flush_applies_buffered_views(self):
+        from rango import view_counter
+        from rango.models import Page
+        for i in range(3):
+            self.client.get(reverse('goto'), {'page_id': self.page.id})
+        self.assertEqual(view_counter.page_views.flush(), 3)
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 3)
+
+    def test_flush_of_more_pages_than_sqlite_parameters(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rango import view_counter
+        from rango.models import Page
+        Page.objects.bulk_create([
+            Page(category=self.page.category, title='Page {0}'.format(i),
+                 url='http://example.com/{0}/'.format(i)) for i in range(1200)])
+        page_ids = list(Page.objects.values_list('id', flat=True))
+        for page_id in page_ids:
+            view_counter.record_view(page_id)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view_counter.page_views.flush(), 1201)
+        self.assertEqual(view_counter.page_views.pending(), {})
+        self.assertEqual(Page.objects.filter(views=1).count(), 1201)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 7)
+
+    def test_goto_unknown_page(self):
+        response = self.client.get(reverse('goto'), {'page_id': 999})
+        self.assertIn(b'not found', response.content)
+
+
+@override_settings(RANGO_LIKE_COALESCE_WINDOW=0.01)
+class LikeCategoryTests(TransactionTestCase):
+
+    def setUp(self):
+        from rango import like_counter
+        from rango.models import Category
+        like_counter.category_likes.forget()
+        self.category = Category.objects.create(name='Python', likes=10)
+
+    def test_like_view_returns_new_count(self):
+        from django.contrib.auth.models import User
+        User.objects.create_user('leif', 'leif@example.com', 'secret')
+        self.client.login(username='leif', password='secret')
+        response = self.client.get(reverse('like_category'), {'category_id': self.category.id})
+        self.assertEqual(response.content, b'11')
+
+    def test_parallel_likes_are_not_lost(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from rango import like_counter
+        from rango.models import Category
+        likes = 2000
+        with ThreadPoolExecutor(max_workers=64) as pool:
+            counts = list(pool.map(lambda i: like_counter.like_category(self.category.id),
+                                   range(likes)))
+        # Every caller saw a distinct count and the row holds all of them.
+        self.assertEqual(sorted(counts), list(range(11, 11 + likes)))
+        self.assertEqual(Category.objects.get(id=self.category.id).likes, 10 + likes)
+
+
+class SearchCacheTests(TestCase):
+
+    def setUp(self):
+        from rango.search_cache import search_cache
+        search_cache.clear()
+        self.calls = []
+
+    def make_backend(self, delay=0):
+        import time
+        from rango.search_cache import cached_search
+
+        @cached_search('stub')
+        def run_query(search_terms, size=10):
+            self.calls.append((search_terms, size))
+            time.sleep(delay)
+            return [{'title': search_terms, 'link': 'http://example.com/', 'summary': ''}]
+        return run_query
+
+    def test_normalised_queries_share_an_entry(self):
+        from rango.search_cache import search_cache
+        run_query = self.make_backend()
+        run_query('Django  Tutorial')
+        run_query('django tutorial', size=10)
+        run_query('django tutorial', 5)
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(search_cache.stats()['hits'], 1)
+
+    @override_settings(RANGO_SEARCH_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entry_is_evicted(self):
+        from rango.search_cache import search_cache
+        run_query = self.make_backend()
+        run_query('a')
+        run_query('b')
+        run_query('a')
+        run_query('c')
+        self.assertEqual(search_cache.stats()['evictions'], 1)
+        run_query('a')
+        run_query('b')
+        self.assertEqual([q for q, size in self.calls], ['a', 'b', 'c', 'b'])
+
+    def test_concurrent_misses_make_one_upstream_call(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from rango.search_cache import search_cache
+        run_query = self.make_backend(delay=0.2)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(lambda i: run_query('python'), range(10)))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(search_cache.stats()['coalesced'], 9)
+
+    def test_leader_uses_a_result_stored_since_its_miss(self):
+        from unittest import mock
+        from rango.search_cache import search_cache
+        run_query = self.make_backend()
+        run_query('python')
+        cache = search_cache.cache
+        stored = cache.get
+        # The first lookup misses, as if it ran just before the previous
+        # leader stored its result.
+        with mock.patch.object(cache, 'get', side_effect=[None, stored(search_cache.make_key(
+                'stub', 'python', 10))]):
+            results = run_query('python')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results[0]['title'], 'python')
+        self.assertEqual(search_cache.stats()['misses'], 1)
+
+
+class StubSearchServer(object):
+    """
+    A local HTTP server that answers every GET with a canned JSON payload,
+    standing in for the Webhose and Bing APIs.
+    """
+
+    def __init__(self, payload, delay=0):
+        import json
+        import threading
+        import time
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+
+        class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        body = json.dumps(payload).encode('utf-8')
+        requests = self.requests = []
+        connections = self.connections = set()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                requests.append(self.path)
+                connections.add(self.client_address)
+                time.sleep(delay)
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up waiting (timeout tests).
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}/'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        from rango import search_transport
+        search_transport.close_pools()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def webhose_payload(*links):
+    return {'posts': [{'title': link, 'url': link, 'text': 'about ' + link} for link in links]}
+
+
+def bing_payload(*links):
+    return {'d': {'results': [{'Title': link, 'Url': link, 'Description': ''} for link in links]}}
+
+
+class FederatedSearchTests(TestCase):
+
+    def setUp(self):
+        from unittest import mock
+        from rango import federated_search
+        from rango.search_cache import search_cache
+        search_cache.clear()
+        federated_search.reset_stats()
+        for name in ('rango.webhose_search.read_webhose_key', 'rango.bing_search.read_bing_key'):
+            patcher = mock.patch(name, return_value='key')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def start_server(self, payload, delay=0):
+        server = StubSearchServer(payload, delay)
+        self.addCleanup(server.close)
+        return server
+
+    def test_results_are_merged_and_deduplicated(self):
+        from rango import federated_search
+        webhose = self.start_server(webhose_payload('http://a.com/', 'http://b.com/'))
+        bing = self.start_server(bing_payload('http://b.com', 'http://c.com/'))
+        with self.settings(WEBHOSE_SEARCH_URL=webhose.url, BING_SEARCH_URL=bing.url):
+            results = federated_search.run_query('django')
+        # Bing's b.com comes in at rank 1, Webhose's copy at rank 2 is dropped.
+        self.assertEqual([r['link'] for r in results],
+                         ['http://a.com/', 'http://b.com', 'http://c.com/'])
+        self.assertEqual(len(webhose.requests), 1)
+        self.assertEqual(len(bing.requests), 1)
+
+    def test_slow_backend_is_cut_off_at_the_deadline(self):
+        import time
+        from rango import federated_search
+        webhose = self.start_server(webhose_payload('http://a.com/'))
+        bing = self.start_server(bing_payload('http://slow.com/'), delay=1)
+        with self.settings(WEBHOSE_SEARCH_URL=webhose.url, BING_SEARCH_URL=bing.url,
+                           RANGO_SEARCH_DEADLINE=0.3):
+            start = time.time()
+            results = federated_search.run_query('django')
+            elapsed = time.time() - start
+        self.assertLess(elapsed, 0.9)
+        self.assertEqual([r['link'] for r in results], ['http://a.com/'])
+        stats = federated_search.backend_stats()
+        self.assertEqual(stats['bing_search']['timeouts'], 1)
+        self.assertEqual(stats['webhose_search']['timeouts'], 0)
+        self.assertEqual(stats['webhose_search']['calls'], 1)
+
+
+
+class SearchTransportTests(TestCase):
+
+    def test_keys_are_read_once(self):
+        import os
+        import tempfile
+        from rango import search_transport, webhose_search
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as f:
+            f.write('secret\n')
+        with self.settings(RANGO_SEARCH_KEY_FILES={'webhose': path}):
+            search_transport.load_keys()
+            os.remove(path)
+            self.assertEqual(webhose_search.read_webhose_key(), 'secret')
+        search_transport.load_keys()
+
+    def test_connections_are_kept_alive(self):
+        from rango import search_transport
+        server = StubSearchServer(webhose_payload('http://a.com/'))
+        self.addCleanup(server.close)
+        for i in range(3):
+            response = search_transport.get_json(server.url + '?q={0}'.format(i))
+            self.assertEqual(response['posts'][0]['url'], 'http://a.com/')
+        self.assertEqual(len(server.requests), 3)
+        self.assertEqual(len(server.connections), 1)
+
+    @override_settings(RANGO_SEARCH_READ_TIMEOUT=0.2)
+    def test_read_timeout(self):
+        import socket
+        from rango import search_transport
+        server = StubSearchServer(webhose_payload('http://a.com/'), delay=1)
+        self.addCleanup(server.close)
+        search_transport.close_pools()
+        with self.assertRaises(socket.timeout):
+            search_transport.get_json(server.url)
+
+
+class LocalSearchTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+        Page.objects.create(category=self.python, title='Official Python Tutorial',
+                            url='http://docs.python.org/2/tutorial/', views=1)
+        Page.objects.create(category=self.python, title='Learn Python in 10 Minutes',
+                            url='http://www.korokithakis.net/tutorials/python/', views=500)
+        Page.objects.create(category=self.django, title='Official Django Tutorial',
+                            url='https://docs.djangoproject.com/en/1.9/intro/tutorial01/')
+
+    def test_pages_and_categories_are_found(self):
+        from rango import fts_search
+        results = fts_search.run_query('pyth')
+        self.assertEqual(len(results), 3)
+        self.assertIn({'title': 'Python',
+                       'link': reverse('show_category', args=['python']),
+                       'summary': 'Category'}, results)
+
+    def test_views_boost_ranking(self):
+        from rango import fts_search
+        results = fts_search.run_query('python tutorial')
+        self.assertEqual([r['title'] for r in results],
+                         ['Learn Python in 10 Minutes', 'Official Python Tutorial'])
+
+    def test_index_follows_saves_and_deletes(self):
+        from rango import fts_search
+        self.django.name = 'Flask'
+        self.django.save()
+        self.assertEqual([r['title'] for r in fts_search.run_query('flask')], ['Flask'])
+        self.django.delete()
+        self.assertEqual(fts_search.run_query('flask'), [])
+        self.assertEqual(fts_search.run_query('djangoproject'), [])
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+        from rango import fts_search
+        fts_search.drop_index()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(fts_search.run_query('official tutorial')), 2)
+
+
+class SuggestCategoryTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category
+        from rango.suggest_index import category_index
+        category_index.reset()
+        for name, likes in [('Python', 64), ('Pascal', 16), ('Perl', 32),
+                            ('php', 8), ('Django', 100)]:
+            Category.objects.create(name=name, likes=likes)
+
+    def test_suggestions_ranked_by_likes(self):
+        from rango.suggest_index import category_index
+        names = [c.name for c in category_index.top('p', 3)]
+        self.assertEqual(names, ['Python', 'Perl', 'Pascal'])
+        self.assertEqual([c.name for c in category_index.top('PH')], ['php'])
+
+    def test_suggest_does_not_query_once_loaded(self):
+        from rango.suggest_index import category_index
+        category_index.top('p')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('suggest_category'), {'suggestion': 'pe'})
+        self.assertIn(b'/rango/category/perl/', response.content)
+
+    def test_index_follows_changes(self):
+        from rango import like_counter
+        from rango.models import Category
+        from rango.suggest_index import category_index
+        category_index.top('p')
+        Category.objects.create(name='Prolog', likes=50)
+        Category.objects.get(name='Python').delete()
+        self.assertEqual([c.name for c in category_index.top('p', 2)], ['Prolog', 'Perl'])
+        perl = Category.objects.get(name='Perl')
+        like_counter.category_likes.forget()
+        with self.settings(RANGO_LIKE_COALESCE_WINDOW=0):
+            for i in range(20):
+                like_counter.like_category(perl.id)
+        self.assertEqual([c.name for c in category_index.top('p', 2)], ['Perl', 'Prolog'])
+
+    def test_lookups_do_not_wait_for_a_reload(self):
+        import threading
+        from collections import OrderedDict
+        from unittest import mock
+        from rango import suggest_index
+        index = suggest_index.CategoryPrefixIndex()
+        index.top('p')
+        index._loaded_at -= index.ttl() + 1
+        seen = []
+
+        def lookup_during_load(*args):
+            # Runs while the reload is building its index, after its query.
+            def lookup():
+                seen.append([c.name for c in index.top('p', 2)])
+                index.upsert(suggest_index.CategoryEntry(99, 'Prolog', 'prolog', 50))
+            thread = threading.Thread(target=lookup)
+            thread.start()
+            thread.join(5)
+            return OrderedDict(*args)
+
+        with mock.patch.object(suggest_index, 'OrderedDict', lookup_during_load):
+            index.load()
+        self.assertEqual(seen, [['Python', 'Perl']])
+        self.assertEqual([c.name for c in index.top('p', 2)], ['Python', 'Prolog'])
+
+
+class CategorySidebarTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango.models import Category
+        cache.clear()
+        self.python = Category.objects.create(name='Python')
+        self.django = Category.objects.create(name='Django')
+
+    def render(self, category=None):
+        from django.template import Context, Template
+        template = Template('{% load rango_template_tags %}{% get_category_list category %}')
+        return template.render(Context({'category': category}))
+
+    def test_sidebar_is_cached_and_highlights_active_category(self):
+        self.render()
+        with self.assertNumQueries(0):
+            html = self.render(self.django)
+            self.render(self.django)
+        self.assertIn('<strong><a href="/rango/category/django/">Django</a></strong>', html)
+        self.assertNotIn('<strong><a href="/rango/category/python/">', html)
+
+    def test_sidebar_follows_category_changes(self):
+        from rango.models import Category
+        self.render()
+        Category.objects.create(name='Flask')
+        self.assertIn('Flask', self.render())
+        self.python.delete()
+        self.assertNotIn('Python', self.render())
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=0, RANGO_LIKE_COALESCE_WINDOW=0,
+                   RANGO_LEADERBOARD_SIZE=3)
+class LeaderboardTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango import like_counter, view_counter
+        from rango.models import Category, Page
+        cache.clear()
+        view_counter.page_views.drain()
+        like_counter.category_likes.forget()
+        self.categories = [Category.objects.create(name=name, likes=likes)
+                           for name, likes in [('A', 40), ('B', 30), ('C', 20), ('D', 10)]]
+        self.pages = [Page.objects.create(category=self.categories[0], title=title,
+                                          url='http://example.com/', views=views)
+                      for title, views in [('P1', 4), ('P2', 3), ('P3', 2), ('P4', 1)]]
+
+    def test_index_reads_precomputed_lists(self):
+        response = self.client.get(reverse('index'))
+        self.assertEqual([c['name'] for c in response.context['categories']], ['A', 'B', 'C'])
+        self.assertEqual([p['title'] for p in response.context['pages']], ['P1', 'P2', 'P3'])
+
+    def test_likes_update_the_board_in_place(self):
+        from rango import like_counter
+        from rango.leaderboard import category_leaderboard
+        category_leaderboard.top()
+        for i in range(35):
+            like_counter.like_category(self.categories[3].id)
+        with self.assertNumQueries(0):
+            top = category_leaderboard.top()
+        self.assertEqual([(c['name'], c['likes']) for c in top],
+                         [('D', 45), ('A', 40), ('B', 30)])
+
+    def test_flushed_views_update_the_board(self):
+        from rango import view_counter
+        from rango.leaderboard import page_leaderboard
+        page_leaderboard.top()
+        for i in range(3):
+            view_counter.record_view(self.pages[3].id)
+        view_counter.page_views.flush()
+        with self.assertNumQueries(0):
+            top = page_leaderboard.top()
+        self.assertEqual([p['title'] for p in top], ['P1', 'P4', 'P2'])
+
+
+@override_settings(RANGO_CATEGORY_PAGE_SIZE=10)
+class CategoryPaginationTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        self.category = Category.objects.create(name='Python')
+        Page.objects.bulk_create([
+            Page(category=self.category, title='Page {0}'.format(i),
+                 url='http://example.com/{0}'.format(i), views=i % 7)
+            for i in range(35)])
+
+    def test_cursors_walk_every_page_in_order(self):
+        from rango.models import Page
+        from rango.pagination import category_pages
+        seen = []
+        pages, cursor = category_pages(self.category)
+        seen.extend(pages)
+        while cursor:
+            pages, cursor = category_pages(self.category, cursor)
+            seen.extend(pages)
+        expected = list(Page.objects.filter(category=self.category).order_by('-views', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_category_page_shows_first_slice(self):
+        response = self.client.get(reverse('show_category', args=['python']))
+        self.assertEqual(len(response.context['pages']), 10)
+        self.assertContains(response, 'rango-more')
+
+    def test_more_pages_returns_only_the_next_slice(self):
+        from rango.pagination import category_pages
+        first, cursor = category_pages(self.category)
+        response = self.client.get(reverse('more_pages'),
+                                   {'category_id': self.category.id, 'cursor': cursor})
+        self.assertEqual(len(response.context['pages']), 10)
+        self.assertNotContains(response, '<ul>')
+        self.assertNotIn(first[-1], response.context['pages'])
+
+    def test_slices_are_served_by_the_composite_index(self):
+        from django.db import connection
+        from rango.models import Page
+        query = (Page.objects.filter(category=self.category, views__lte=3)
+                 .exclude(views=3, id__gte=10).order_by('-views', '-id')[:11])
+        sql, params = query.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('category_id_', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class CatalogImportTests(TestCase):
+
+    def write(self, name, text):
+        import os
+        import tempfile
+        directory = tempfile.mkdtemp()
+        self.addCleanup(__import__('shutil').rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_load_ndjson(self):
+        from django.core.management import call_command
+        from rango.models import Category, Page
+        path = self.write('catalog.ndjson', '\n'.join([
+            '{"type": "category", "category": "Python", "views": 128, "likes": 64}',
+            '{"type": "page", "category": "Python", "title": "Tutorial", '
+            '"url": "http://docs.python.org/", "views": 32}',
+            '{"type": "page", "category": "Django Rocks", "title": "Rocks", '
+            '"url": "http://www.djangorocks.com/"}',
+        ]))
+        out = StringIO()
+        call_command('load_catalog', path, batch_size=2, stdout=out)
+        self.assertIn('2 new categories, 2 new pages', out.getvalue())
+        python = Category.objects.get(name='Python')
+        self.assertEqual((python.views, python.likes), (128, 64))
+        self.assertEqual(Category.objects.get(name='Django Rocks').slug, 'django-rocks')
+        self.assertEqual(Page.objects.get(title='Tutorial').views, 32)
+
+    def test_reloading_updates_rows_in_place(self):
+        from rango.catalog_import import CatalogImporter
+        from rango.models import Category, Page
+        records = [
+            {'type': 'category', 'category': 'Python', 'views': 1, 'likes': 1},
+            {'type': 'page', 'category': 'Python', 'title': 'Tutorial',
+             'url': 'http://docs.python.org/', 'views': 1},
+        ]
+        CatalogImporter().run(records)
+        records[0]['likes'] = 5
+        records[1].update(url='http://docs.python.org/3/', views=7)
+        # Two SELECTs and four UPDATEs, plus the batch's savepoint and release.
+        with self.assertNumQueries(8):
+            importer = CatalogImporter(rebuild_search_index=False)
+            importer.import_batch(records)
+        self.assertEqual((importer.categories_created, importer.pages_created), (0, 0))
+        self.assertEqual(Category.objects.get().likes, 5)
+        page = Page.objects.get()
+        self.assertEqual((page.url, page.views), ('http://docs.python.org/3/', 7))
+
+    def test_load_csv(self):
+        from django.core.management import call_command
+        from rango.models import Page
+        path = self.write('catalog.csv', 'type,category,title,url,views,likes\n'
+                                         'category,Python,,,10,2\n'
+                                         'page,Python,Tutorial,http://docs.python.org/,3,\n'
+                                         'page,,Orphan,http://example.com/,1,\n')
+        out = StringIO()
+        call_command('load_catalog', path, stdout=out)
+        self.assertIn('1 skipped', out.getvalue())
+        self.assertEqual(Page.objects.get().category.name, 'Python')
+
+
+@override_settings(RANGO_EXPORT_CHUNK_SIZE=2)
+class CatalogExportTests(TestCase):
+
+    def setUp(self):
+        from rango.models import Category, Page
+        python = Category.objects.create(name='Python', views=128, likes=64)
+        Category.objects.create(name='Perl')
+        for i in range(5):
+            Page.objects.create(category=python, title='Page {0}'.format(i),
+                                url='http://example.com/{0}'.format(i), views=i)
+
+    def test_export_round_trips_through_the_importer(self):
+        import json
+        from rango.catalog_export import export_lines
+        from rango.catalog_import import read_records
+        for fmt in ('ndjson', 'csv'):
+            records = list(read_records(list(export_lines(fmt)), fmt))
+            self.assertEqual(len(records), 7)
+            self.assertEqual(records[0]['category'], 'Python')
+            self.assertEqual(str(records[0]['likes']), '64')
+            self.assertEqual(records[-1]['title'], 'Page 4')
+        self.assertEqual(json.loads(next(export_lines()))['type'], 'category')
+
+    def test_rows_are_read_one_chunk_at_a_time(self):
+        from rango.catalog_export import export_lines
+        lines = export_lines()
+        with self.assertNumQueries(1):
+            next(lines)
+            next(lines)
+        # Two full chunks of categories need a third query to find the end,
+        # then three chunks of pages.
+        with self.assertNumQueries(4):
+            self.assertEqual(len(list(lines)), 5)
+
+    def test_export_view_is_staff_only_and_streams(self):
+        from django.contrib.auth.models import User
+        url = reverse('export_catalog', args=['csv'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.login(username='admin', password='secret')
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(body.startswith('type,category,title,url,views,likes\n'))
+        self.assertEqual(body.count('\n'), 8)
+
+    def test_dump_catalog_writes_gzip(self):
+        import gzip
+        import os
+        import shutil
+        import tempfile
+        from django.core.management import call_command
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'catalog.ndjson.gz')
+        call_command('dump_catalog', path, stdout=StringIO())
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 7)
+
+
+class ProfileListTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rango.models import UserProfile
+        for i in range(25):
+            user = User.objects.create_user('user{0:02d}'.format(i), password='secret')
+            UserProfile.objects.create(user=user, website='http://example.com/{0}'.format(i))
+        self.client.login(username='user00', password='secret')
+        # Warm the sidebar cache, which the base template renders.
+        self.client.get(reverse('list_profiles'))
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for size in (5, 20):
+            with self.settings(RANGO_PROFILES_PAGE_SIZE=size):
+                # Session, user, then the profiles with their users.
+                with self.assertNumQueries(3):
+                    response = self.client.get(reverse('list_profiles'))
+            self.assertEqual(len(response.context['userprofile_list']), size)
+            self.assertContains(response, 'user{0:02d}'.format(size - 1))
+
+    @override_settings(RANGO_PROFILES_PAGE_SIZE=10)
+    def test_cursor_walks_every_profile(self):
+        seen = []
+        cursor = None
+        while True:
+            response = self.client.get(reverse('list_profiles'), {'after': cursor} if cursor else {})
+            seen.extend(p.user.username for p in response.context['userprofile_list'])
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['user{0:02d}'.format(i) for i in range(25)])
+
+    def test_profile_is_one_query(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('profile', args=['user07']))
+        self.assertEqual(response.context['userprofile'].website, 'http://example.com/7')
+
+    def test_profile_created_on_first_view(self):
+        from django.contrib.auth.models import User
+        User.objects.create_user('newcomer', password='secret')
+        response = self.client.get(reverse('profile', args=['newcomer']))
+        self.assertEqual(response.context['userprofile'].user.username, 'newcomer')
+
+
+def jpeg_with_orientation(orientation):
+    """
+    A 200x100 JPEG, red on the left and blue on the right, with an EXIF
+    orientation tag.
+    """
+    import io
+    import struct
+    from PIL import Image
+    image = Image.new('RGB', (200, 100), (0, 0, 255))
+    image.paste((255, 0, 0), (0, 0, 100, 100))
+    tiff = (b'II*\x00\x08\x00\x00\x00\x01\x00' +
+            struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + b'\x00\x00\x00\x00')
+    buf = io.BytesIO()
+    image.save(buf, 'JPEG', exif=b'Exif\x00\x00' + tiff)
+    return buf.getvalue()
+
+
+@override_settings(RANGO_THUMBNAIL_WORKERS=0, RANGO_THUMBNAIL_SIZES=(64, 300))
+class ThumbnailTests(TestCase):
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.contrib.auth.models import User
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = self.settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('leifos', password='secret')
+
+    def open_thumbnail(self, name, size):
+        import io
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        from rango.thumbnails import thumbnail_name
+        with default_storage.open(thumbnail_name(name, size), 'rb') as f:
+            image = Image.open(io.BytesIO(f.read()))
+            image.load()
+        return image
+
+    def test_saving_a_picture_makes_upright_thumbnails_without_exif(self):
+        from django.core.files.base import ContentFile
+        from rango.models import UserProfile
+        profile = UserProfile(user=self.user)
+        profile.picture.save('me.jpg', ContentFile(jpeg_with_orientation(6)))
+        for size in (64, 300):
+            image = self.open_thumbnail(profile.picture.name, size)
+            self.assertEqual(image.size, (size, size))
+            self.assertNotIn('exif', image.info)
+        # Orientation 6 means the camera was turned, so the red left half
+        # of the stored image belongs at the top.
+        image = self.open_thumbnail(profile.picture.name, 64)
+        self.assertGreater(image.getpixel((32, 5))[0], 200)
+        self.assertGreater(image.getpixel((32, 58))[2], 200)
+
+    def test_existing_pictures_fall_back_to_the_original_once(self):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from rango.models import UserProfile
+        name = default_storage.save('profile_images/old.jpg',
+                                    ContentFile(jpeg_with_orientation(1)))
+        UserProfile.objects.filter(id=UserProfile.objects.create(user=self.user).id).update(
+            picture=name)
+        self.client.login(username='leifos', password='secret')
+        response = self.client.get(reverse('profile', args=['leifos']))
+        self.assertContains(response, 'src="/media/profile_images/old.jpg"')
+        response = self.client.get(reverse('profile', args=['leifos']))
+        self.assertContains(response, 'src="/media/profile_images/old.jpg.300x300.jpg"')
+
+    def test_a_new_picture_with_another_extension_gets_its_own_thumbnails(self):
+        import io
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        from rango import thumbnails
+        from rango.models import UserProfile
+        profile = UserProfile(user=self.user)
+        profile.picture.save('me.jpg', ContentFile(jpeg_with_orientation(1)))
+        buf = io.BytesIO()
+        Image.new('RGB', (50, 50), (0, 255, 0)).save(buf, 'PNG')
+        name = default_storage.save('profile_images/me.png', ContentFile(buf.getvalue()))
+        self.assertTrue(thumbnails.missing(name))
+        profile.picture = name
+        profile.save()
+        self.assertFalse(thumbnails.missing(name))
+        self.assertGreater(self.open_thumbnail(name, 64).getpixel((32, 32))[1], 200)
+
+
+class HyperLogLogTests(TestCase):
+
+    def test_estimates_are_close_and_merge_as_a_union(self):
+        from rango.visitor_stats import HyperLogLog
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(20000):
+            first.add('visitor-{0}'.format(i))
+        for i in range(10000, 40000):
+            second.add('visitor-{0}'.format(i))
+        self.assertAlmostEqual(first.count(), 20000, delta=20000 * 0.05)
+        self.assertEqual(len(first.to_bytes()), 4096)
+        union = HyperLogLog(first.to_bytes()).merge(second)
+        self.assertAlmostEqual(union.count(), 40000, delta=40000 * 0.05)
+
+    def test_small_counts_are_exact_enough(self):
+        from rango.visitor_stats import HyperLogLog
+        sketch = HyperLogLog()
+        for i in range(3):
+            sketch.add('visitor-{0}'.format(i))
+            sketch.add('visitor-{0}'.format(i))
+        self.assertEqual(sketch.count(), 3)
+
+
+@override_settings(RANGO_VISITOR_FLUSH_INTERVAL=0, RANGO_VISITOR_STATS_TIMEOUT=0)
+class VisitorStatsTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango import visitor_stats
+        cache.clear()
+        visitor_stats.visitors.reset()
+        self.addCleanup(visitor_stats.visitors.reset)
+
+    def test_index_counts_visitors_without_touching_the_session(self):
+        from rango import visitor_stats
+        response = self.client.get(reverse('index'))
+        self.assertIn(visitor_stats.COOKIE_NAME, response.cookies)
+        self.assertNotIn('sessionid', response.cookies)
+        for i in range(3):
+            self.client.get(reverse('index'))
+        other = self.client_class()
+        other.get(reverse('index'))
+        visitor_stats.visitors.flush()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['visitors_today'], 2)
+        self.assertContains(response, '2 visitors today, 2 this week.')
+
+    def test_workers_and_days_merge(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from rango.models import VisitorSketch
+        from rango.visitor_stats import (VisitorRecorder, compact_before, today,
+                                         unique_visitors)
+        workers = [VisitorRecorder(), VisitorRecorder()]
+        for i in range(100):
+            workers[i % 2].add('visitor-{0}'.format(i))
+            workers[0].add('visitor-{0}'.format(i), day=today() - timedelta(days=3))
+        for i in range(50):
+            workers[1].add('visitor-{0}'.format(i), day=today() - timedelta(days=3))
+        for worker in workers:
+            worker.flush()
+        self.assertEqual(VisitorSketch.objects.filter(day__lt=today()).count(), 2)
+        call_command('compact_visitors', stdout=StringIO())
+        self.assertEqual(VisitorSketch.objects.filter(day__lt=today()).count(), 1)
+        self.assertEqual(VisitorSketch.objects.filter(day=today()).count(), 2)
+        compact_before(today() + timedelta(days=1))
+        self.assertEqual(VisitorSketch.objects.filter(day=today()).count(), 1)
+        self.assertAlmostEqual(unique_visitors(1), 100, delta=3)
+        self.assertAlmostEqual(unique_visitors(7), 100, delta=3)
+
+    def test_stopping_with_nothing_to_write_leaves_the_database_alone(self):
+        from rango.visitor_stats import VisitorRecorder
+        worker = VisitorRecorder()
+        with self.assertNumQueries(0):
+            worker.stop()
+        worker.add('visitor')
+        worker.flush()
+        with self.assertNumQueries(0):
+            self.assertEqual(worker.flush(), 0)
+
+
+def tearDownModule():
+    # Don't leave visits, clicks or likes from the tests to be flushed at
+    # exit, after the test database is gone.
+    from rango import trending, view_counter, visitor_stats
+    visitor_stats.visitors.reset()
+    view_counter.page_views.drain()
+    trending.page_scores.drain()
+    trending.category_scores.drain()
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        from rango import metrics
+        from rango.models import Category
+        metrics.registry.reset()
+        Category.objects.create(name='Python')
+
+    def scrape(self, **headers):
+        return self.client.get(reverse('metrics'), **headers)
+
+    def test_views_are_timed_and_counted(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rango.metrics import registry
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('show_category', args=['python']))
+            self.client.get(reverse('show_category', args=['python']))
+        snapshot = registry.snapshot()
+        histograms = dict((name, rest) for name, labels, *rest in snapshot['histograms']
+                          if labels == [['view', 'show_category']])
+        buckets, counts, total, count = histograms['rango_request_duration_seconds']
+        self.assertEqual(count, 2)
+        buckets, counts, total, count = histograms['rango_request_db_queries']
+        self.assertEqual(total, len(queries))
+        counters = dict(((name, tuple(map(tuple, labels))), value)
+                        for name, labels, value in snapshot['counters'])
+        self.assertGreater(counters[('rango_request_template_seconds_total',
+                                     (('view', 'show_category'),))], 0)
+        self.assertEqual(counters[('rango_requests_total', (('method', 'GET'), ('status', '200'),
+                                                            ('view', 'show_category')))], 2)
+
+    def test_queries_are_counted_without_the_debug_query_log(self):
+        from django.db import connection
+        from rango.metrics import registry
+        self.client.get(reverse('show_category', args=['python']))
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertEqual(len(connection.queries_log), 0)
+        histograms = dict((name, rest) for name, labels, *rest in
+                          registry.snapshot()['histograms']
+                          if labels == [['view', 'show_category']])
+        self.assertGreater(histograms['rango_request_db_queries'][2], 0)
+
+    def test_endpoint_is_protected(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        with self.settings(RANGO_METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            response = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    def test_prometheus_output_adds_up_every_process(self):
+        import json
+        import os
+        import shutil
+        import tempfile
+        from rango import metrics
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        other = metrics.Registry()
+        other.observe('rango_request_duration_seconds', {'view': 'index'}, 0.02,
+                      metrics.LATENCY_BUCKETS)
+        with open(os.path.join(directory, 'rango-metrics-other.json'), 'w') as f:
+            json.dump(other.snapshot(), f)
+        self.client.get(reverse('index'))
+        with self.settings(RANGO_METRICS_DIR=directory, RANGO_METRICS_TOKEN='s3cret'):
+            body = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret').content.decode('utf-8')
+        self.assertIn('# TYPE rango_request_duration_seconds histogram', body)
+        self.assertIn('rango_request_duration_seconds_count{view="index"} 2', body)
+        self.assertIn('rango_request_duration_seconds_bucket{view="index",le="+Inf"} 2', body)
+        self.assertIn('rango_search_cache_events_total{event="hits"}', body)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_percentiles_and_regressions(self):
+        from rango.benchmark import compare, summarize
+        figures = summarize([i / 1000.0 for i in range(1, 101)], errors=1, elapsed=2.0)
+        self.assertEqual((figures['p50_ms'], figures['p95_ms'], figures['p99_ms']),
+                         (50.0, 95.0, 99.0))
+        self.assertEqual(figures['throughput_rps'], 50.0)
+        baseline = {'endpoints': {'index': dict(figures, p95_ms=50.0),
+                                  'goto': dict(figures, throughput_rps=100.0)}}
+        regressions = compare({'endpoints': {'index': figures, 'goto': figures}}, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertEqual(compare({'endpoints': {'index': figures}},
+                                 {'endpoints': {'index': figures}}), [])
+
+    def test_every_endpoint_resolves(self):
+        from django.core.urlresolvers import resolve
+        from rango.benchmark import ENDPOINTS, Dataset
+        dataset = Dataset([1], ['python'], [1], ['leifos'])
+        for name, make_path, needs_login in ENDPOINTS:
+            request = make_path(dataset, 0, 0)
+            path = request if isinstance(request, str) else request[1]
+            self.assertEqual(resolve(path.split('?')[0]).url_name, name)
+
+    @override_settings(RANGO_SEARCH_BACKENDS=['rango.fts_search'])
+    def test_search_is_posted_with_a_csrf_token(self):
+        from rango.benchmark import ENDPOINTS, Dataset, build_request
+        dataset = Dataset([1], ['python'], [1], ['leifos'])
+        make_path = dict((name, make_path) for name, make_path, needs_login in ENDPOINTS)
+        method, path, body, headers = build_request(
+            make_path['search'](dataset, 0, 0), {'Cookie': 'csrftoken=t0ken'}, 't0ken')
+        client = self.client_class(enforce_csrf_checks=True)
+        client.cookies['csrftoken'] = 't0ken'
+        response = client.post(path, body, content_type=headers['Content-Type'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(method, 'POST')
+        self.assertIn('result_list', response.context)
+
+
+class QueryBudgetTests(TestCase):
+
+    def make_view(self, queries, budget):
+        from django.http import HttpResponse
+        from rango.models import Category
+        from rango.query_budget import query_budget
+
+        @query_budget(budget)
+        def view(request):
+            for i in range(queries):
+                list(Category.objects.filter(id=i))
+            return HttpResponse('ok')
+        return view
+
+    def test_over_budget_fails_loudly_when_strict(self):
+        from django.test import RequestFactory
+        from rango.query_budget import QueryBudgetExceeded
+        request = RequestFactory().get('/')
+        self.assertEqual(self.make_view(2, 2)(request).content, b'ok')
+        with self.settings(RANGO_QUERY_BUDGET_STRICT=True):
+            with self.assertRaises(QueryBudgetExceeded) as raised:
+                self.make_view(3, 2)(request)
+        message = str(raised.exception)
+        self.assertIn('view ran 3 queries', message)
+        self.assertIn('rango_category', message)
+        # Each query comes with the line of our code that ran it.
+        self.assertIn('list(Category.objects.filter(id=i))', message)
+
+    def test_over_budget_is_counted_otherwise(self):
+        from django.test import RequestFactory
+        from rango import metrics
+        metrics.registry.reset()
+        with self.settings(RANGO_QUERY_BUDGET_STRICT=False):
+            response = self.make_view(3, 2)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'ok')
+        counters = metrics.registry.snapshot()['counters']
+        self.assertIn(['rango_query_budget_exceeded_total', [['view', 'view']], 1], counters)
+
+    def test_every_view_has_a_budget(self):
+        from rango.urls import urlpatterns
+        for pattern in urlpatterns:
+            self.assertTrue(hasattr(pattern.callback, 'query_budget'), pattern.name)
+
+
+@override_settings(RANGO_PAGE_CACHE_TIMEOUT=60)
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango.models import Category, Page
+        cache.clear()
+        self.category = Category.objects.create(name='Python')
+        Page.objects.create(category=self.category, title='Tutorial', url='http://docs.python.org/')
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        for name in ('index', 'about'):
+            url = reverse(name)
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(first['ETag'], second['ETag'])
+            self.assertNotIn('csrfmiddlewaretoken', second.content.decode('utf-8'))
+
+    def test_pages_with_a_csrf_token_are_not_cached(self):
+        # The category page's search form posts, so every visitor gets
+        # their own token and their own render.
+        url = reverse('show_category', args=['python'])
+        response = self.client.get(url)
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(self.client_class().get(url), 'csrfmiddlewaretoken')
+
+    def test_search_needs_the_csrf_token(self):
+        from django.test import Client
+        url = reverse('show_category', args=['python'])
+        self.assertEqual(Client(enforce_csrf_checks=True).post(url, {'query': ''}).status_code,
+                         403)
+
+    def test_conditional_get(self):
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_changes_retire_cached_pages(self):
+        from rango.models import Page
+        url = reverse('index')
+        etag = self.client.get(url)['ETag']
+        Page.objects.create(category=self.category, title='Cookbook', url='http://example.com/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Cookbook')
+
+    def test_visitors_are_still_counted_on_cached_index(self):
+        from rango import visitor_stats
+        self.client.get(reverse('index'))
+        visitor_stats.visitors.reset()
+        response = self.client_class().get(reverse('index'))
+        self.assertIn(visitor_stats.COOKIE_NAME, response.cookies)
+        self.assertEqual(visitor_stats.visitors.flush(), 1)
+
+    def test_logged_in_users_are_not_cached(self):
+        from django.contrib.auth.models import User
+        User.objects.create_user('leifos', password='secret')
+        self.client.login(username='leifos', password='secret')
+        response = self.client.get(reverse('show_category', args=['python']))
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    # VACUUM INTO, which sync_replicas uses, can't run inside the
+    # transaction a TestCase wraps every test in.
+
+    def setUp(self):
+        import os
+        import shutil
+        import tempfile
+        from django.db import connections
+        from rango import db_router
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'replica.sqlite3')
+        connections.databases['replica_test'] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': self.path}
+        connections.ensure_defaults('replica_test')
+        connections.prepare_test_settings('replica_test')
+        self.addCleanup(self._drop_alias)
+
+        replicas = override_settings(RANGO_DATABASE_REPLICAS=['replica_test'],
+                                     RANGO_REPLICA_HEALTH_INTERVAL=0)
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        db_router.reset_health()
+        self.addCleanup(db_router.unpin)
+
+    def _drop_alias(self):
+        from django.db import connections
+        connections['replica_test'].close()
+        del connections.databases['replica_test']
+        if hasattr(connections._connections, 'replica_test'):
+            delattr(connections._connections, 'replica_test')
+
+    def sync(self):
+        from django.core.management import call_command
+        call_command('sync_replicas', stdout=StringIO())
+
+    def names(self):
+        from rango.models import Category
+        return sorted(Category.objects.values_list('name', flat=True))
+
+    def test_reads_go_to_the_replica_unless_pinned(self):
+        from rango import db_router
+        from rango.models import Category
+        Category.objects.create(name='Python')
+        self.sync()
+        Category.objects.create(name='Perl')
+
+        # Having written, this thread is pinned to the primary.
+        self.assertEqual(self.names(), ['Perl', 'Python'])
+        db_router.unpin()
+        self.assertEqual(self.names(), ['Python'])
+        db_router.pin()
+        self.assertEqual(self.names(), ['Perl', 'Python'])
+
+    def test_writes_set_the_pin_cookie(self):
+        from django.test import RequestFactory
+        from rango import db_router
+        self.sync()
+        response = self.client.post(reverse('add_category'),
+                                    {'name': 'Perl', 'views': 0, 'likes': 0})
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+        self.assertNotIn(db_router.PIN_COOKIE, self.client.get(reverse('about')).cookies)
+
+        middleware = db_router.ReplicaPinningMiddleware()
+        request = RequestFactory().get('/')
+        request.COOKIES[db_router.PIN_COOKIE] = response.cookies[db_router.PIN_COOKIE].value
+        middleware.process_request(request)
+        self.assertTrue(db_router.is_pinned())
+        request.COOKIES[db_router.PIN_COOKIE] = '0'
+        middleware.process_request(request)
+        self.assertFalse(db_router.is_pinned())
+
+    def test_missing_replica_falls_back_to_the_primary(self):
+        import os
+        from rango import db_router
+        from rango.models import Category
+        Category.objects.create(name='Python')
+        db_router.unpin()
+        self.assertEqual(self.names(), ['Python'])
+        self.assertFalse(os.path.exists(self.path))
+
+        self.sync()
+        Category.objects.create(name='Perl')
+        db_router.unpin()
+        self.assertEqual(self.names(), ['Python'])
+        os.remove(self.path)
+        self.assertEqual(self.names(), ['Perl', 'Python'])
+
+    def test_caches_refill_from_the_primary_after_a_write(self):
+        from django.core.cache import cache
+        from rango import db_router, sidebar_cache
+        from rango.leaderboard import category_leaderboard
+        from rango.models import Category
+        cache.clear()
+        Category.objects.create(name='Python')
+        self.sync()
+        # Another client's write: the version is bumped, the replica lags.
+        Category.objects.create(name='Perl', likes=10)
+        db_router.unpin()
+        self.assertEqual(self.names(), ['Python'])
+        self.assertIn('Perl', sidebar_cache.render_category_list())
+        self.assertEqual([row['name'] for row in category_leaderboard.top()],
+                         ['Perl', 'Python'])
+        self.assertFalse(db_router.is_pinned())
+
+    @override_settings(RANGO_QUERY_BUDGET_STRICT=True)
+    def test_index_keeps_its_budget_with_replicas_and_cold_caches(self):
+        # Replica health checks aren't the view's queries, and every cache
+        # the index reads from may have expired at once.
+        from django.contrib.auth.models import User
+        from django.core.cache import cache
+        from rango.models import Category, Page
+        python = Category.objects.create(name='Python', likes=3)
+        Page.objects.create(category=python, title='Docs', url='http://docs.python.org/')
+        self.client.force_login(User.objects.create_user('leifos', password='rango'))
+        self.sync()
+        cache.clear()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Python')
+
+
+@override_settings(RANGO_VIEW_FLUSH_INTERVAL=0)
+class ClickLogTests(TestCase):
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from datetime import datetime
+        from django.utils import timezone
+        from rango import click_log, view_counter
+        from rango.models import Category, Page
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        log_dir = override_settings(RANGO_CLICK_LOG_DIR=self.directory)
+        log_dir.enable()
+        self.addCleanup(log_dir.disable)
+        self.addCleanup(click_log.click_log.close)
+        view_counter.page_views.drain()
+        self.page = Page.objects.create(category=Category.objects.create(name='Python'),
+                                        title='Docs', url='http://docs.python.org/')
+        self.base = datetime(2026, 1, 5, tzinfo=timezone.utc).timestamp()
+
+    def at(self, seconds):
+        from rango import click_log
+        return click_log._datetime(self.base + seconds)
+
+    def test_flushed_views_are_appended_to_the_log(self):
+        import os
+        from django.utils import timezone
+        from datetime import timedelta
+        from rango import click_log, view_counter
+        from rango.models import Page
+
+        for i in range(3):
+            self.client.get(reverse('goto'), {'page_id': self.page.id})
+        view_counter.page_views.flush()
+        self.assertEqual(Page.objects.get(id=self.page.id).views, 3)
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith('.open'))
+        with open(os.path.join(self.directory, names[0])) as f:
+            self.assertTrue(f.read().endswith(' {0} 3\n'.format(self.page.id)))
+
+        # The open segment is left alone.
+        self.assertEqual(click_log.compact(), (0, 0))
+        click_log.click_log.close()
+        self.assertEqual(click_log.compact(), (1, 3))
+        self.assertEqual(os.listdir(self.directory), [])
+        now = timezone.now()
+        self.assertEqual(click_log.page_views_between(
+            self.page.id, now - timedelta(hours=1), now + timedelta(hours=1)), 3)
+
+    @override_settings(RANGO_CLICK_LOG_SEGMENT_SECONDS=0.2)
+    def test_idle_segments_are_sealed_on_time(self):
+        import os
+        import time
+        from rango import click_log
+        log = click_log.click_log
+        log.append({self.page.id: 1})
+        time.sleep(0.5)
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith('.log'))
+
+    def test_appends_survive_compaction_sealing_a_live_segment(self):
+        import os
+        from rango import click_log
+        log = click_log.click_log
+        log.append({self.page.id: 1})
+        # As compact() does with a segment it takes for a dead process's.
+        name = os.listdir(self.directory)[0]
+        os.rename(os.path.join(self.directory, name),
+                  os.path.join(self.directory, name[:-len('.open')] + '.log'))
+        with override_settings(RANGO_CLICK_LOG_SEGMENT_BYTES=1):
+            log.append({self.page.id: 2})
+        log.append({self.page.id: 3})
+        log.close()
+        self.assertEqual(click_log.compact(), (2, 6))
+
+    def test_views_over_a_range(self):
+        from rango import click_log
+        from rango.models import PageViewBucket
+        log = click_log.click_log
+        log.append({self.page.id: 2}, when=self.base + 10)
+        log.append({self.page.id: 3}, when=self.base + 5 * click_log.HOUR)
+        log.append({self.page.id: 4}, when=self.base + click_log.DAY + 1800)
+        log.append({self.page.id: 5}, when=self.base + 2 * click_log.DAY + 23 * click_log.HOUR)
+        log.close()
+        self.assertEqual(click_log.compact(now=self.base + 3 * click_log.DAY), (1, 14))
+        self.assertEqual(PageViewBucket.objects.filter(resolution=PageViewBucket.HOUR).count(), 4)
+        self.assertEqual(PageViewBucket.objects.filter(resolution=PageViewBucket.DAY).count(), 3)
+
+        with self.assertNumQueries(1):
+            total = click_log.page_views_between(self.page.id, self.at(0),
+                                                 self.at(3 * click_log.DAY))
+        self.assertEqual(total, 14)
+        self.assertEqual(click_log.page_views_between(
+            self.page.id, self.at(click_log.HOUR), self.at(3 * click_log.DAY)), 12)
+        # Rounded out to 05:00 on the first day and 01:00 on the second.
+        self.assertEqual(click_log.page_views_between(
+            self.page.id, self.at(5 * click_log.HOUR + 3540), self.at(click_log.DAY + 60)), 7)
+        self.assertEqual(click_log.page_views_between(
+            self.page.id, self.at(6 * click_log.HOUR), self.at(click_log.DAY)), 0)
+
+    def test_a_segment_is_only_counted_once(self):
+        import os
+        from rango import click_log
+        from rango.models import PageViewBucket
+        click_log.click_log.append({self.page.id: 2}, when=self.base)
+        click_log.click_log.close()
+        name = os.listdir(self.directory)[0]
+        with open(os.path.join(self.directory, name)) as f:
+            contents = f.read()
+        click_log.compact(now=self.base)
+
+        # As if the last run had stopped before deleting the file.
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(contents)
+        self.assertEqual(click_log.compact(now=self.base), (0, 0))
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(PageViewBucket.objects.get(resolution=PageViewBucket.DAY).views, 2)
+
+    def test_hourly_buckets_expire(self):
+        from rango import click_log
+        from rango.models import PageViewBucket
+        click_log.click_log.append({self.page.id: 2}, when=self.base + click_log.HOUR)
+        click_log.click_log.close()
+        click_log.compact(now=self.base + 15 * click_log.DAY)
+        self.assertEqual(list(PageViewBucket.objects.values_list('resolution', flat=True)),
+                         [PageViewBucket.DAY])
+        self.assertEqual(click_log.page_views_between(
+            self.page.id, self.at(0), self.at(click_log.DAY)), 2)
+
+    def test_segment_left_open_by_a_dead_process_is_compacted(self):
+        import os
+        import time
+        from rango import click_log
+        name = 'clicks-{0}-1-1.open'.format(int(time.time()) - 3600)
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write('{0} {1} 4\n{0} {1}'.format(int(time.time()) - 3600, self.page.id))
+        self.assertEqual(click_log.compact(), (1, 4))
+
+
+@override_settings(RANGO_TRENDING_HALF_LIFE=3600, RANGO_TRENDING_MIN_HEAT=0.5,
+                   RANGO_LIKE_COALESCE_WINDOW=0)
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        import time
+        from rango import trending
+        from rango.models import Category, Page
+        trending.page_scores.drain()
+        trending.category_scores.drain()
+        self.now = time.time()
+        self.python = Category.objects.create(name='Python')
+        self.perl = Category.objects.create(name='Perl')
+        self.old = Page.objects.create(category=self.python, title='Old', url='http://a.com/')
+        self.new = Page.objects.create(category=self.perl, title='New', url='http://b.com/')
+
+    def test_scores_decay_by_the_half_life(self):
+        from rango import trending
+        score = trending.event_score(self.now)
+        score = trending.logaddexp(score, trending.event_score(self.now - 3600))
+        score = trending.logaddexp(score, trending.event_score(self.now - 7200))
+        self.assertAlmostEqual(trending.heat(score, self.now), 1.75)
+        self.assertAlmostEqual(trending.heat(score, self.now + 3600), 0.875)
+        self.assertEqual(trending.heat(None), 0.0)
+
+    def test_recent_clicks_outrank_old_ones(self):
+        from rango import trending
+        for i in range(16):
+            trending.record_click(self.old.id, self.python.id, when=self.now - 3 * 3600)
+        for i in range(3):
+            trending.record_click(self.new.id, self.perl.id, when=self.now)
+        # Flushing reports the rows it updated.
+        self.assertEqual(trending.page_scores.flush(), 2)
+        trending.flush()
+        with self.assertNumQueries(1):
+            pages = trending.top_pages(5, now=self.now)
+        self.assertEqual([(p['title'], round(p['heat'], 6)) for p in pages],
+                         [('New', 3.0), ('Old', 2.0)])
+        self.assertEqual([c['name'] for c in trending.top_categories(5, now=self.now)],
+                         ['Perl', 'Python'])
+        # Five and a half hours on, the old clicks add up to less than half
+        # a click and drop off the list.
+        self.assertEqual([p['title'] for p in trending.top_pages(5, now=self.now + 9000)],
+                         ['New'])
+
+    def test_flushes_add_to_the_stored_score(self):
+        from rango import trending
+        from rango.models import Page
+        trending.record_click(self.new.id, self.perl.id, when=self.now)
+        trending.flush()
+        trending.record_click(self.new.id, self.perl.id, when=self.now)
+        self.assertEqual(len(trending.page_scores.pending()), 1)
+        trending.flush()
+        score = Page.objects.get(id=self.new.id).trending_score
+        self.assertAlmostEqual(trending.heat(score, self.now), 2.0)
+
+    def test_flush_of_more_rows_than_sqlite_parameters(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from rango import trending
+        from rango.models import Page
+        Page.objects.bulk_create([
+            Page(category=self.python, title='Page {0}'.format(i),
+                 url='http://example.com/{0}/'.format(i)) for i in range(1200)])
+        for page_id in Page.objects.values_list('id', flat=True):
+            trending.page_scores.add(page_id, trending.event_score(self.now))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(trending.page_scores.flush(), 1202)
+        self.assertEqual(Page.objects.filter(trending_score__isnull=True).count(), 0)
+        reads = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and ' IN (' in q['sql']]
+        self.assertEqual(len(reads), 7)
+
+    def test_goto_and_likes_are_counted(self):
+        from django.contrib.auth.models import User
+        from rango import trending
+        User.objects.create_user('leifos', password='secret')
+        self.client.login(username='leifos', password='secret')
+        self.client.get(reverse('goto'), {'page_id': self.old.id})
+        self.client.get(reverse('like_category'), {'category_id': self.perl.id})
+        self.client.get(reverse('like_category'), {'category_id': self.perl.id})
+        trending.flush()
+        self.assertEqual([p['title'] for p in trending.top_pages()], ['Old'])
+        self.assertEqual([c['name'] for c in trending.top_categories()], ['Perl', 'Python'])
+
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Trending Pages')
+        self.assertEqual([c['name'] for c in response.context['trending_categories']],
+                         ['Perl', 'Python'])
+
+
+class AddPagesTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rango.models import Category, Page
+        self.category = Category.objects.create(name='Python')
+        Page.objects.create(category=self.category, title='Docs', url='http://docs.python.org/')
+        User.objects.create_user('leifos', password='secret')
+        self.client.login(username='leifos', password='secret')
+
+    def post(self, pairs, **extra):
+        return self.client.post(reverse('add_pages'), {
+            'category_id': self.category.id,
+            'title': [title for title, url in pairs],
+            'url': [url for title, url in pairs]}, **extra)
+
+    def test_adds_only_new_pages(self):
+        from rango import fts_search
+        from rango.models import Page
+        response = self.post([('Docs', 'http://docs.python.org/'),
+                              ('PyPI', 'https://pypi.org/'),
+                              ('PyPI', 'https://pypi.org/'),
+                              ('Broken', 'not a url'),
+                              ('Planet', 'http://planetpython.org/')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([page.title for page in response.context['pages']], ['PyPI', 'Planet'])
+        content = response.content.decode('utf-8')
+        self.assertEqual(content.count('<li>'), 2)
+        self.assertNotIn('Docs', content)
+        self.assertEqual(sorted(Page.objects.values_list('title', flat=True)),
+                         ['Docs', 'Planet', 'PyPI'])
+        self.assertEqual([r['title'] for r in fts_search.run_query('planetpython')], ['Planet'])
+
+    def test_json_response(self):
+        response = self.post([('Docs', 'http://docs.python.org/'), ('PyPI', 'https://pypi.org/')],
+                             HTTP_ACCEPT='application/json')
+        data = response.json()
+        self.assertEqual([page['title'] for page in data['added']], ['PyPI'])
+        self.assertEqual(data['skipped'], 1)
+        # Sending the same batch again adds nothing.
+        data = self.post([('PyPI', 'https://pypi.org/')], HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data, {'added': [], 'skipped': 1})
+
+    def test_bad_requests(self):
+        from rango import views_ajax
+        self.assertEqual(self.client.get(reverse('add_pages')).status_code, 405)
+        self.assertEqual(self.client.post(reverse('add_pages'), {
+            'category_id': 999, 'title': ['PyPI'], 'url': ['https://pypi.org/']}).status_code, 404)
+        self.assertEqual(self.client.post(reverse('add_pages'), {
+            'category_id': self.category.id, 'title': ['PyPI']}).status_code, 400)
+        too_many = [('Page', 'http://example.com/')] * (views_ajax.MAX_ADD_PAGES + 1)
+        self.assertEqual(self.post(too_many).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.post([('PyPI', 'https://pypi.org/')]).status_code, 302)
+
+
+@override_settings(RANGO_LIKE_COALESCE_WINDOW=0, RANGO_CATEGORY_PAGE_SIZE=2,
+                   RANGO_API_SUGGEST_MAX_AGE=60, RANGO_API_PAGES_MAX_AGE=30)
+class ApiTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from rango import like_counter
+        from rango.models import Category, Page
+        from rango.suggest_index import category_index
+        category_index.reset()
+        like_counter.category_likes.forget()
+        self.category = Category.objects.create(name='Python', likes=3)
+        Category.objects.create(name='Perl', likes=1)
+        for views in (5, 4, 3):
+            Page.objects.create(category=self.category, title='Page {0}'.format(views),
+                                url='http://example.com/{0}/'.format(views), views=views)
+        User.objects.create_user('leifos', password='secret')
+
+    def test_suggest(self):
+        response = self.client.get(reverse('api_suggest_categories'), {'q': 'p'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertNotIn(b' ', response.content)
+        self.assertEqual([(c['name'], c['likes']) for c in response.json()['categories']],
+                         [('Python', 3), ('Perl', 1)])
+        self.assertEqual(self.client.get(reverse('api_suggest_categories')).json(),
+                         {'categories': []})
+
+    def test_page_slices(self):
+        url = reverse('api_category_pages', args=[self.category.id])
+        data = self.client.get(url).json()
+        self.assertEqual([page['views'] for page in data['pages']], [5, 4])
+        response = self.client.get(url, {'cursor': data['next']})
+        self.assertIn('max-age=30', response['Cache-Control'])
+        self.assertEqual(response.json()['pages'][0]['title'], 'Page 3')
+        self.assertIsNone(response.json()['next'])
+        self.assertEqual(self.client.get(reverse('api_category_pages', args=[999])).status_code,
+                         404)
+
+    def test_writes_need_a_login(self):
+        url = reverse('api_like_category', args=[self.category.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('error', response.json())
+        response = self.client.post(reverse('api_category_pages', args=[self.category.id]),
+                                    {'title': 'PyPI', 'url': 'https://pypi.org/'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_like_and_add_pages(self):
+        self.client.login(username='leifos', password='secret')
+        response = self.client.post(reverse('api_like_category', args=[self.category.id]))
+        self.assertEqual(response.json(), {'likes': 4})
+        self.assertEqual(self.client.post(reverse('api_like_category', args=[999])).status_code,
+                         404)
+        response = self.client.post(reverse('api_category_pages', args=[self.category.id]), {
+            'title': ['Page 5', 'PyPI'],
+            'url': ['http://example.com/5/', 'https://pypi.org/']})
+        data = response.json()
+        self.assertEqual([page['title'] for page in data['added']], ['PyPI'])
+        self.assertEqual(data['skipped'], 1)
+        self.assertNotIn('Cache-Control', response)
+
+    def test_benchmark_pairs(self):
+        from django.core.urlresolvers import resolve
+        from rango.benchmark import FORMAT_PAIRS, Dataset, run_in_process
+        self.client.login(username='leifos', password='secret')
+        dataset = Dataset([self.category.id], ['python'], [1], ['leifos'])
+        names = set()
+        for name, make_request, needs_login in FORMAT_PAIRS:
+            method, path, data = make_request(dataset, 0)
+            names.add(resolve(path).url_name)
+            figures = run_in_process(self.client, make_request, dataset, 2)
+            self.assertEqual(figures['errors'], 0, name)
+            self.assertGreater(figures['mean_bytes'], 0, name)
+        self.assertEqual(names, {'suggest_category', 'api_suggest_categories', 'more_pages',
+                                 'api_category_pages', 'like_category', 'api_like_category',
+                                 'auto_add_page'})
+
+
+@override_settings(RANGO_THROTTLE_RATES={'suggest_category': (3, 30),
+                                         'show_category:POST': (2, 60),
+                                         'api_suggest_categories': (1, 60)})
+class ThrottleTests(TestCase):
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rango import metrics
+        from rango.models import Category
+        cache.clear()
+        metrics.registry.reset()
+        Category.objects.create(name='Python')
+
+    def suggest(self, **extra):
+        return self.client.get(reverse('suggest_category'), {'suggestion': 'py'}, **extra)
+
+    def test_bursts_then_429(self):
+        from rango import metrics
+        for i in range(3):
+            self.assertEqual(self.suggest().status_code, 200)
+        response = self.suggest()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        # Another address has its own bucket.
+        self.assertEqual(self.suggest(REMOTE_ADDR='10.0.0.2').status_code, 200)
+        counters = metrics.registry.snapshot()['counters']
+        self.assertIn(['rango_throttled_requests_total', [['view', 'suggest_category']], 1],
+                      counters)
+
+    def test_logged_in_users_have_their_own_bucket(self):
+        from django.contrib.auth.models import User
+        for i in range(3):
+            self.suggest()
+        self.assertEqual(self.suggest().status_code, 429)
+        User.objects.create_user('leifos', password='secret')
+        self.client.login(username='leifos', password='secret')
+        self.assertEqual(self.suggest().status_code, 200)
+
+    def test_only_the_configured_method_is_throttled(self):
+        url = reverse('show_category', args=['python'])
+        for i in range(5):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for i in range(2):
+            self.assertEqual(self.client.post(url, {'query': ''}).status_code, 200)
+        self.assertEqual(self.client.post(url, {'query': ''}).status_code, 429)
+
+    def test_api_gets_a_json_error(self):
+        url = reverse('api_suggest_categories')
+        self.client.get(url, {'q': 'py'})
+        response = self.client.get(url, {'q': 'py'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertIn('error', response.json())
+
+    def test_bucket_refills(self):
+        from rango.throttle import TokenBucket
+        bucket = TokenBucket('rango:throttle:test', 2, 10)
+        self.assertEqual([bucket.take(now=100), bucket.take(now=100)], [0, 0])
+        self.assertAlmostEqual(bucket.take(now=101), 4.0)
+        self.assertEqual(bucket.take(now=105), 0)
+        self.assertAlmostEqual(bucket.take(now=105), 5.0)
+
+    def test_racing_requests_never_share_a_token(self):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from unittest import mock
+        from django.core.cache.backends.locmem import LocMemCache
+        from rango.throttle import TokenBucket
+        get = LocMemCache.get
+
+        def slow_get(cache, *args, **kwargs):
+            # Give the other requests time to read the same state.
+            value = get(cache, *args, **kwargs)
+            time.sleep(0.01)
+            return value
+
+        with mock.patch.object(LocMemCache, 'get', slow_get), \
+                ThreadPoolExecutor(max_workers=10) as pool:
+            waits = list(pool.map(
+                lambda i: TokenBucket('rango:throttle:race', 5, 60).take(now=100), range(40)))
+        self.assertEqual(waits.count(0), 5)
+
+    def test_requests_go_through_when_the_cache_is_down(self):
+        from django.conf import settings
+        from rango.throttle import TokenBucket
+        caches = dict(settings.CACHES, down={
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+        with self.settings(CACHES=caches, RANGO_THROTTLE_CACHE_ALIAS='down'):
+            bucket = TokenBucket('rango:throttle:test', 1, 10)
+            self.assertEqual([bucket.take(now=100), bucket.take(now=100)], [0, 0])
@@ -0,0 +1,140 @@
+"""
+Token-bucket throttling of the views that call paid search APIs or are hit
+on every keystroke.
+
+RANGO_THROTTLE_RATES maps URL names from rango/urls.py to (requests,
+seconds): each client may make a burst of up to that many requests, and
+gets them back at requests / seconds per second. A name can carry an HTTP
+method, as in 'show_category:POST', to throttle only the searches on the
+category page and not the page itself; 'name:METHOD' wins over a plain
+'name'.
+
+A client is the logged-in user if there is one, otherwise the remote IP
+address, so clearing cookies doesn't reset anything. Buckets live in the
+cache named by RANGO_THROTTLE_CACHE_ALIAS, which has to be shared by every
+worker process (as the default Memcached one is) for a client to get its
+rate once rather than once per worker. See TokenBucket for how tokens are
+taken atomically; idle clients cost nothing.
+
+Throttled requests get a 429 with Retry-After (a JSON error for the API)
+and are counted in rango_throttled_requests_total.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+from rango import metrics
+
+DEFAULT_CACHE_ALIAS = 'default'
+ORIGIN_TIMEOUT = 24 * 60 * 60
+
+
+def rates():
+    return getattr(settings, 'RANGO_THROTTLE_RATES', {})
+
+
+def rate_for(url_name, method):
+    """
+    Returns (the matching RANGO_THROTTLE_RATES key, its rate), or None.
+    """
+    configured = rates()
+    for name in ('{0}:{1}'.format(url_name, method), url_name):
+        if name in configured:
+            return name, configured[name]
+    return None
+
+
+def client_id(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated():
+        return 'user:{0}'.format(user.pk)
+    return 'ip:{0}'.format(request.META.get('REMOTE_ADDR', ''))
+
+
+class TokenBucket(object):
+    """
+    requests tokens, earned back at requests / seconds per second.
+
+    Time from the bucket's first use is cut into slots of seconds /
+    requests, slot n standing for the token earned as it starts. Taking a
+    token claims one of the last requests slots with cache.add(), which only
+    one of any number of racing requests can win, in whichever process, so
+    a token is never handed out twice. Only the last requests slots count,
+    so an idle client saves up no more than a full bucket.
+    """
+
+    def __init__(self, key, requests, seconds):
+        self.key = key
+        self.capacity = int(requests)
+        self.interval = float(seconds) / requests
+        # Long enough for a slot to leave the window first.
+        self.timeout = int(math.ceil(seconds)) + 1
+
+    def _cache(self):
+        return caches[getattr(settings, 'RANGO_THROTTLE_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)]
+
+    def _origin(self, cache, now):
+        key = self.key + ':origin'
+        origin = cache.get(key)
+        if origin is None:
+            # Whichever racing request adds it first sets the grid for all.
+            # It expires after a day, which refills the bucket early once.
+            cache.add(key, now, ORIGIN_TIMEOUT)
+            origin = cache.get(key, now)
+        return origin
+
+    def take(self, now=None):
+        """
+        Takes a token if there is one. Returns 0 if it did, otherwise the
+        number of seconds until there will be one.
+        """
+        now = time.time() if now is None else now
+        cache = self._cache()
+        origin = self._origin(cache, now)
+        current = int(math.floor((now - origin) / self.interval))
+        slots = ['{0}:{1}'.format(self.key, n)
+                 for n in range(current - self.capacity + 1, current + 1)]
+        claimed = cache.get_many(slots)
+        free = [slot for slot in slots if slot not in claimed]
+        for slot in free:
+            if cache.add(slot, 1, self.timeout):
+                return 0
+        if free and len(cache.get_many(free)) < len(free):
+            # Adds that fail with the slots still free mean the cache is
+            # down; let the request through rather than refuse everyone.
+            return 0
+        return origin + (current + 1) * self.interval - now
+
+
+def too_many_requests(url_name, wait):
+    retry_after = int(math.ceil(wait))
+    message = 'Too many requests; try again in {0} second{1}.'.format(
+        retry_after, '' if retry_after == 1 else 's')
+    if url_name.startswith('api_'):
+        response = JsonResponse({'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+class ThrottleMiddleware(object):
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        if not url_name:
+            return None
+        found = rate_for(url_name, request.method)
+        if found is None:
+            return None
+        name, (requests, seconds) = found
+        key = 'rango:throttle:{0}:{1}'.format(name, client_id(request))
+        wait = TokenBucket(key, requests, seconds).take()
+        if not wait:
+            return None
+        metrics.registry.inc('rango_throttled_requests_total', {'view': url_name})
+        return too_many_requests(url_name, wait)
@@ -0,0 +1,171 @@
+"""
+Fixed-size thumbnails of UserProfile pictures.
+
+Profile pages used to serve whatever full-size image was uploaded. Each
+picture now gets a square JPEG derivative for every size in
+RANGO_THUMBNAIL_SIZES, stored next to the original:
+
+    profile_images/me.png -> profile_images/me.png.64x64.jpg, profile_images/me.png.300x300.jpg
+
+The original's extension stays in the name, so a new me.jpg doesn't find
+the thumbnails of an old me.png and take them for its own.
+
+The derivatives are cropped to fill the square, turned upright according to
+the EXIF orientation tag and written without any EXIF data (which can hold
+the camera's GPS position).
+
+They are generated on a small thread pool (RANGO_THUMBNAIL_WORKERS threads)
+as soon as a profile is saved, so the upload request doesn't wait on Pillow.
+Pictures uploaded before thumbnails existed are handled lazily: the
+thumbnail_url template filter serves the original and queues the
+thumbnails the first time one is missing. Setting RANGO_THUMBNAIL_WORKERS to
+0 makes generation synchronous.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (64, 300)
+DEFAULT_WORKERS = 2
+QUALITY = 85
+
+EXIF_ORIENTATION = 0x0112
+# EXIF orientation -> the transposes that make the image upright.
+ORIENTATIONS = {
+    2: (Image.FLIP_LEFT_RIGHT,),
+    3: (Image.ROTATE_180,),
+    4: (Image.FLIP_TOP_BOTTOM,),
+    5: (Image.TRANSPOSE,),
+    6: (Image.ROTATE_270,),
+    7: (Image.TRANSPOSE, Image.ROTATE_180),
+    8: (Image.ROTATE_90,),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_queued = set()
+_ready = set()
+_failed = set()
+
+
+def sizes():
+    return getattr(settings, 'RANGO_THUMBNAIL_SIZES', DEFAULT_SIZES)
+
+
+def workers():
+    return getattr(settings, 'RANGO_THUMBNAIL_WORKERS', DEFAULT_WORKERS)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers())
+        return _executor
+
+
+def thumbnail_name(name, size):
+    return '{0}.{1}x{1}.jpg'.format(name, size)
+
+
+def _upright(image):
+    try:
+        exif = image._getexif() or {}
+    except (AttributeError, IndexError, KeyError, SyntaxError, ValueError):
+        exif = {}
+    for method in ORIENTATIONS.get(exif.get(EXIF_ORIENTATION), ()):
+        image = image.transpose(method)
+    return image
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; put transparent pictures on white.
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        return background
+    return image.convert('RGB')
+
+
+def generate(name):
+    """
+    Writes every thumbnail of the stored image name, replacing old ones.
+    """
+    with default_storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = _flatten(_upright(image))
+
+    for size in sizes():
+        thumbnail = ImageOps.fit(image, (size, size), Image.ANTIALIAS)
+        buf = io.BytesIO()
+        # Saving a new image without passing exif= drops the EXIF data.
+        thumbnail.save(buf, 'JPEG', quality=QUALITY, optimize=True)
+        target = thumbnail_name(name, size)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(buf.getvalue()))
+        _ready.add(target)
+
+
+def _run(name):
+    try:
+        generate(name)
+    except Exception:
+        # Don't keep retrying a broken picture on every page view.
+        _failed.add(name)
+        logger.exception("Could not make thumbnails of %s", name)
+    finally:
+        with _executor_lock:
+            _queued.discard(name)
+
+
+def schedule(name):
+    """
+    Queues thumbnail generation for the stored image name, unless it is
+    already queued.
+    """
+    with _executor_lock:
+        if name in _queued:
+            return
+        _queued.add(name)
+    _failed.discard(name)
+    for size in sizes():
+        _ready.discard(thumbnail_name(name, size))
+    if workers():
+        get_executor().submit(_run, name)
+    else:
+        _run(name)
+
+
+def missing(name):
+    """
+    True if any thumbnail of the stored image name hasn't been made.
+    """
+    return not all(default_storage.exists(thumbnail_name(name, size)) for size in sizes())
+
+
+def thumbnail_url(picture, size):
+    """
+    Returns the URL of the size x size thumbnail of an ImageField file, or
+    of the original (queueing the thumbnails) if it hasn't been made yet.
+    """
+    name = picture.name
+    target = thumbnail_name(name, size)
+    if target in _ready:
+        return default_storage.url(target)
+    if default_storage.exists(target):
+        _ready.add(target)
+        return default_storage.url(target)
+    if name not in _failed:
+        schedule(name)
+    return picture.url
@@ -0,0 +1,170 @@
+"""
+Trending pages and categories, ranked by exponentially decayed activity.
+
+An event (a click on a page, a like for a category) that happened t seconds
+ago is worth 2 ** (-t / RANGO_TRENDING_HALF_LIFE) of one that is happening
+now. Decaying every stored score as time passes would mean rewriting every
+row, so scores are kept the other way round ("forward decay"): an event at
+time t adds 2 ** ((t - EPOCH) / half-life) to its row, a weight that grows
+with time instead of the old ones shrinking. All rows would be divided by
+the same factor to decay them to the present, so the order doesn't change
+and the highest stored score is the most trending row at any moment.
+
+Those weights overflow a float within days, so the score column holds
+their logarithm, and adding an event is a log-sum-exp:
+
+    score = logaddexp(score, rate * (t - EPOCH))
+
+which is O(1) and exact, with no periodic rescoring. top_pages() and
+top_categories() are an indexed ORDER BY trending_score DESC, and heat()
+turns a score back into "events at full weight right now".
+
+Events are buffered and written out with the view counter's
+WriteBehindCounter, merging each id's buffered events with logaddexp too.
+Clicks count towards both the page and its category; likes towards the
+category. Changing the half-life changes the scale of the scores, so clear
+the trending_score columns when you do.
+"""
+import atexit
+import math
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from rango.view_counter import WriteBehindCounter
+
+# 2015-01-01T00:00:00Z; any fixed time before the first event will do.
+EPOCH = 1420070400
+DEFAULT_HALF_LIFE = 3600
+DEFAULT_MIN_HEAT = 0.5
+MAX_RETRIES = 5
+# Ids per query, to stay inside SQLite's limit on query parameters.
+CHUNK = 200
+
+
+def half_life():
+    return getattr(settings, 'RANGO_TRENDING_HALF_LIFE', DEFAULT_HALF_LIFE)
+
+
+def rate():
+    return math.log(2) / half_life()
+
+
+def logaddexp(a, b):
+    """
+    log(exp(a) + exp(b)) without overflow; None stands for no events.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def event_score(when=None, weight=1):
+    when = time.time() if when is None else when
+    return rate() * (when - EPOCH) + math.log(weight)
+
+
+def heat(score, now=None):
+    """
+    The score decayed to now: how many events happening right now it is
+    worth.
+    """
+    if score is None:
+        return 0.0
+    return math.exp(score - event_score(now))
+
+
+class TrendingScores(WriteBehindCounter):
+    """
+    Buffered log-space scores keyed by id.
+    """
+
+    def combine(self, pending, score):
+        return logaddexp(pending, score)
+
+    def written(self, pending):
+        # The scores are logarithms, so adding them up means nothing; count
+        # the rows instead.
+        return len(pending)
+
+
+def _write_scores(model, scores):
+    """
+    Adds {id: log-space score} to the rows' trending_score. Each row is
+    updated only if it still holds the score just read, so concurrent
+    flushes from other processes aren't lost.
+    """
+    row_ids = list(scores)
+    with transaction.atomic():
+        for i in range(0, len(row_ids), CHUNK):
+            chunk = row_ids[i:i + CHUNK]
+            current = dict(model.objects.filter(id__in=chunk)
+                           .values_list('id', 'trending_score'))
+            for row_id in chunk:
+                if row_id not in current:
+                    continue
+                old = current[row_id]
+                for attempt in range(MAX_RETRIES):
+                    if model.objects.filter(id=row_id, trending_score=old).update(
+                            trending_score=logaddexp(old, scores[row_id])):
+                        break
+                    old = model.objects.values_list('trending_score', flat=True).get(id=row_id)
+
+
+def write_page_scores(scores):
+    from rango.models import Page
+    _write_scores(Page, scores)
+
+
+def write_category_scores(scores):
+    from rango.models import Category
+    _write_scores(Category, scores)
+
+
+page_scores = TrendingScores(write_page_scores, 'RANGO_TRENDING_FLUSH_INTERVAL')
+category_scores = TrendingScores(write_category_scores, 'RANGO_TRENDING_FLUSH_INTERVAL')
+atexit.register(page_scores.stop)
+atexit.register(category_scores.stop)
+
+
+def record_click(page_id, category_id, when=None):
+    score = event_score(when)
+    page_scores.add(page_id, score)
+    category_scores.add(category_id, score)
+
+
+def record_like(category_id, when=None):
+    category_scores.add(category_id, event_score(when))
+
+
+def flush():
+    page_scores.flush()
+    category_scores.flush()
+
+
+def _top(queryset, fields, k, now):
+    """
+    The k rows with the highest scores, if hot enough, most trending first,
+    each a dictionary of fields plus its heat.
+    """
+    min_heat = getattr(settings, 'RANGO_TRENDING_MIN_HEAT', DEFAULT_MIN_HEAT)
+    threshold = event_score(now, min_heat)
+    rows = list(queryset.filter(trending_score__gte=threshold)
+                .order_by('-trending_score', '-id').values('trending_score', *fields)[:k])
+    for row in rows:
+        row['heat'] = heat(row.pop('trending_score'), now)
+    return rows
+
+
+def top_pages(k=5, now=None):
+    from rango.models import Page
+    return _top(Page.objects.all(), ('id', 'title'), k, now)
+
+
+def top_categories(k=5, now=None):
+    from rango.models import Category
+    return _top(Category.objects.all(), ('id', 'name', 'slug'), k, now)
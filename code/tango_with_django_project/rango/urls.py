@@ -1,5 +1,5 @@
 from django.conf.urls import url
-from rango import views, views_ajax
+from rango import api, views, views_ajax
 
 urlpatterns = [
     url(r'^$', views.index, name='index'),
@@ -9,10 +9,19 @@ urlpatterns = [
     url(r'^category/(?P<category_name_slug>[\w\-]+)/add_page/$', views.add_page, name='add_page'),
     url(r'search/$', views.search, name='search'),
     url(r'goto/$', views.track_url, name='goto'),
-    url(r'like/$', views_ajax.like_category, name='like_category'),
+    url(r'^like/$', views_ajax.like_category, name='like_category'),
     url(r'^suggest/$', views_ajax.suggest_category, name='suggest_category'),
     url(r'^add/$', views_ajax.auto_add_page, name='auto_add_page'),
+    url(r'^add_pages/$', views_ajax.add_pages, name='add_pages'),
+    url(r'^more/$', views_ajax.more_pages, name='more_pages'),
     url(r'^register_profile/$', views.register_profile, name='register_profile'),
     url(r'^profile/(?P<username>[\w\-]+)/$', views.profile, name='profile'),
     url(r'^profiles/$', views.list_profiles, name='list_profiles'),
+    url(r'^export/(?P<fmt>ndjson|csv)/$', views.export_catalog, name='export_catalog'),
+    url(r'^metrics/$', views.export_metrics, name='metrics'),
+    url(r'^api/v1/categories/suggest/$', api.suggest_categories, name='api_suggest_categories'),
+    url(r'^api/v1/categories/(?P<category_id>\d+)/pages/$', api.category_pages,
+        name='api_category_pages'),
+    url(r'^api/v1/categories/(?P<category_id>\d+)/like/$', api.like_category,
+        name='api_like_category'),
 ]
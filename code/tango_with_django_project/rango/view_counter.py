@@ -0,0 +1,177 @@
+"""
+Write-behind buffering for Page view counts.
+
+Every click through /rango/goto/ used to do a read-modify-write save() on the
+page row. Instead, clicks are now added to an in-process buffer and a
+background thread writes them out every RANGO_VIEW_FLUSH_INTERVAL seconds as
+a handful of UPDATE ... SET views = views + n statements. Because the UPDATEs
+are relative (F expressions), several worker processes can flush their own
+buffers without losing each other's increments.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from rango.click_log import click_log
+from rango.leaderboard import page_leaderboard
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5
+# Ids per query, to stay inside SQLite's limit on query parameters.
+CHUNK = 200
+
+
+class WriteBehindCounter(object):
+    """
+    A thread-safe buffer of integer increments keyed by id.
+
+    write is called with a dict of {key: amount} whenever the buffer is
+    flushed. If it raises, the amounts are merged back into the buffer so
+    the next flush can retry them.
+
+    Amounts for the same key are merged with combine(), which adds them;
+    subclasses can buffer other kinds of value by overriding it, and
+    written() to say what flush() should report for them.
+    """
+
+    def __init__(self, write, interval_setting='RANGO_VIEW_FLUSH_INTERVAL'):
+        self._write = write
+        self._interval_setting = interval_setting
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def interval(self):
+        return getattr(settings, self._interval_setting, DEFAULT_FLUSH_INTERVAL)
+
+    def combine(self, pending, amount):
+        return pending + amount
+
+    def written(self, pending):
+        return sum(pending.values())
+
+    def _merge(self, key, amount):
+        pending = self._pending.get(key)
+        self._pending[key] = amount if pending is None else self.combine(pending, amount)
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._merge(key, amount)
+        self._ensure_flusher()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def flush(self):
+        """
+        Writes out everything buffered so far.
+        Returns written() of what was written: the total of the increments.
+        """
+        pending = self.drain()
+        if not pending:
+            return 0
+        try:
+            self._write(pending)
+        except Exception:
+            with self._lock:
+                for key, amount in pending.items():
+                    self._merge(key, amount)
+            raise
+        return self.written(pending)
+
+    def stop(self):
+        """
+        Stops the background flusher (if any) and flushes what is left.
+        Registered with atexit so a clean shutdown does not drop clicks.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush buffered counts on shutdown")
+
+    def _ensure_flusher(self):
+        # An interval of 0 (or None) disables the background thread;
+        # the buffer is then only written out by explicit calls to flush().
+        if self._thread is not None or not self.interval():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run,
+                                                name='rango-write-behind')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval() or DEFAULT_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing buffered counts failed, will retry")
+            finally:
+                # The flusher thread owns its own connection; don't keep it open
+                # between flushes.
+                connection.close()
+
+
+def write_page_views(counts):
+    """
+    Applies {page_id: clicks} to the database, one UPDATE per distinct
+    increment (and CHUNK pages) so that the common case (+1 on many pages)
+    takes a handful of queries.
+    """
+    from rango.models import Page
+
+    by_amount = defaultdict(list)
+    for page_id, amount in counts.items():
+        by_amount[amount].append(page_id)
+
+    with transaction.atomic():
+        for amount, page_ids in by_amount.items():
+            for i in range(0, len(page_ids), CHUNK):
+                Page.objects.filter(id__in=page_ids[i:i + CHUNK]).update(
+                    views=F('views') + amount)
+
+    # The counts are committed by now; a failure past this point must not
+    # put them back in the buffer, or they would be written twice.
+    try:
+        click_log.append(counts)
+    except Exception:
+        logger.exception("Could not append to the click log")
+    try:
+        page_ids = list(counts)
+        views = {}
+        for i in range(0, len(page_ids), CHUNK):
+            views.update(Page.objects.filter(id__in=page_ids[i:i + CHUNK])
+                         .values_list('id', 'views'))
+        page_leaderboard.offer(views)
+    except Exception:
+        logger.exception("Could not update the page leaderboard")
+
+
+page_views = WriteBehindCounter(write_page_views)
+atexit.register(page_views.stop)
+
+
+def record_view(page_id):
+    """
+    Counts one click on the given page. Never touches the database.
+    """
+    page_views.add(page_id)
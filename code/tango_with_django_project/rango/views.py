@@ -1,82 +1,68 @@
 from django.shortcuts import render
 from django.shortcuts import redirect
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from rango.models import Category, Page, UserProfile
 from rango.forms import CategoryForm, PageForm, UserProfileForm
-from datetime import datetime
-from rango.webhose_search import run_query
+from rango.federated_search import run_query
+from rango import catalog_export, metrics, trending, view_counter, visitor_stats
+from rango.leaderboard import category_leaderboard, page_leaderboard
+from rango.pagination import category_pages, profile_page
+from rango.page_cache import cache_anonymous_page
+from rango.query_budget import no_query_budget, query_budget
 from registration.backends.simple.views import RegistrationView
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import authenticate, login
 
 # Create your views here.
-def get_server_side_cookie(request, cookie, default_val=None):
-    val = request.session.get(cookie)
-    if not val:
-        val = default_val
-    return val
-
-def visitor_cookie_handler(request):
-    # Get the number of visits to the site.
-    # We use the COOKIES.get() function to obtain the visits cookie.
-    # If the cookie exists, the value returned is casted to an integer.
-    # If the cookie doesn't exist, then the default value of 1 is used.
-    visits = int(get_server_side_cookie(request, 'visits', '1'))
-
-    last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()) )
-
-    last_visit_time = datetime.strptime(last_visit_cookie[:-7], "%Y-%m-%d %H:%M:%S")
-    #last_visit_time = datetime.now()
-    # If it's been more than a day since the last visit...
-    if (datetime.now() - last_visit_time).seconds > 0:
-        visits = visits + 1
-        #update the last visit cookie now that we have updated the count
-        request.session['last_visit'] = str(datetime.now())
-    else:
-        visits = 1
-        # set the last visit cookie 
-        request.session['last_visit'] = last_visit_cookie
-    # update/set the visits cookie
-    request.session['visits'] = visits
-
-
+# With every cache cold: two leaderboards, two trending lists and two
+# visitor counts, plus the session and user of a logged-in visitor.
+@query_budget(8)
+def index(request):
+    # Visitors are counted on every request, including those answered from
+    # the page cache.
+    response = index_page(request)
+    return visitor_stats.record_visit(request, response)
 
 
-def index(request):
+@cache_anonymous_page
+def index_page(request):
     #context_dict = {'boldmessage': "Crunchie, creamy, cookie, candy, cupcake!"}
     
-    request.session.set_test_cookie()
+    # Both lists are precomputed and kept up to date as likes and views
+    # come in, rather than sorting the tables on every hit.
+    category_list = category_leaderboard.top(5)
     
-    category_list = Category.objects.order_by('-likes')[:5]
-    
-    page_list = Page.objects.order_by('-views')[:5]
+    page_list = page_leaderboard.top(5)
     
     context_dict = {'categories': category_list, 'pages': page_list}
     
-    visitor_cookie_handler(request)
-    
-    context_dict['visits'] = request.session['visits']
+    # What is getting clicks and likes right now, from the decayed scores.
+    context_dict['trending_categories'] = trending.top_categories(5)
+    context_dict['trending_pages'] = trending.top_pages(5)
     
-    print(request.session['visits'])
+    # Unique visitors are counted in HyperLogLog sketches rather than in
+    # the session, so a visit doesn't cost a session write.
+    context_dict['visitors_today'] = visitor_stats.unique_visitors(1)
+    context_dict['visitors_this_week'] = visitor_stats.unique_visitors(7)
     
-    response = render(request, 'rango/index.html', context=context_dict)
-    
-    return response
+    return render(request, 'rango/index.html', context=context_dict)
     
 
+@query_budget(4)
+@cache_anonymous_page
 def about(request):
-    if request.session.test_cookie_worked():
-        print("TEST COOKIE WORKED!")
-        request.session.delete_test_cookie()
     # To complete the exercise in chapter 4, we need to remove the following line
     # return HttpResponse("Rango says here is the about page. <a href='/rango/'>View index page</a>")
     
     # and replace it with a pointer to ther about.html template using the render method
     return render(request, 'rango/about.html',{})
     
+# Not page-cached: the search form carries each visitor's CSRF token.
+@query_budget(6)
 def show_category(request, category_name_slug):
     # Create a context dictionary which we can pass
     # to the template rendering engine.
@@ -87,12 +73,13 @@ def show_category(request, category_name_slug):
         # If we can't, the .get() method raises a DoesNotExist exception.
         # So the .get() method returns one model instance or raises an exception.
         category = Category.objects.get(slug=category_name_slug)
-        # Retrieve all of the associated pages.
-        # Note that filter() returns a list of page objects or an empty list
-        pages = Page.objects.filter(category=category)
+        # Retrieve the first slice of the associated pages, most viewed first.
+        # The rest are fetched a slice at a time by the "load more" button.
+        pages, next_cursor = category_pages(category)
         
         # Adds our results list to the template context under name pages.
         context_dict['pages'] = pages
+        context_dict['next_cursor'] = next_cursor
         # We also add the category object from
         # the database to the context dictionary.
         # We'll use this in the template to verify that the category exists.
@@ -114,7 +101,7 @@ def show_category(request, category_name_slug):
     if request.method == 'POST':
         query = request.POST['query'].strip()
         if query:
-            # Run our Webhose function to get the results list!
+            # Run our federated search to get the results list!
             result_list = run_query(query)
             context_dict['query'] = query
     context_dict['result_list'] = result_list
@@ -126,6 +113,7 @@ def show_category(request, category_name_slug):
     
     
     
+@query_budget(15)
 def add_category(request):
     form = CategoryForm()
     # A HTTP POST?
@@ -149,6 +137,7 @@ def add_category(request):
     return render(request, 'rango/add_category.html', {'form': form})
     
     
+@query_budget(12)
 def add_page(request, category_name_slug):
     try:
         category = Category.objects.get(slug=category_name_slug)
@@ -174,16 +163,18 @@ def add_page(request, category_name_slug):
     return render(request, 'rango/add_page.html', context_dict)
     
     
+@query_budget(5)
 def search(request):
     result_list = []
     if request.method == 'POST':
         query = request.POST['query'].strip()
         if query:
-             # Run our Webhose function to get the results list!
+             # Run our federated search to get the results list!
              result_list = run_query(query)
     return render(request, 'rango/search.html', {'result_list': result_list})
     
     
+@query_budget(10)
 def register(request):
     registered = False
     if request.method == 'POST':
@@ -221,6 +212,7 @@ def register(request):
                    'registered': registered
                   })
 
+@query_budget(2)
 def track_url(request):
     page_id = None
     if request.method == 'GET':
@@ -228,15 +220,18 @@ def track_url(request):
             page_id = request.GET['page_id']
     if page_id:
         try:
-            page = Page.objects.get(id=page_id)
-            page.views = page.views + 1
-            page.save()
-            return redirect(page.url)
-        except:
+            url, category_id = Page.objects.values_list('url', 'category_id').get(id=page_id)
+        except (Page.DoesNotExist, ValueError):
             return HttpResponse("Page id {0} not found".format(page_id))
+        # The click is buffered and written out later in a batch,
+        # so the redirect doesn't wait on a database write.
+        view_counter.record_view(int(page_id))
+        trending.record_click(int(page_id), category_id)
+        return redirect(url)
     print("No page_id in get string")
     return redirect(reverse('index'))
 
+@query_budget(6)
 @login_required
 def register_profile(request):
     form = UserProfileForm()
@@ -259,14 +254,20 @@ class RangoRegistrationView(RegistrationView):
     def get_success_url(self, user):
         return reverse('register_profile')
 
+@query_budget(6)
 @login_required
 def profile(request, username):
+    # The user and their profile come back from one query; a profile row is
+    # only created the first time somebody without one is looked at.
     try:
-        user = User.objects.get(username=username)
+        user = User.objects.select_related('userprofile').get(username=username)
     except User.DoesNotExist:
         return redirect('index')
     
-    userprofile = UserProfile.objects.get_or_create(user=user)[0]
+    try:
+        userprofile = user.userprofile
+    except UserProfile.DoesNotExist:
+        userprofile = UserProfile.objects.create(user=user)
     form = UserProfileForm({'website': userprofile.website, 'picture': userprofile.picture})
     
     if request.method == 'POST':
@@ -279,8 +280,28 @@ def profile(request, username):
     
     return render(request, 'rango/profile.html', {'userprofile': userprofile, 'selecteduser': user, 'form': form})
 
+@query_budget(5)
 @login_required
 def list_profiles(request):
-#    user_list = User.objects.all()
-    userprofile_list = UserProfile.objects.all()
-    return render(request, 'rango/list_profiles.html', { 'userprofile_list' : userprofile_list})
\ No newline at end of file
+    userprofile_list, next_cursor = profile_page(request.GET.get('after'))
+    return render(request, 'rango/list_profiles.html',
+                  {'userprofile_list': userprofile_list, 'next_cursor': next_cursor})
+
+@no_query_budget
+@staff_member_required
+def export_catalog(request, fmt):
+    # Streamed a chunk of rows at a time, so a large catalog doesn't have to
+    # fit in the worker's memory. The queries run while the response is
+    # iterated, a number of them that grows with the catalog, so there is
+    # no budget to hold them to.
+    response = StreamingHttpResponse(catalog_export.export_lines(fmt),
+                                     content_type=catalog_export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = 'attachment; filename="rango-catalog.{0}"'.format(fmt)
+    return response
+
+@query_budget(2)
+def export_metrics(request):
+    if not metrics.authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(metrics.writer.collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,14 +1,25 @@
+from collections import OrderedDict
+
 from django.shortcuts import render
 from django.shortcuts import redirect
 from django.core.urlresolvers import reverse
-from django.http import HttpResponse
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from rango.models import Category, Page
 from rango.forms import CategoryForm, PageForm
 from datetime import datetime
-from rango.webhose_search import run_query
+from rango import fts_search, like_counter, page_cache
+from rango.leaderboard import page_leaderboard
+from rango.pagination import category_pages
+from rango.query_budget import query_budget
+from rango.suggest_index import category_index
 
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 
+@query_budget(6)
 @login_required
 def like_category(request):
     cat_id = None
@@ -16,11 +27,12 @@ def like_category(request):
         cat_id = request.GET['category_id']
     likes = 0
     if cat_id:
-        cat = Category.objects.get(id=int(cat_id))
-        if cat:
-            likes = cat.likes + 1
-            cat.likes = likes
-            cat.save()
+        try:
+            # Concurrent likes for the same category are folded into a
+            # single conditional UPDATE; the count comes back from the batch.
+            likes = like_counter.like_category(int(cat_id))
+        except (Category.DoesNotExist, ValueError):
+            likes = 0
     return HttpResponse(likes)
 
 
@@ -29,14 +41,13 @@ def like_category(request):
 def get_category_list(max_results=0, starts_with=''):
     cat_list = []
     if starts_with:
-        cat_list = Category.objects.filter(name__istartswith=starts_with)
-
-        if max_results > 0:
-            if len(cat_list) > max_results:
-                cat_list = cat_list[:max_results]
+        # Answered from the in-memory prefix index, most liked first,
+        # without touching the database.
+        cat_list = category_index.top(starts_with, max_results or None)
     return cat_list
 
 
+@query_budget(2)
 def suggest_category(request):
     cat_list = []
     starts_with = ''
@@ -48,6 +59,7 @@ def suggest_category(request):
     return render(request, 'rango/cats.html', {'cats': cat_list })
 
 
+@query_budget(10)
 @login_required
 def auto_add_page(request):
     cat_id = None
@@ -61,8 +73,114 @@ def auto_add_page(request):
         if cat_id:
             category = Category.objects.get(id=int(cat_id))
             p = Page.objects.get_or_create(category=category, title=title, url=url)
-            pages = Page.objects.filter(category=category).order_by('-views')
+            # Only the first slice is re-rendered; the rest load on demand.
+            pages, next_cursor = category_pages(category)
             # Adds our results list to the template context under name pages.
             context_dict['pages'] = pages
+            context_dict['category'] = category
+            context_dict['next_cursor'] = next_cursor
+
+    return render(request, 'rango/page_list.html', context_dict)
+
+
+# Most search results a single add_pages request may carry.
+MAX_ADD_PAGES = 50
+
+
+def insert_new_pages(category, pairs):
+    """
+    Adds a page to category for each (title, url) pair it doesn't have yet,
+    in one transaction and one bulk INSERT, and returns the new pages.
+
+    bulk_create() doesn't send post_save, so the search index, leaderboard
+    and page cache are updated here the way rango.signals would have.
+    """
+    with transaction.atomic():
+        # Locks the category (on databases that can), so two batches for
+        # the same category can't both decide a page is new.
+        category = Category.objects.select_for_update().get(id=category.id)
+        wanted = OrderedDict((pair, None) for pair in pairs)
+        existing = set(Page.objects.filter(category=category, title__in=set(
+            title for title, url in wanted)).values_list('title', 'url'))
+        new = [pair for pair in wanted if pair not in existing]
+        if not new:
+            return []
+        Page.objects.bulk_create([Page(category=category, title=title, url=url)
+                                  for title, url in new])
+        # bulk_create() doesn't set the ids, so read the rows back.
+        pages = [page for page in Page.objects.filter(
+            category=category, title__in=set(title for title, url in new)).order_by('id')
+            if (page.title, page.url) in new and (page.title, page.url) not in existing]
+
+    fts_search.index_pages(pages)
+    page_leaderboard.invalidate()
+    page_cache.bump_version()
+    return pages
+
+
+def clean_page_pairs(titles, urls):
+    """
+    Returns the (title, url) pairs that would make valid pages, cleaned.
+    """
+    title_field = forms.CharField(max_length=128)
+    url_field = forms.URLField(max_length=200)
+    pairs = []
+    for title, url in zip(titles, urls):
+        try:
+            pairs.append((title_field.clean(title), url_field.clean(url)))
+        except ValidationError:
+            continue
+    return pairs
+
+
+@query_budget(12)
+@login_required
+@require_POST
+def add_pages(request):
+    """
+    Adds several search results to a category in one request. Takes a
+    category_id and repeated title and url fields, and returns only the
+    pages that were added: as <li> items for the category's page list, or
+    as JSON if the request accepts application/json. Results the category
+    already has, or that aren't valid pages, are skipped.
+    """
+    titles = request.POST.getlist('title')
+    urls = request.POST.getlist('url')
+    if len(titles) != len(urls) or len(titles) > MAX_ADD_PAGES:
+        return HttpResponseBadRequest('Expected up to {0} title and url pairs.'.format(
+            MAX_ADD_PAGES))
+    try:
+        category = Category.objects.get(id=int(request.POST.get('category_id', '')))
+    except (Category.DoesNotExist, ValueError):
+        raise Http404('No such category.')
+
+    pages = insert_new_pages(category, clean_page_pairs(titles, urls))
+
+    if 'application/json' in request.META.get('HTTP_ACCEPT', ''):
+        return JsonResponse({
+            'added': [{'id': page.id, 'title': page.title, 'url': page.url,
+                       'views': page.views} for page in pages],
+            'skipped': len(titles) - len(pages)})
+    return render(request, 'rango/page_list_items.html', {'pages': pages, 'category': category})
+
+
+@query_budget(3)
+def more_pages(request):
+    pages = []
+    context_dict = {}
+    if request.method == 'GET':
+        cat_id = request.GET.get('category_id')
+        cursor = request.GET.get('cursor')
+        if cat_id and cursor:
+            try:
+                category = Category.objects.get(id=int(cat_id))
+            except (Category.DoesNotExist, ValueError):
+                category = None
+            if category:
+                pages, next_cursor = category_pages(category, cursor)
+                context_dict['category'] = category
+                context_dict['next_cursor'] = next_cursor
+    context_dict['pages'] = pages
 
-    return render(request, 'rango/page_list.html', context_dict)
\ No newline at end of file
+    # Just the next slice of <li> items (and a new "load more" button).
+    return render(request, 'rango/page_list_items.html', context_dict)
\ No newline at end of file
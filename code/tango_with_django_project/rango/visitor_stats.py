@@ -0,0 +1,264 @@
+"""
+Unique visitor counts from HyperLogLog sketches.
+
+index used to keep a visit count and last-visit time in each browser's
+session, which meant a session write on every hit and only ever told a
+visitor about their own visits. Instead, each browser gets a random
+visitor id cookie, and the id is added to a HyperLogLog sketch for the
+current (UTC) day.
+
+A sketch is 2 ** PRECISION one-byte registers (4 KB), however many visitors
+it has seen, and estimates the number of distinct ids added to it to within
+about 1.6%. Two sketches merge by taking the larger of each pair of
+registers, which counts the union of their visitors, so:
+
+- each process keeps its own sketch per day in memory and writes it out
+  every RANGO_VISITOR_FLUSH_INTERVAL seconds to its own VisitorSketch row
+  (keyed by day and a per-process shard id), so processes never overwrite
+  each other;
+- the count for a day merges that day's rows, and the count for a week
+  merges seven days' worth;
+- manage.py compact_visitors, run daily, compacts the rows of days that
+  are over into one.
+
+Merged counts are cached for RANGO_VISITOR_STATS_TIMEOUT seconds.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+HASH_BITS = 64
+ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+
+COOKIE_NAME = 'rango_visitor'
+COOKIE_MAX_AGE = 2 * 365 * 24 * 60 * 60
+DEFAULT_FLUSH_INTERVAL = 30
+DEFAULT_STATS_TIMEOUT = 60
+# Shard name under which past days' rows are compacted.
+MERGED_SHARD = 'merged'
+
+
+class HyperLogLog(object):
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+        if len(self.registers) != REGISTERS:
+            raise ValueError("Expected {0} registers, got {1}".format(
+                REGISTERS, len(self.registers)))
+
+    def add(self, value):
+        """
+        Adds value (a string) and returns True if the sketch changed.
+        """
+        h = int.from_bytes(hashlib.sha1(value.encode('utf-8')).digest()[:8], 'big')
+        index = h >> (HASH_BITS - PRECISION)
+        rest = h & ((1 << (HASH_BITS - PRECISION)) - 1)
+        rank = HASH_BITS - PRECISION - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        estimate = ALPHA * REGISTERS * REGISTERS / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Few visitors: linear counting of the empty registers is
+            # more accurate.
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+
+def today():
+    return timezone.now().date()
+
+
+class VisitorRecorder(object):
+    """
+    This process's sketches, one per day, written out in the background.
+    """
+
+    def __init__(self):
+        self.shard = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._sketches = {}
+        self._dirty = set()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def interval(self):
+        return getattr(settings, 'RANGO_VISITOR_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    def reset(self):
+        """
+        Drops everything not yet written out.
+        """
+        with self._lock:
+            self._sketches.clear()
+            self._dirty.clear()
+
+    def add(self, visitor_id, day=None):
+        day = day or today()
+        with self._lock:
+            sketch = self._sketches.get(day)
+            if sketch is None:
+                # Only today (and perhaps yesterday, around midnight) is
+                # still being added to.
+                for old in [d for d in self._sketches if d < day - timedelta(days=1)]:
+                    if old not in self._dirty:
+                        del self._sketches[old]
+                sketch = self._sketches[day] = HyperLogLog()
+            if sketch.add(visitor_id):
+                self._dirty.add(day)
+        self._ensure_flusher()
+
+    def flush(self):
+        """
+        Writes this process's changed sketches to the database, if any.
+        """
+        from rango.models import VisitorSketch
+
+        with self._lock:
+            dirty = [(day, self._sketches[day].to_bytes()) for day in self._dirty]
+            self._dirty.clear()
+        if not dirty:
+            return 0
+        try:
+            for day, registers in dirty:
+                VisitorSketch.objects.update_or_create(
+                    day=day, shard=self.shard, defaults={'registers': registers})
+        except Exception:
+            with self._lock:
+                self._dirty.update(day for day, registers in dirty)
+            raise
+        return len(dirty)
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not flush visitor sketches on shutdown")
+
+    def _ensure_flusher(self):
+        if self._thread is not None or not self.interval():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='rango-visitors')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval() or DEFAULT_FLUSH_INTERVAL):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing visitor sketches failed, will retry")
+            finally:
+                connection.close()
+
+
+visitors = VisitorRecorder()
+atexit.register(visitors.stop)
+
+
+def record_visit(request, response):
+    """
+    Counts the request's visitor for today, giving them a visitor id
+    cookie on the response if they don't have one yet.
+    """
+    visitor_id = request.COOKIES.get(COOKIE_NAME)
+    if not visitor_id:
+        visitor_id = uuid.uuid4().hex
+        response.set_cookie(COOKIE_NAME, visitor_id, max_age=COOKIE_MAX_AGE, httponly=True)
+    visitors.add(visitor_id)
+    return response
+
+
+def compact(day):
+    """
+    Merges a finished day's rows into one, so later counts read less.
+    """
+    from rango.models import VisitorSketch
+
+    with transaction.atomic():
+        rows = list(VisitorSketch.objects.select_for_update().filter(day=day))
+        if len(rows) < 2:
+            return
+        merged = HyperLogLog()
+        for row in rows:
+            merged.merge(HyperLogLog(row.registers))
+        VisitorSketch.objects.filter(id__in=[row.id for row in rows]).delete()
+        VisitorSketch.objects.create(day=day, shard=MERGED_SHARD, registers=merged.to_bytes())
+
+
+def compact_before(day):
+    """
+    Compacts the rows of every day before day. Returns how many days it did.
+    """
+    from rango.models import VisitorSketch
+
+    days = (VisitorSketch.objects.filter(day__lt=day).exclude(shard=MERGED_SHARD)
+            .values_list('day', flat=True).distinct())
+    days = list(days)
+    for old in days:
+        compact(old)
+    return len(days)
+
+
+def compact_finished_days():
+    # Nothing adds to days before yesterday any more.
+    return compact_before(today() - timedelta(days=1))
+
+
+def sketch_between(first, last):
+    """
+    Returns the merged sketch of every visitor from day first to day last.
+    """
+    from rango.models import VisitorSketch
+
+    merged = HyperLogLog()
+    for registers in VisitorSketch.objects.filter(day__gte=first, day__lte=last) \
+            .values_list('registers', flat=True).iterator():
+        merged.merge(HyperLogLog(registers))
+    return merged
+
+
+def unique_visitors(days=1):
+    """
+    Estimated distinct visitors over the last days days, today included.
+    """
+    last = today()
+    first = last - timedelta(days=days - 1)
+    key = 'rango:visitors:{0}:{1}'.format(first.isoformat(), last.isoformat())
+    count = cache.get(key)
+    if count is None:
+        count = sketch_between(first, last).count()
+        cache.set(key, count, getattr(settings, 'RANGO_VISITOR_STATS_TIMEOUT',
+                                      DEFAULT_STATS_TIMEOUT))
+    return count
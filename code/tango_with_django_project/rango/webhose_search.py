@@ -1,26 +1,23 @@
-import json
-import urllib
-import urllib.request 
+import urllib.parse
+
+from django.conf import settings
+
+from rango import search_transport
+from rango.search_cache import cached_search
 
 def read_webhose_key():
     """
-    Reads the Webhose API key from a file called 'search.key'.
-    Returns either None (no key found), or a string representing the key.
+    Returns the Webhose API key from the file called 'search.key'.
+    The file is read once, when rango starts up (see rango.search_transport).
     Remember: put search.key in your .gitignore file to avoid committing it!
     """
-    # See Python Anti-Patterns - it's an awesome resource!
-    # Here we are using "with" when opening files.
-    # http://docs.quantifiedcode.com/python-anti-patterns/maintainability/
-    webhose_api_key = None
-    
-    try:
-        with open('search.key', 'r') as f:
-            webhose_api_key = f.readline().strip()
-    except:
+    webhose_api_key = search_transport.get_key('webhose')
+    if not webhose_api_key:
         raise IOError('search.key file not found')
     
     return webhose_api_key
 
+@cached_search('webhose')
 def run_query(search_terms, size=10):
     """
     Given a string containing search terms (query), and a number of results to return (default of 10),
@@ -33,10 +30,10 @@ def run_query(search_terms, size=10):
     
     
     # What's the base URL for the Webhose API?
-    root_url = 'http://webhose.io/search'
+    root_url = getattr(settings, 'WEBHOSE_SEARCH_URL', 'http://webhose.io/search')
     
     # Format the query string - escape special characters.
-    query_string = urllib.quote(search_terms)
+    query_string = urllib.parse.quote(search_terms)
     
     # Use string formatting to construct the complete API URL.
     search_url = '{root_url}?token={key}&format=json&q={query}&sort=relevancy&size={size}'.format(
@@ -48,15 +45,12 @@ def run_query(search_terms, size=10):
     results = []
     
     try:
-        # Connect to the Webhose API, and convert the response to a Python dictionary.
-        print(search_url)
-        response = urllib2.urlopen(search_url).read()
-        print(response)
-        json_response = json.loads(response)
+        # Connect to the Webhose API (over a pooled keep-alive connection),
+        # and convert the response to a Python dictionary.
+        json_response = search_transport.get_json(search_url)
         
         # Loop through the posts, appendng each to the results list as a dictionary.
         for post in json_response['posts']:
-            print(post['title'])
             results.append({'title': post['title'],
                             'link': post['url'],
                             'summary': post['text'][:200]})
@@ -1,11 +1,18 @@
 	$(document).ready(function() {
 		// JQuery code to be added in here.
+		// The calls below go to the JSON API (/rango/api/v1/) and the
+		// markup is built here, rather than fetching rendered HTML.
 		$('#likes').click(function(){
 		var catid;
 		catid = $(this).attr("data-catid");
-		$.get('/rango/like_category/', {category_id: catid}, function(data){
-			$('#like_count').html(data);
-			$('#likes').hide();
+		$.ajax({
+			type: 'POST',
+			url: '/rango/api/v1/categories/' + catid + '/like/',
+			headers: {'X-CSRFToken': csrfToken()},
+			success: function(data){
+				$('#like_count').text(data.likes);
+				$('#likes').hide();
+			}
 		});
 	});
 
@@ -15,20 +22,114 @@
 		$('#suggestion').keyup(function(){
 		var query;
 		query = $(this).val();
-		$.get('/rango/suggest/', {suggestion: query}, function(data){
-			$('#cats').html(data);
+		$.getJSON('/rango/api/v1/categories/suggest/', {q: query}, function(data){
+			var list = $('<ul class="nav nav-pills flex-column"></ul>');
+			$.each(data.categories, function(i, category) {
+				list.append($('<li class="nav-item"></li>').append(
+					$('<a></a>').attr('href', '/rango/category/' + category.slug + '/')
+						.text(category.name)));
+			});
+			$('#cats').empty().append(list);
 		});
 	});
 
+    function csrfToken() {
+        var token = $('input[name=csrfmiddlewaretoken]').val();
+        if (!token) {
+            var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+            token = match ? match[1] : '';
+        }
+        return token;
+    }
+
+    // The same <li> as rango/page_list_items.html renders for a page.
+    function pageItem(page) {
+        return $('<li></li>')
+            .append($('<a></a>').attr('href', '/rango/goto/?page_id=' + page.id).text(page.title))
+            .append(' ')
+            .append($('<span class="tag tag-pill tag-primary"></span>').text(page.views));
+    }
+
+    function moreItem(catid, cursor) {
+        return $('<li class="rango-more-item"></li>').append(
+            $('<button class="rango-more btn btn-link btn-sm" type="button">Load more</button>')
+                .attr('data-catid', catid).attr('data-cursor', cursor));
+    }
+
+    // Clicks on "Add" are queued and sent together, shortly after the
+    // last one, as a single POST; only the new pages come back.
+    var addQueue = [];
+    var addTimer = null;
+
+    function sendQueuedPages() {
+        var batch = addQueue;
+        addQueue = [];
+        addTimer = null;
+        if (!batch.length) {
+            return;
+        }
+        $.ajax({
+            type: 'POST',
+            url: '/rango/api/v1/categories/' + batch[0].catid + '/pages/',
+            traditional: true,
+            headers: {'X-CSRFToken': csrfToken()},
+            data: {
+                title: $.map(batch, function(item) { return item.title; }),
+                url: $.map(batch, function(item) { return item.url; })
+            },
+            success: function(data) {
+                var list = $('#pages ul');
+                if (!list.length) {
+                    list = $('<ul></ul>');
+                    $('#pages').empty().append(list);
+                }
+                var items = $.map(data.added, function(page) { return pageItem(page)[0]; });
+                var more = list.children('.rango-more-item');
+                if (more.length) {
+                    more.before(items);
+                } else {
+                    list.append(items);
+                }
+            },
+            error: function() {
+                $.each(batch, function(i, item) { item.button.show(); });
+            }
+        });
+    }
+
     $('.rango-add').click(function(){
-	    var catid = $(this).attr("data-catid");
-        var url = $(this).attr("data-url");
-        var title = $(this).attr("data-title");
-        var me = $(this)
-	    $.get('/rango/add/', {category_id: catid, url: url, title: title}, function(data){
-	                   $('#pages').html(data);
-	                   me.hide();
-	               });
-	    });
+        addQueue.push({
+            catid: $(this).attr("data-catid"),
+            url: $(this).attr("data-url"),
+            title: $(this).attr("data-title"),
+            button: $(this)
+        });
+        $(this).hide();
+        clearTimeout(addTimer);
+        addTimer = setTimeout(sendQueuedPages, 500);
+    });
+
+    // Fetch the next slice of a category's pages in place of the button,
+    // leaving out any page that was added (and shown) since.
+    $(document).on('click', '.rango-more', function(){
+        var catid = $(this).attr("data-catid");
+        var cursor = $(this).attr("data-cursor");
+        var item = $(this).closest('li');
+        $.getJSON('/rango/api/v1/categories/' + catid + '/pages/', {cursor: cursor}, function(data){
+            var shown = {};
+            $('#pages a').each(function() { shown[$(this).attr('href')] = true; });
+            var items = [];
+            $.each(data.pages, function(i, page) {
+                var li = pageItem(page);
+                if (!shown[li.find('a').attr('href')]) {
+                    items.push(li[0]);
+                }
+            });
+            if (data.next) {
+                items.push(moreItem(catid, data.next)[0]);
+            }
+            item.replaceWith(items);
+        });
+    });
 
 	});
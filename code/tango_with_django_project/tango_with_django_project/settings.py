@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    'rango.metrics.MetricsMiddleware',
+    'rango.db_router.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,13 +55,15 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'rango.throttle.ThrottleMiddleware',
 ]
 
 ROOT_URLCONF = 'tango_with_django_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, plus render timing for rango.metrics.
+        'BACKEND': 'rango.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATE_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,6 +91,32 @@ DATABASES = {
     }
 }
 
+# Read replicas (see rango.db_router). To try them locally, set
+# RANGO_SQLITE_REPLICAS=2 in the environment for two SQLite copies of the
+# database, and keep them up to date with manage.py sync_replicas.
+for i in range(1, int(os.environ.get('RANGO_SQLITE_REPLICAS', '0')) + 1):
+    DATABASES['replica{0}'.format(i)] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db-replica{0}.sqlite3'.format(i)),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['rango.db_router.PrimaryReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+
+# The page, sidebar and search caches, the version numbers that retire them
+# and the throttling buckets have to be shared by every worker process, so
+# the default cache is Memcached rather than each process's own memory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get('RANGO_MEMCACHED_LOCATION', '127.0.0.1:11211'),
+    }
+}
+
 # Password hashing functions
 # https://docs.djangoproject.com/en/1.9/topics/auth/passwords/#how-django-stores-passwords
 PASSWORD_HASHERS = [
@@ -143,4 +173,154 @@ LOGIN_REDIRECT_URL = '/rango/'
 LOGIN_URL = '/accounts/login/'
 
 MEDIA_ROOT = MEDIA_DIR
-MEDIA_URL = '/media/'
\ No newline at end of file
+MEDIA_URL = '/media/'
+
+# Clicks on /rango/goto/ are buffered in memory and written to the
+# database in batches every RANGO_VIEW_FLUSH_INTERVAL seconds.
+# Set it to 0 to disable the background flusher (counts are then only
+# written by rango.view_counter.page_views.flush() and at shutdown).
+RANGO_VIEW_FLUSH_INTERVAL = 5
+
+# Likes for the same category arriving within this many seconds of each
+# other are written with a single UPDATE.
+RANGO_LIKE_COALESCE_WINDOW = 0.05
+
+# Search results from the external APIs are cached (in the Django cache
+# named by RANGO_SEARCH_CACHE_ALIAS) for RANGO_SEARCH_CACHE_TIMEOUT seconds.
+# Each process evicts its least recently used entries beyond
+# RANGO_SEARCH_CACHE_MAX_ENTRIES.
+RANGO_SEARCH_CACHE_ALIAS = 'default'
+RANGO_SEARCH_CACHE_TIMEOUT = 300
+RANGO_SEARCH_CACHE_MAX_ENTRIES = 1000
+
+# Searches are sent to every backend in RANGO_SEARCH_BACKENDS concurrently;
+# results that haven't arrived after RANGO_SEARCH_DEADLINE seconds are dropped.
+RANGO_SEARCH_BACKENDS = [
+    'rango.fts_search',
+    'rango.webhose_search',
+    'rango.bing_search',
+]
+RANGO_SEARCH_DEADLINE = 2.0
+RANGO_SEARCH_WORKERS = 8
+
+WEBHOSE_SEARCH_URL = 'http://webhose.io/search'
+BING_SEARCH_URL = 'https://api.datamarket.azure.com/Bing/Search/'
+
+# The search API keys are read from these files once, at startup.
+RANGO_SEARCH_KEY_FILES = {
+    'webhose': 'search.key',
+    'bing': 'bing.key',
+}
+
+# Search API requests share a pool of keep-alive connections per host.
+RANGO_SEARCH_POOL_SIZE = 4
+RANGO_SEARCH_CONNECT_TIMEOUT = 2.0
+RANGO_SEARCH_READ_TIMEOUT = 5.0
+
+# Category suggestions are answered from an in-memory prefix index,
+# reloaded from the database every RANGO_SUGGEST_INDEX_TTL seconds.
+RANGO_SUGGEST_INDEX_TTL = 300
+RANGO_SUGGEST_MEMO_DEPTH = 20
+
+# Rendered sidebar fragments are kept for at most this many seconds
+# (they are invalidated as soon as a category changes anyway).
+RANGO_SIDEBAR_CACHE_TIMEOUT = 24 * 60 * 60
+
+# The index page's "most liked" and "most viewed" lists are kept
+# precomputed (RANGO_LEADERBOARD_SIZE rows each) and rebuilt from the
+# database every RANGO_LEADERBOARD_RECONCILE_INTERVAL seconds.
+RANGO_LEADERBOARD_SIZE = 10
+RANGO_LEADERBOARD_RECONCILE_INTERVAL = 60
+
+# How many pages a category shows at first, and per "load more".
+RANGO_CATEGORY_PAGE_SIZE = 20
+
+# Catalog exports (manage.py dump_catalog, /rango/export/) read this many
+# rows per query.
+RANGO_EXPORT_CHUNK_SIZE = 2000
+
+# How many user profiles /rango/profiles/ lists per page.
+RANGO_PROFILES_PAGE_SIZE = 20
+
+# Square thumbnails made of every profile picture (64x64 for the profile
+# list, 300x300 for the profile page), on a pool of this many threads.
+# 0 workers makes them synchronously.
+RANGO_THUMBNAIL_SIZES = (64, 300)
+RANGO_THUMBNAIL_WORKERS = 2
+
+# Unique visitors are counted per day in HyperLogLog sketches. Each process
+# writes its sketches to the database every RANGO_VISITOR_FLUSH_INTERVAL
+# seconds (0 disables the background flush), and the daily and weekly
+# counts on the index page are cached for RANGO_VISITOR_STATS_TIMEOUT seconds.
+# Run manage.py compact_visitors daily to merge each finished day's rows.
+RANGO_VISITOR_FLUSH_INTERVAL = 30
+RANGO_VISITOR_STATS_TIMEOUT = 60
+
+# Per-view request metrics (rango.metrics), served in the Prometheus text
+# format at /rango/metrics/ to staff users or to requests carrying
+# "Authorization: Bearer <RANGO_METRICS_TOKEN>". With several worker
+# processes, set RANGO_METRICS_DIR to a directory they share; each writes
+# its totals there every RANGO_METRICS_FLUSH_INTERVAL seconds.
+RANGO_METRICS_TOKEN = os.environ.get('RANGO_METRICS_TOKEN')
+RANGO_METRICS_DIR = None
+RANGO_METRICS_FLUSH_INTERVAL = 15
+
+# Views declare how many queries (and RANGO_QUERY_BUDGET_SECONDS of query
+# time, unless they say otherwise) they may use per request; see
+# rango.query_budget. In development (and in test_settings) a view over
+# budget raises with the offending queries, elsewhere it is logged and
+# counted.
+RANGO_QUERY_BUDGET_STRICT = DEBUG
+RANGO_QUERY_BUDGET_SECONDS = 1.0
+
+# Anonymous GETs of the index, about and category pages are served from a
+# full-page cache, retired whenever a category or page is saved or deleted
+# and otherwise kept for at most RANGO_PAGE_CACHE_TIMEOUT seconds (which is
+# how stale like and view counts can get). 0 turns the cache off.
+RANGO_PAGE_CACHE_TIMEOUT = 60
+
+# Reads of rango's models go to one of these database aliases; writes go to
+# 'default'. Reads stay on 'default' for RANGO_REPLICA_PIN_SECONDS after a
+# user writes, and replicas are health-checked at most every
+# RANGO_REPLICA_HEALTH_INTERVAL seconds.
+RANGO_DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+RANGO_REPLICA_PIN_SECONDS = 5
+RANGO_REPLICA_HEALTH_INTERVAL = 10
+
+# Flushed page views are also appended to segment files in
+# RANGO_CLICK_LOG_DIR (None turns the log off). A segment is sealed after
+# RANGO_CLICK_LOG_SEGMENT_SECONDS or RANGO_CLICK_LOG_SEGMENT_BYTES, and
+# manage.py compact_clicks rolls sealed ones into hourly and daily
+# PageViewBucket rows. Hourly buckets are kept for
+# RANGO_CLICK_HOURLY_RETENTION_DAYS, daily ones for
+# RANGO_CLICK_DAILY_RETENTION_DAYS (None keeps them).
+RANGO_CLICK_LOG_DIR = os.path.join(BASE_DIR, 'click_log')
+RANGO_CLICK_LOG_SEGMENT_SECONDS = 300
+RANGO_CLICK_LOG_SEGMENT_BYTES = 1 << 20
+RANGO_CLICK_HOURLY_RETENTION_DAYS = 14
+RANGO_CLICK_DAILY_RETENTION_DAYS = None
+
+# Trending pages and categories (see rango.trending): a click or like
+# counts half as much after RANGO_TRENDING_HALF_LIFE seconds, and rows
+# decayed below RANGO_TRENDING_MIN_HEAT events are left off the list.
+# Scores are buffered like view counts and written every
+# RANGO_TRENDING_FLUSH_INTERVAL seconds (0: only by trending.flush()).
+RANGO_TRENDING_HALF_LIFE = 3600
+RANGO_TRENDING_MIN_HEAT = 0.5
+RANGO_TRENDING_FLUSH_INTERVAL = 5
+
+# How long browsers and proxies may reuse the JSON API's suggestions and
+# page lists (rango.api), in seconds.
+RANGO_API_SUGGEST_MAX_AGE = 60
+RANGO_API_PAGES_MAX_AGE = 30
+
+# Per-client token buckets for the views that call the paid search APIs or
+# run on every keystroke (see rango.throttle): URL name (optionally
+# 'name:METHOD') -> (burst of requests, seconds to earn them all back).
+RANGO_THROTTLE_RATES = {
+    'search:POST': (10, 60),
+    'show_category:POST': (10, 60),
+    'suggest_category': (30, 10),
+    'api_suggest_categories': (30, 10),
+}
+RANGO_THROTTLE_CACHE_ALIAS = 'default'
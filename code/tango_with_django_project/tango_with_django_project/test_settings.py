@@ -0,0 +1,32 @@
+"""
+Settings for the test suite.
+
+manage.py test uses them unless DJANGO_SETTINGS_MODULE says otherwise;
+point other test runners at tango_with_django_project.test_settings.
+"""
+from tango_with_django_project.settings import *  # noqa: F401,F403
+
+# The tests run in one process, so its own memory is as shared as the
+# cache needs to be.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# A view over its query budget fails the test that requested it.
+RANGO_QUERY_BUDGET_STRICT = True
+
+# The tests check the template and context of each response, and a page
+# from the cache has neither; PageCacheTests turns it back on.
+RANGO_PAGE_CACHE_TIMEOUT = 0
+
+# Clicks from the tests don't belong in the click log.
+RANGO_CLICK_LOG_DIR = None
+
+# Trending scores are only written when a test calls trending.flush().
+RANGO_TRENDING_FLUSH_INTERVAL = 0
+
+# Every request comes from the same address; ThrottleTests sets its own
+# rates.
+RANGO_THROTTLE_RATES = {}